@@ -0,0 +1,82 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from .PS6000a import PS6000a
+
+class AsyncPS6000a:
+    '''
+    asyncio front end of PS6000a. All driver calls run in one dedicated executor thread, so
+    the event loop stays free for sockets and other instruments while the scope is waiting
+    for triggers. Use as
+
+        async with await AsyncPS6000a.open() as scope:
+            await scope.activate_channels(...)
+            async for waveform_mV, times in scope.events(sample_interval_ns, number_segments = 100):
+                ...
+    '''
+
+    def __init__(self, scope, executor):
+
+        self.scope = scope
+        self.executor = executor
+
+    @classmethod
+    async def open(cls, **kwargs):
+
+        # the device is opened in the executor thread, like every later driver call
+        executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'ps6000a')
+        scope = await asyncio.get_running_loop().run_in_executor(executor, functools.partial(PS6000a, **kwargs))
+        return cls(scope, executor)
+
+    async def close(self):
+
+        await self._run(self.scope.close)
+        self.executor.shutdown(wait = False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def set_resolution(self, resolution):
+
+        return await self._run(self.scope.set_resolution, resolution)
+
+    async def activate_channels(self, channels_on, channel_ranges, channel_couplings, analogue_offsets = None):
+
+        return await self._run(self.scope.activate_channels, channels_on, channel_ranges, channel_couplings, analogue_offsets)
+
+    async def set_coincidence_trigger(self, channels, thresholds_mV, directions, autoTriggerMicroSeconds = 0):
+
+        return await self._run(self.scope.set_coincidence_trigger, channels, thresholds_mV, directions, autoTriggerMicroSeconds)
+
+    async def set_simple_trigger(self, threshold_mV, direction, channel = "A", autoTriggerMicroSeconds = 0):
+
+        return await self._run(self.scope.set_simple_trigger, threshold_mV, direction, channel, autoTriggerMicroSeconds)
+
+    async def acquire(self, sample_interval_ns, mode = 'runBlock', **kwargs):
+
+        try:
+            return await self._run(self.scope.acquire, sample_interval_ns, mode, **kwargs)
+        except asyncio.CancelledError:
+            # unblock the executor thread waiting for the capture
+            self.scope.cancel()
+            raise
+
+    async def events(self, sample_interval_ns, n_captures = None, **kwargs):
+        '''
+        Async iterator over successive rapidBlock captures with the options of PS6000a.acquire
+        (number_segments, acq_window_ns, ...), runs until n_captures have been delivered
+        (forever if None) or the consumer stops iterating
+        '''
+
+        i_capture = 0
+        while n_captures is None or i_capture < n_captures:
+            yield await self.acquire(sample_interval_ns, mode = 'rapidBlock', **kwargs)
+            i_capture += 1
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from .PS6000a import PS6000a
+from .utils import enumerate_units
+from .event_building import build_events
+from .capture import CaptureBlock
+
+class MultiPS6000a:
+    '''
+    Several PS6000a units side by side, opened by serial number (all connected units by
+    default). Every unit has its own handle and executor thread and the driver calls release
+    the GIL, so the arm, wait and readout cycles of the units run concurrently. The settings
+    are applied to all units, scopes[serial] gives access to a single one. Use as
+
+        with MultiPS6000a(['JO123/0001', 'JO123/0002']) as scopes:
+            scopes.activate_channels(...)
+            scopes.set_simple_trigger(...)
+            results, events = scopes.acquire_events(sample_interval_ns, number_segments = 1000, tolerance_ns = 10)
+    '''
+
+    def __init__(self, serials = None):
+
+        if serials is None:
+            serials = enumerate_units({})
+        if len(serials) == 0:
+            raise ValueError('No 6000 A series unit found')
+
+        # one thread per unit, all driver calls of a unit are made from its thread
+        self.executors = {serial: ThreadPoolExecutor(max_workers = 1, thread_name_prefix = f'ps6000a-{serial}') for serial in serials}
+        self.scopes = {}
+        futures = {serial: executor.submit(PS6000a, serial) for serial, executor in self.executors.items()}
+        try:
+            for serial, future in futures.items():
+                self.scopes[serial] = future.result()
+        except Exception:
+            # close the units that could be opened before giving up
+            for opened_serial, future in futures.items():
+                if future.exception() is None:
+                    self.scopes[opened_serial] = future.result()
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+
+        self.run('close')
+        for executor in self.executors.values():
+            executor.shutdown(wait = False)
+        self.scopes = {}
+
+    def run(self, method, *args, **kwargs):
+        '''
+        Method to call a PS6000a method with the same arguments on all units concurrently,
+        returns the results by serial number. If a unit fails the captures still running on
+        the others are cancelled and the first error is raised.
+        '''
+
+        futures = {
+            serial: self.executors[serial].submit(getattr(scope, method), *args, **kwargs)
+            for serial, scope in self.scopes.items()
+        }
+
+        results = {}
+        error = None
+        for serial, future in futures.items():
+            try:
+                results[serial] = future.result()
+            except Exception as exc:
+                if error is None:
+                    error = exc
+                    for scope in self.scopes.values():
+                        scope.cancel()
+        if error is not None:
+            raise error
+
+        return results
+
+    def set_resolution(self, resolution):
+
+        return self.run('set_resolution', resolution)
+
+    def activate_channels(self, channels_on, channel_ranges, channel_couplings, analogue_offsets = None):
+
+        return self.run('activate_channels', channels_on, channel_ranges, channel_couplings, analogue_offsets)
+
+    def set_coincidence_trigger(self, channels, thresholds_mV, directions, autoTriggerMicroSeconds = 0):
+
+        return self.run('set_coincidence_trigger', channels, thresholds_mV, directions, autoTriggerMicroSeconds)
+
+    def set_simple_trigger(self, threshold_mV, direction, channel = "A", autoTriggerMicroSeconds = 0):
+
+        return self.run('set_simple_trigger', threshold_mV, direction, channel, autoTriggerMicroSeconds)
+
+    def acquire(self, sample_interval_ns, mode = 'runBlock', **kwargs):
+
+        return self.run('acquire', sample_interval_ns, mode, **kwargs)
+
+    def acquire_events(self, sample_interval_ns, number_segments, tolerance_ns, reference = None, **kwargs):
+        '''
+        Method to take a rapidBlock capture on all units at once and merge their segments into
+        events by trigger time (see event_building.build_events). Returns the (data, times)
+        results (CaptureBlocks with as_block = True) of every unit by serial number and the
+        BuiltEvents, whose alignments give the clock offset and drift of every unit to the
+        reference one (the first by default) and the number of segments without a partner
+        in the reference unit.
+        '''
+
+        results = self.acquire(sample_interval_ns, mode = 'rapidBlock', number_segments = number_segments, **kwargs)
+        t0s = {serial: result.t0s if isinstance(result, CaptureBlock) else result[1].t0s for serial, result in results.items()}
+        events = build_events(t0s, tolerance_ns, reference)
+
+        return results, events
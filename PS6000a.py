@@ -1,5 +1,7 @@
 import ctypes
-from picosdk.ps6000a import ps6000a as ps
+import functools
+import numpy as np
+from picosdk.ps6000a import ps6000a
 from picosdk.PicoDeviceEnums import picoEnum as enums
 from picosdk.functions import assert_pico_ok
 
@@ -8,79 +10,384 @@ from .utils import (
     compose_trigger_DNF,
     trigger_condition_on_channel,
     read_channel_streaming,
+    stream_channels,
     read_channel_runblock,
-    read_channel_rapidblock
+    read_channel_rapidblock,
+    read_channel_rapidblock_pipelined,
+    read_channel_rapidblock_events,
+    set_signal_generator,
+    BlockWaiter,
+    BufferPool,
+    solve_timebase,
+    nearest_timebase,
+    get_max_adc,
+    conversion_factors,
+    new_device_state,
+    invalidate_device_state
 )
+from .writer import RawWriter
+from .features import event_features
+from .software_trigger import SoftwareTrigger, trigger_stream
+from .instrumentation import instrument, driver_stats
+from .accounting import RunAccounting
+
+ps = instrument(ps6000a)
 
 class PS6000a:
 
-    def __init__(self):
+    def __init__(self, serial = None):
 
         # Create handle and status ready for use
         self.handle = ctypes.c_int16()
         self.status = {}
 
-        # Open 6000 A series PicoScope
+        # completion of block captures, keeps the poll and wait counters
+        self.block_waiter = BlockWaiter()
+
+        # data buffers kept registered with the driver between acquisitions
+        self.buffer_pool = BufferPool()
+
+        # shadow copy of the device configuration, only changed settings are sent
+        self.device_state = new_device_state()
+
+        # counts and latencies of the driver calls and acquisition phases, shared by all units
+        self.driver_stats = driver_stats
+
+        # live and dead time and trigger rates of the rapidBlock captures
+        self.accounting = RunAccounting()
+
+        # Open 6000 A series PicoScope, the first one found unless a serial number is given
         # returns handle to handle for use in API functions
+        self.serial = serial
         self.resolution = enums.PICO_DEVICE_RESOLUTION['PICO_DR_10BIT']
-        self.status['openunit'] = ps.ps6000aOpenUnit(ctypes.byref(self.handle), None, self.resolution)
+        self.open()
+
+    def open(self):
+
+        serial = None if self.serial is None else self.serial.encode()
+        self.status['openunit'] = ps.ps6000aOpenUnit(ctypes.byref(self.handle), serial, self.resolution)
         assert_pico_ok(self.status['openunit'])
 
     def __del__(self):
         self.status['stop'] = ps.ps6000aStop(self.handle)
-        
-    def activate_channels(self, channels_on, channel_ranges, channel_couplings):
+
+    def close(self):
+        self.status['stop'] = ps.ps6000aStop(self.handle)
+        self.status['closeunit'] = ps.ps6000aCloseUnit(self.handle)
+        assert_pico_ok(self.status['closeunit'])
+
+    def reopen(self):
+
+        # a freshly opened device starts from its default configuration
+        self.close()
+        self.buffer_pool.invalidate()
+        invalidate_device_state(self.device_state, keep_adc_limits = False)
+        self.open()
+
+        self._restore_settings()
+
+    def set_resolution(self, resolution):
+
+        if isinstance(resolution, str):
+            resolution = enums.PICO_DEVICE_RESOLUTION[resolution]
+        if resolution == self.resolution:
+            return
+
+        self.status['setResolution'] = ps.ps6000aSetDeviceResolution(self.handle, resolution)
+        assert_pico_ok(self.status['setResolution'])
+        self.resolution = resolution
+
+        # the trigger thresholds in ADC counts and the memory layout depend on the resolution
+        self.buffer_pool.invalidate()
+        invalidate_device_state(self.device_state)
+        self._restore_settings()
+
+    def _restore_settings(self):
+
+        # send the AWG, channel and trigger settings again after the device state was invalidated
+        if hasattr(self, 'awg_settings'):
+            self.set_awg(self.awg_settings[0], **self.awg_settings[1])
+
+        if not hasattr(self, 'readout_channels'):
+            return
+
+        channels_on = list(self.readout_channels.keys())
+        self.activate_channels(channels_on,
+                               [self.channel_ranges[ch] for ch in channels_on],
+                               [self.channel_couplings[ch] for ch in channels_on],
+                               [self.channel_offsets[ch] for ch in channels_on])
+
+        if hasattr(self, 'trigger_settings'):
+            self.set_coincidence_trigger(*self.trigger_settings)
+
+    def activate_channels(self, channels_on, channel_ranges, channel_couplings, analogue_offsets = None):
+
+        if analogue_offsets is None:
+            analogue_offsets = [0.] * len(channels_on)
 
         self.readout_channels = turnon_readout_channel_DC(
             self.status,
             self.handle,
             channels_on,
             channel_ranges,
-            channel_couplings
+            channel_couplings,
+            analogue_offsets = analogue_offsets,
+            device_state = self.device_state
         )
 
         # keep track of the channel settings
         self.channel_ranges = {channel_name: channel_range for channel_name, channel_range in zip(channels_on, channel_ranges)}
         self.channel_couplings = {channel_name: channel_coupling for channel_name, channel_coupling in zip(channels_on, channel_couplings)}
+        self.channel_offsets = {channel_name: analogue_offset for channel_name, analogue_offset in zip(channels_on, analogue_offsets)}
 
         return self.readout_channels
         
     def set_coincidence_trigger(self, channels, thresholds_mV, directions, autoTriggerMicroSeconds = 0):
-        
+
+        # nothing to send if the same trigger is already set
+        trigger = (tuple(channels), tuple(thresholds_mV), tuple(directions),
+                   tuple(self.channel_ranges[channel] for channel in channels),
+                   tuple(self.channel_offsets[channel] for channel in channels), autoTriggerMicroSeconds, self.resolution)
+        if self.device_state['trigger'] == trigger:
+            return
+        self.device_state['trigger'] = None
+
         trigs = []
         for channel, threshold_mV, direction in zip(channels, thresholds_mV, directions):
             cur_trig = trigger_condition_on_channel(self.status, self.handle, self.resolution, 
                                                     channel = f'PICO_CHANNEL_{channel}',
                                                     channel_range = self.channel_ranges[channel],
                                                     trigger_thrs_mV = threshold_mV,
-                                                    threshold_direction = direction
+                                                    threshold_direction = direction,
+                                                    device_state = self.device_state,
+                                                    analogue_offset = self.channel_offsets[channel]
             )
             trigs.append(cur_trig)
 
         # build a simple AND
         compose_trigger_DNF(self.status, self.handle, conjunction_0 = trigs, autoTriggerMicroSeconds = autoTriggerMicroSeconds)
+        self.device_state['trigger'] = trigger
+        self.trigger_settings = (channels, thresholds_mV, directions, autoTriggerMicroSeconds)
 
     def set_simple_trigger(self, threshold_mV, direction, channel = "A", autoTriggerMicroSeconds = 0):
 
         self.set_coincidence_trigger(channels = [channel], thresholds_mV = [threshold_mV], directions = [direction],
                                      autoTriggerMicroSeconds = autoTriggerMicroSeconds)
 
+    def set_awg(self, waveform = 'PICO_SINE', **kwargs):
+
+        # waveform is a PICO_WAVE_TYPE name or one period of an arbitrary waveform, e.g. from
+        # the waveforms module; an unchanged waveform is not uploaded again and only the
+        # settings that changed are sent, see utils.set_signal_generator for the options
+        applied = set_signal_generator(self.status, self.handle, waveform, device_state = self.device_state, **kwargs)
+        self.awg_settings = (waveform, kwargs)
+
+        return applied
+
+    def set_awg_sweep(self, start_frequency_hz, stop_frequency_hz, frequency_increment_hz, dwell_time_s, waveform = 'PICO_SINE', **kwargs):
+
+        # frequency sweep of the AWG, sweep_type 'PICO_UP' (default), 'PICO_DOWN', 'PICO_UPDOWN' or 'PICO_DOWNUP'
+        return self.set_awg(waveform, frequency_hz = start_frequency_hz, stop_frequency_hz = stop_frequency_hz,
+                            frequency_increment_hz = frequency_increment_hz, dwell_time_s = dwell_time_s, **kwargs)
+
+    def solve_timebase(self, sample_interval_ns, n_samples = 0, **kwargs):
+
+        # timebase, actual sample interval and max samples per segment with the enabled channels
+        return solve_timebase(
+            self.status,
+            self.handle,
+            self.resolution,
+            sources = self.readout_channels,
+            sample_interval_ns = sample_interval_ns,
+            n_samples = n_samples,
+            device_state = self.device_state,
+            **kwargs
+        )
+
+    def conversion_factors(self):
+
+        # mV per ADC count and analogue offsets in mV of the active channels, mV = counts * scale - offset
+        max_ADC = get_max_adc(self.status, self.handle, self.resolution, device_state = self.device_state)
+        return conversion_factors(self.readout_channels, self.channel_ranges, max_ADC, self.channel_offsets)
+
+    def open_writer(self, path, sample_interval_ns, **kwargs):
+
+        # writer of raw block acquisitions of the active channels, with their conversion to mV and ns
+        _, sample_interval_ns = nearest_timebase(self.status, self.handle, self.resolution, self.readout_channels,
+                                                 sample_interval_ns, device_state = self.device_state)
+        max_ADC = get_max_adc(self.status, self.handle, self.resolution, device_state = self.device_state)
+        scale_factors, offsets_mV = conversion_factors(self.readout_channels, self.channel_ranges, max_ADC, self.channel_offsets)
+        metadata = dict(kwargs.pop('metadata', {}))
+        metadata.update(resolution = self.resolution, max_adc = max_ADC.value,
+                        channel_ranges = self.channel_ranges, channel_couplings = self.channel_couplings)
+
+        return RawWriter(path, list(self.readout_channels.keys()), scale_factors, sample_interval_ns,
+                         offsets_mV = offsets_mV, metadata = metadata, **kwargs)
+
+    def stream(self, sample_interval_ns, **kwargs):
+
+        # generator of StreamChunks, runs until it is closed or max_samples are collected
+        self.buffer_pool.invalidate()
+        return stream_channels(
+            self.status,
+            self.handle,
+            sources = self.readout_channels,
+            sample_interval_ns = sample_interval_ns,
+            **kwargs
+        )
+
+    def cancel(self):
+
+        # abort a block capture that is being waited for, e.g. from another thread
+        self.block_waiter.cancel()
+
+    def acquire_pipelined(self, sample_interval_ns, number_segments, **kwargs):
+
+        # generator of back-to-back rapidBlock captures, processed on worker threads while the next one is taken
+        return read_channel_rapidblock_pipelined(
+            self.status,
+            self.handle,
+            self.resolution,
+            sources = self.readout_channels,
+            source_ranges = self.channel_ranges,
+            sample_interval_ns = sample_interval_ns,
+            number_segments = number_segments,
+            waiter = self.block_waiter,
+            buffer_pool = self.buffer_pool,
+            device_state = self.device_state,
+            source_offsets = self.channel_offsets,
+            accounting = self.accounting,
+            **kwargs
+        )
+
+    def acquire_events(self, n_events, sample_interval_ns, **kwargs):
+
+        # generator of rapidBlock captures until n_events segments are collected, each with as
+        # many segments as fit into the device memory for acq_window_ns, see
+        # utils.read_channel_rapidblock_events for batch_timeout_s, max_empty_batches,
+        # max_segments and max_buffer_bytes
+        return read_channel_rapidblock_events(
+            self.status,
+            self.handle,
+            self.resolution,
+            sources = self.readout_channels,
+            source_ranges = self.channel_ranges,
+            sample_interval_ns = sample_interval_ns,
+            n_events = n_events,
+            waiter = self.block_waiter,
+            buffer_pool = self.buffer_pool,
+            device_state = self.device_state,
+            source_offsets = self.channel_offsets,
+            accounting = self.accounting,
+            **kwargs
+        )
+
+    def acquire_features(self, sample_interval_ns, number_segments, feature_options = None, **kwargs):
+
+        # pipelined rapidBlock captures reduced to one record of pulse features per segment,
+        # see features.extract_features for the feature_options (polarity, cfd_fraction, ...)
+        max_ADC = get_max_adc(self.status, self.handle, self.resolution, device_state = self.device_state)
+        scale_factors, offsets_mV = conversion_factors(self.readout_channels, self.channel_ranges, max_ADC, self.channel_offsets)
+        process = functools.partial(event_features, scale_factor_mV = scale_factors, offset_mV = offsets_mV, **(feature_options or {}))
+
+        return self.acquire_pipelined(sample_interval_ns, number_segments, process = process, **kwargs)
+
+    def acquire_to_pool(self, pool, sample_interval_ns, number_segments, **kwargs):
+
+        # raw rapidBlock capture written by the driver straight into a shared memory slot of an
+        # AnalysisPool, returns the Future of the analysis or None if no slot was free (the
+        # capture is then not taken and counted as dropped by the pool)
+        # the slot takes the raw ADC counts, the options that would change that cannot be given
+        fixed = sorted(key for key in ('mode', 'raw', 'buffer', 'as_block') if key in kwargs)
+        if fixed:
+            raise ValueError(f'acquire_to_pool takes raw rapidBlock captures into the pool slots, {fixed} cannot be given')
+
+        slot = pool.reserve()
+        if slot is None:
+            return None
+
+        try:
+            _, times = self.acquire(sample_interval_ns, mode = 'rapidBlock', number_segments = number_segments,
+                                    raw = True, buffer = slot.array, **kwargs)
+        except Exception:
+            pool.ring.release(slot.index)
+            raise
+
+        max_ADC = get_max_adc(self.status, self.handle, self.resolution, device_state = self.device_state)
+        scale_factors, offsets_mV = conversion_factors(self.readout_channels, self.channel_ranges, max_ADC, self.channel_offsets)
+        metadata = {
+            'channels': list(self.readout_channels),
+            't0s': times.t0s,
+            'sample_interval_ns': times.dt,
+            'scale_factors_mV': scale_factors,
+            'offsets_mV': offsets_mV
+        }
+
+        return pool.submit(slot, metadata)
+
+    def stream_triggered(self, sample_interval_ns, channels, thresholds_mV, directions, n_pretrigger_samples, n_posttrigger_samples, **kwargs):
+
+        # streaming with a software trigger, only the windows around the triggers are kept,
+        # see software_trigger.SoftwareTrigger for the trigger options and the stream keywords
+        max_ADC = get_max_adc(self.status, self.handle, self.resolution, device_state = self.device_state)
+        scale_factors, offsets_mV = conversion_factors(self.readout_channels, self.channel_ranges, max_ADC, self.channel_offsets)
+        if offsets_mV is None:
+            offsets_mV = np.zeros(len(scale_factors))
+
+        # thresholds and hysteresis (default: 2% of the threshold) in ADC counts of the trigger channels
+        source_names = list(self.readout_channels)
+        trigger_channels = [source_names.index(channel) for channel in channels]
+        thresholds = [
+            int(round((threshold_mV + offsets_mV[i_source]) / scale_factors[i_source]))
+            for threshold_mV, i_source in zip(thresholds_mV, trigger_channels)
+        ]
+        hysteresis_mV = kwargs.pop('hysteresis_mV', [0.02 * abs(threshold_mV) for threshold_mV in thresholds_mV])
+        hysteresis = [
+            max(1, int(round(cur_hysteresis_mV / scale_factors[i_source])))
+            for cur_hysteresis_mV, i_source in zip(hysteresis_mV, trigger_channels)
+        ]
+
+        trigger_options = {key: kwargs.pop(key) for key in ('coincidence_samples', 'n_coincidence', 'holdoff_samples') if key in kwargs}
+        trigger = SoftwareTrigger(
+            trigger_channels,
+            thresholds,
+            directions,
+            n_pretrigger_samples,
+            n_posttrigger_samples,
+            hysteresis = hysteresis,
+            sample_interval_ns = sample_interval_ns,
+            **trigger_options
+        )
+
+        return trigger_stream(self.stream(sample_interval_ns, **kwargs), trigger)
+
     def acquire(self, sample_interval_ns, mode = 'runBlock', **kwargs):
-        
+
+        # with raw = True the returned ADC counts live in the buffer pool and are overwritten
+        # by the next acquisition with the same settings, unless a buffer is passed in.
+        # Block modes can reduce the data in the scope with downsample_ratio_mode ('AGGREGATE',
+        # 'DECIMATE' or 'AVERAGE') and downsample_ratio, aggregated min values are returned
+        # under '<channel>_min'. With with_raw = True the raw samples are read in the same
+        # transfer and sig, time, sig_raw, time_raw are returned. With as_block = True every
+        # mode returns a CaptureBlock of the ADC counts instead.
         if mode == 'runStreaming':
-            sig, time = read_channel_streaming(
+            self.buffer_pool.invalidate()
+            result = read_channel_streaming(
                 self.status,
                 self.handle,
                 self.resolution,
                 self.readout_channels,
+                self.channel_ranges,
                 n_pretrigger_samples=kwargs["n_pretrigger_samples"],
                 n_posttrigger_samples=kwargs["n_posttrigger_samples"],
                 sample_interval=2,
                 time_units='NS',
-                range_V = '10MV'
+                as_block = kwargs.get("as_block", False),
+                device_state = self.device_state,
+                source_offsets = self.channel_offsets
             )
         elif mode == 'runBlock':
-            sig, time = read_channel_runblock(
+            result = read_channel_runblock(
                 self.status, 
                 self.handle,
                 self.resolution,
@@ -88,10 +395,23 @@ class PS6000a:
                 source_ranges = self.channel_ranges,
                 sample_interval_ns = sample_interval_ns,
                 n_pretrigger_samples=kwargs["n_pretrigger_samples"],
-                n_posttrigger_samples=kwargs["n_posttrigger_samples"]
+                n_posttrigger_samples=kwargs["n_posttrigger_samples"],
+                raw = kwargs.get("raw", False),
+                as_block = kwargs.get("as_block", False),
+                downsample_ratio_mode = kwargs.get("downsample_ratio_mode"),
+                downsample_ratio = kwargs.get("downsample_ratio"),
+                with_raw = kwargs.get("with_raw", False),
+                waiter = self.block_waiter,
+                buffer_pool = self.buffer_pool,
+                device_state = self.device_state,
+                max_interval_deviation = kwargs.get("max_interval_deviation"),
+                timeout_s = kwargs.get("timeout_s"),
+                source_offsets = self.channel_offsets,
+                dtype = kwargs.get("dtype", np.float64),
+                out = kwargs.get("out")
             )
         elif mode == 'rapidBlock':
-            sig, time = read_channel_rapidblock(
+            result = read_channel_rapidblock(
                 self.status,
                 self.handle,
                 self.resolution,
@@ -99,9 +419,24 @@ class PS6000a:
                 source_ranges = self.channel_ranges,
                 sample_interval_ns = sample_interval_ns,
                 number_segments = kwargs.get("number_segments", 1),
-                acq_window_ns = kwargs.get("acq_window_ns")
+                acq_window_ns = kwargs.get("acq_window_ns") or 100,
+                buffer = kwargs.get("buffer"),
+                accounting = self.accounting,
+                raw = kwargs.get("raw", False),
+                as_block = kwargs.get("as_block", False),
+                downsample_ratio_mode = kwargs.get("downsample_ratio_mode"),
+                downsample_ratio = kwargs.get("downsample_ratio"),
+                with_raw = kwargs.get("with_raw", False),
+                waiter = self.block_waiter,
+                buffer_pool = self.buffer_pool,
+                device_state = self.device_state,
+                max_interval_deviation = kwargs.get("max_interval_deviation"),
+                timeout_s = kwargs.get("timeout_s"),
+                source_offsets = self.channel_offsets,
+                dtype = kwargs.get("dtype", np.float64),
+                out = kwargs.get("out")
             )
         else:
             raise NotImplementedError(f'Mode {mode} unknown!')
 
-        return sig, time
+        return result
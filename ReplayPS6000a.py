@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+
+'''Replay of captures saved with RawWriter through the acquisition interface of PS6000a,
+without a Picoscope or the picosdk driver
+'''
+
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+import numpy as np
+
+from .conversion import adc2mV_block
+from .timing import TimeAxis, SegmentedTimeAxis
+from .reader import RawReader
+from .writer import RawWriter
+from .features import event_features
+from .instrumentation import driver_stats
+from .accounting import RunAccounting
+from .capture import CaptureBlock
+
+def _convert_rapidblock(buffer, times, overflow, sources, scale_factors, offsets_mV, dtype = np.float64):
+
+    buffer_mV = adc2mV_block(buffer, scale_factors, offsets_mV, dtype=dtype)
+
+    return {source_name: buffer_mV[channel_ind] for channel_ind, source_name in enumerate(sources)}, times
+
+class ReplayPS6000a:
+    '''
+    Stand-in for PS6000a serving the segments of a recording (see RawReader) with acquire()
+    in the same shapes as a live scope, e.g. to load-test the analysis and storage or to
+    profile without hardware. Every acquisition takes the next segments of the recording,
+    one for runBlock and runStreaming and number_segments for rapidBlock, cut to the
+    requested pre- and posttrigger samples around the recorded trigger.
+
+    The segments are served at speed times real time (None: as fast as possible) on a clock
+    started with the first acquisition, so an acquisition waits until its last segment is
+    due. The trigger times come from the recorded trigger time offsets, the gaps between the
+    written blocks, which are not recorded, are taken as 1 / trigger_rate_hz (default: the
+    mean rate within the blocks). A consumer slower than the recording does not lose
+    segments, it falls behind the clock by lag_s. With loop = True the recording is served
+    again from the start once it is exhausted, otherwise acquire() raises EOFError.
+
+    The pretrigger samples of the recording are n_pretrigger_samples, by default the ones
+    in the metadata or half the samples (the symmetric rapidBlock window) if none are given.
+    Only the raw samples are served, the channel ranges and offsets are the recorded ones.
+    '''
+
+    def __init__(self, path, speed = 1., **kwargs):
+
+        self.reader = RawReader(path, file_format = kwargs.get('file_format', None))
+        self.speed = speed
+        self.loop = kwargs.get('loop', False)
+
+        self.channels = list(self.reader.channels)
+        self.sample_interval_ns = self.reader.sample_interval_ns
+        self.n_records = len(self.reader)
+        self.n_record_samples = self.reader.adc.shape[2]
+        if self.n_records == 0:
+            raise ValueError(f'{path} holds no segments')
+
+        n_pretrigger_samples = kwargs.get('n_pretrigger_samples', None)
+        if n_pretrigger_samples is None:
+            n_pretrigger_samples = self.reader.metadata.get('n_pretrigger_samples', None)
+        if n_pretrigger_samples is None:
+            n_pretrigger_samples = self.n_record_samples // 2
+        self.n_record_pretrigger_samples = n_pretrigger_samples
+
+        # trigger times in ns of the segments on the recording timeline, the offsets restart
+        # at 0 with every written block
+        gaps_ns = np.diff(np.asarray(self.reader.t0s, dtype=np.float64))
+        within_block = gaps_ns > 0
+        trigger_rate_hz = kwargs.get('trigger_rate_hz', None)
+        if trigger_rate_hz is None and np.any(within_block):
+            trigger_rate_hz = 1e9 / gaps_ns[within_block].mean()
+        if trigger_rate_hz is None and speed is not None:
+            raise ValueError(f'{path} has no trigger time offsets to pace the replay, give trigger_rate_hz')
+        self.block_gap_ns = 1e9 / trigger_rate_hz if trigger_rate_hz else 0.
+        gaps_ns[~within_block] = self.block_gap_ns
+        self.trigger_times_ns = np.concatenate(([0.], np.cumsum(gaps_ns)))
+        self.record_duration_ns = self.trigger_times_ns[-1] + self.block_gap_ns  # before the recording starts over
+
+        self.cancelled = threading.Event()
+        self.clock_start = None
+        self.next_segment = 0
+
+        # keep track of the served data and of how far the consumer is behind the clock
+        self.n_acquisitions = 0
+        self.n_segments = 0
+        self.lag_s = 0.
+        self.max_lag_s = 0.
+        self.accounting = RunAccounting()
+
+        self.activate_channels(self.channels, [None] * len(self.channels), [None] * len(self.channels))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+
+        self.cancel()
+        self.reader.close()
+
+    def cancel(self):
+
+        # abort an acquisition that is waiting for its segments, e.g. from another thread
+        self.cancelled.set()
+
+    def rewind(self):
+
+        # serve the recording again from its first segment, on a new clock
+        self.next_segment = 0
+        self.clock_start = None
+        self.cancelled.clear()
+
+    def set_resolution(self, resolution):
+
+        # the samples are the recorded ones
+        self.resolution = resolution
+
+    def activate_channels(self, channels_on, channel_ranges, channel_couplings, analogue_offsets = None):
+
+        missing = [channel_name for channel_name in channels_on if channel_name not in self.channels]
+        if missing:
+            raise ValueError(f'Channels {missing} not in the recording, it has {self.channels}')
+
+        # the ranges, couplings and offsets are kept for compatibility, the recorded ones are used
+        self.readout_channels = {channel_name: self.channels.index(channel_name) for channel_name in channels_on}
+        self.channel_ranges = dict(zip(channels_on, channel_ranges))
+        self.channel_couplings = dict(zip(channels_on, channel_couplings))
+        self.channel_offsets = dict(zip(channels_on, analogue_offsets or [0.] * len(channels_on)))
+
+        channel_indices = list(self.readout_channels.values())
+        self.scale_factors_mV = self.reader.scale_factors_mV[channel_indices]
+        self.offsets_mV = self.reader.offsets_mV[channel_indices]
+
+        return self.readout_channels
+
+    def set_coincidence_trigger(self, channels, thresholds_mV, directions, autoTriggerMicroSeconds = 0):
+
+        # the segments were triggered when they were recorded
+        self.trigger_settings = (channels, thresholds_mV, directions, autoTriggerMicroSeconds)
+
+    def set_simple_trigger(self, threshold_mV, direction, channel = "A", autoTriggerMicroSeconds = 0):
+
+        self.set_coincidence_trigger(channels = [channel], thresholds_mV = [threshold_mV], directions = [direction],
+                                     autoTriggerMicroSeconds = autoTriggerMicroSeconds)
+
+    def conversion_factors(self):
+
+        # recorded mV per ADC count and analogue offsets in mV of the active channels
+        return self.scale_factors_mV, self.offsets_mV
+
+    def open_writer(self, path, sample_interval_ns, **kwargs):
+
+        # writer of the replayed raw blocks, e.g. to load-test the storage
+        metadata = dict(self.reader.metadata.get('user', {}))
+        metadata.update(kwargs.pop('metadata', {}))
+
+        return RawWriter(path, list(self.readout_channels.keys()), self.scale_factors_mV, self.sample_interval_ns,
+                         offsets_mV = self.offsets_mV, metadata = metadata, **kwargs)
+
+    def _window(self, n_pretrigger_samples, n_posttrigger_samples):
+
+        start = self.n_record_pretrigger_samples - n_pretrigger_samples
+        stop = self.n_record_pretrigger_samples + n_posttrigger_samples
+        if start < 0 or stop > self.n_record_samples:
+            raise ValueError(f'{n_pretrigger_samples} + {n_posttrigger_samples} samples around the trigger are not recorded, '
+                             f'the recording has {self.n_record_pretrigger_samples} + '
+                             f'{self.n_record_samples - self.n_record_pretrigger_samples}')
+
+        return slice(start, stop)
+
+    def _take_segments(self, number_segments):
+        '''
+        Method to get the indices of the next number_segments segments, counted on from the
+        start of the recording when it is looped
+        '''
+
+        first = self.next_segment
+        if not self.loop and first + number_segments > self.n_records:
+            raise EOFError(f'Replay of {self.reader.path} reached the end of the recording after {self.n_segments} segments')
+        self.next_segment += number_segments
+
+        return first
+
+    def _trigger_time_ns(self, segment):
+
+        # also for an array of segments
+        n_loops, i_record = np.divmod(segment, self.n_records)
+        return n_loops * self.record_duration_ns + self.trigger_times_ns[i_record]
+
+    def _wait_for(self, first, last):
+        '''
+        Method to wait until the segment last is due on the replay clock, which starts with
+        the segment first of the first acquisition
+        '''
+
+        if not self.speed:
+            return
+
+        now = time.monotonic()
+        if self.clock_start is None:
+            self.clock_start = now - self._trigger_time_ns(first) * 1e-9 / self.speed
+
+        due = self.clock_start + self._trigger_time_ns(last) * 1e-9 / self.speed
+        if self.cancelled.wait(max(0., due - now)):
+            raise CancelledError('Replay cancelled')
+        self.lag_s = max(0., now - due)
+        self.max_lag_s = max(self.max_lag_s, self.lag_s)
+
+    def _read(self, first, number_segments, window, out):
+        '''
+        Method to copy the window of the active channels of number_segments segments from
+        first on into out of shape (channels, segments, samples)
+        '''
+
+        channel_indices = list(self.readout_channels.values())
+        i_out = 0
+        while i_out < number_segments:
+            # contiguous runs of records, split where a looped recording starts over
+            i_record = (first + i_out) % self.n_records
+            n_run = min(number_segments - i_out, self.n_records - i_record)
+            records = np.asarray(self.reader.adc[i_record:i_record + n_run, :, window])
+            if channel_indices != list(range(len(self.channels))):
+                records = records[:, channel_indices]
+            np.copyto(out[:, i_out:i_out + n_run], records.swapaxes(0, 1))
+            i_out += n_run
+
+    def _acquire_block(self, number_segments, n_pretrigger_samples, n_posttrigger_samples, buffer = None):
+        '''
+        Method to serve the next number_segments segments as (channels, segments, samples)
+        ADC counts with their trigger time offsets relative to the first one
+        '''
+
+        window = self._window(n_pretrigger_samples, n_posttrigger_samples)
+        n_samples = window.stop - window.start
+        first = self._take_segments(number_segments)
+        armed_at = time.perf_counter()
+        try:
+            with driver_stats.phase('wait'):
+                self._wait_for(first, first + number_segments - 1)
+        except CancelledError:
+            self.next_segment = first
+            raise
+
+        shape = (len(self.readout_channels), number_segments, n_samples)
+        if buffer is None:
+            buffer = np.empty(shape, dtype=np.int16)
+        elif buffer.shape != shape:
+            raise ValueError(f'Buffer has shape {buffer.shape}, expected {shape}')
+        ready_at = time.perf_counter()
+        with driver_stats.phase('transfer'):
+            self._read(first, number_segments, window, buffer)
+
+        trigger_times_ns = self._trigger_time_ns(np.arange(first, first + number_segments))
+        times = SegmentedTimeAxis(trigger_times_ns - trigger_times_ns[0], self.sample_interval_ns, n_samples)
+        self.accounting.update(times, armed_at, ready_at)
+        self.n_acquisitions += 1
+        self.n_segments += number_segments
+
+        return buffer, times
+
+    def _check_interval(self, sample_interval_ns, **kwargs):
+
+        max_interval_deviation = kwargs.get('max_interval_deviation', None)
+        if max_interval_deviation is not None and sample_interval_ns >= 0 \
+                and abs(self.sample_interval_ns - sample_interval_ns) > max_interval_deviation * sample_interval_ns:
+            raise ValueError(f'Sample interval of {sample_interval_ns} ns not available, the recording has {self.sample_interval_ns} ns')
+        if kwargs.get('downsample_ratio_mode') or kwargs.get('with_raw', False):
+            raise NotImplementedError('Replay only serves the raw samples')
+
+    def _rapidblock_window(self, acq_window_ns):
+
+        # same symmetric window as setup_rapidblock
+        n_pretrigger_samples = int((acq_window_ns or 100) / self.sample_interval_ns / 2)
+        return n_pretrigger_samples, n_pretrigger_samples
+
+    def acquire(self, sample_interval_ns, mode = 'runBlock', **kwargs):
+
+        # same arguments and results as PS6000a.acquire, except that the downsampling modes
+        # are not available and raw ADC counts are a new array unless a buffer is passed in
+        self._check_interval(sample_interval_ns, **kwargs)
+        if mode in ('runBlock', 'runStreaming'):
+            n_pretrigger_samples = kwargs["n_pretrigger_samples"]
+            buffer, times = self._acquire_block(1, n_pretrigger_samples, kwargs["n_posttrigger_samples"])
+        elif mode == 'rapidBlock':
+            n_pretrigger_samples, n_posttrigger_samples = self._rapidblock_window(kwargs.get("acq_window_ns"))
+            buffer, times = self._acquire_block(kwargs.get("number_segments", 1), n_pretrigger_samples, n_posttrigger_samples,
+                                                buffer = kwargs.get("buffer"))
+        else:
+            raise NotImplementedError(f'Mode {mode} unknown!')
+
+        if kwargs.get("as_block", False):
+            # the recording keeps no overflow flags
+            return CaptureBlock(buffer, list(self.readout_channels), self.scale_factors_mV, times.dt, offsets_mV = self.offsets_mV,
+                                n_pretrigger_samples = n_pretrigger_samples, t0s = times.t0s)
+
+        if mode != 'rapidBlock':
+            buffer, times = buffer[:, 0], TimeAxis(0, times.dt, times.n)
+
+        if kwargs.get("raw", False):
+            return buffer, times
+
+        with driver_stats.phase('convert'):
+            buffer_mV = adc2mV_block(buffer, self.scale_factors_mV, self.offsets_mV, out = kwargs.get("out"),
+                                     dtype = kwargs.get("dtype", np.float64))
+
+        return {source_name: buffer_mV[channel_ind] for channel_ind, source_name in enumerate(self.readout_channels)}, times
+
+    def acquire_pipelined(self, sample_interval_ns, number_segments, **kwargs):
+        '''
+        Generator of rapidBlock captures processed by process(buffer, times, overflow) on
+        n_workers threads while the next one is served, like PS6000a.acquire_pipelined. Stops
+        after n_captures or, if the recording is not looped, at its end.
+        '''
+
+        self._check_interval(sample_interval_ns, **kwargs)
+        n_captures = kwargs.get('n_captures', None)
+        n_buffer_sets = kwargs.get('n_buffer_sets', 2)
+        process = kwargs.get('process', None)
+        if process is None:
+            process = functools.partial(_convert_rapidblock, sources=list(self.readout_channels), scale_factors=self.scale_factors_mV,
+                                        offsets_mV=self.offsets_mV, dtype=kwargs.get('dtype', np.float64))
+        n_pretrigger_samples, n_posttrigger_samples = self._rapidblock_window(kwargs.get('acq_window_ns'))
+        buffer_sets = np.empty((n_buffer_sets, len(self.readout_channels), number_segments, n_pretrigger_samples + n_posttrigger_samples),
+                               dtype=np.int16)
+        overflow = np.zeros(number_segments, dtype=np.int16)  # the recording keeps no overflow flags
+
+        pending = deque()
+        executor = ThreadPoolExecutor(max_workers=kwargs.get('n_workers', 1), thread_name_prefix='replay')
+        i_capture = 0
+        try:
+            while n_captures is None or i_capture < n_captures:
+                # the buffer set used n_buffer_sets captures ago must be released before it is reused
+                if len(pending) == n_buffer_sets:
+                    yield pending.popleft().result()
+                cur_set = buffer_sets[i_capture % n_buffer_sets]
+                try:
+                    _, times = self._acquire_block(number_segments, n_pretrigger_samples, n_posttrigger_samples, buffer = cur_set)
+                except EOFError:
+                    break
+                pending.append(executor.submit(process, cur_set, times, overflow))
+                i_capture += 1
+
+                while pending and pending[0].done():
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True)
+
+    def acquire_events(self, n_events, sample_interval_ns, **kwargs):
+
+        # rapidBlock captures until n_events segments are served, like PS6000a.acquire_events
+        # with as many segments per capture as fit into max_buffer_bytes (at most max_segments)
+        n_pretrigger_samples, n_posttrigger_samples = self._rapidblock_window(kwargs.get("acq_window_ns"))
+        segment_bytes = len(self.readout_channels) * (n_pretrigger_samples + n_posttrigger_samples) * np.dtype(np.int16).itemsize
+        batch_segments = min(n_events, max(1, kwargs.get("max_buffer_bytes", 2**28) // segment_bytes))
+        if kwargs.get("max_segments") is not None:
+            batch_segments = min(batch_segments, kwargs["max_segments"])
+
+        n_collected = 0
+        while n_collected < n_events:
+            number_segments = min(batch_segments, n_events - n_collected)
+            yield self.acquire(sample_interval_ns, mode = 'rapidBlock', number_segments = number_segments,
+                               acq_window_ns = kwargs.get("acq_window_ns"), raw = kwargs.get("raw", False),
+                               as_block = kwargs.get("as_block", False), dtype = kwargs.get("dtype", np.float64), max_interval_deviation = kwargs.get("max_interval_deviation"))
+            n_collected += number_segments
+
+    def acquire_features(self, sample_interval_ns, number_segments, feature_options = None, **kwargs):
+
+        # see PS6000a.acquire_features
+        process = functools.partial(event_features, scale_factor_mV = self.scale_factors_mV, offset_mV = self.offsets_mV,
+                                    **(feature_options or {}))
+
+        return self.acquire_pipelined(sample_interval_ns, number_segments, process = process, **kwargs)
+
+    def acquire_to_pool(self, pool, sample_interval_ns, number_segments, **kwargs):
+
+        # see PS6000a.acquire_to_pool, the segments are copied straight into the shared memory slot
+        # the slot takes the raw ADC counts, the options that would change that cannot be given
+        fixed = sorted(key for key in ('mode', 'raw', 'buffer', 'as_block') if key in kwargs)
+        if fixed:
+            raise ValueError(f'acquire_to_pool takes raw rapidBlock captures into the pool slots, {fixed} cannot be given')
+
+        slot = pool.reserve()
+        if slot is None:
+            return None
+
+        try:
+            _, times = self.acquire(sample_interval_ns, mode = 'rapidBlock', number_segments = number_segments,
+                                    raw = True, buffer = slot.array, **kwargs)
+        except Exception:
+            pool.ring.release(slot.index)
+            raise
+
+        metadata = {
+            'channels': list(self.readout_channels),
+            't0s': times.t0s,
+            'sample_interval_ns': times.dt,
+            'scale_factors_mV': self.scale_factors_mV,
+            'offsets_mV': self.offsets_mV
+        }
+
+        return pool.submit(slot, metadata)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+'''Live time, dead time and trigger rate accounting of segmented captures from their trigger
+timestamps
+'''
+
+import time
+from collections import namedtuple
+import numpy as np
+
+# bin edges in ns of the inter-trigger interval histogram, 10 bins per decade from 1 ns to 100 s
+DEFAULT_INTERVAL_BINS_NS = np.geomspace(1., 1e11, 111)
+
+BatchAccounting = namedtuple('BatchAccounting', [
+    'n_segments',  # segments of the capture
+    'n_missed',  # triggers the scope reported as missed while rearming
+    'trigger_rate_hz',  # segments over the span of their trigger timestamps
+    'true_rate_hz',  # the same without the capture windows and rearms, the rate at the input
+    'live_s',  # armed and waiting for a trigger
+    'capture_dead_s',  # capture windows and rearms of the segments
+    'readout_dead_s',  # capture complete until transferred
+    'processing_dead_s'  # transferred until the next capture was armed, known with the next capture
+])
+
+class RunAccounting:
+    '''
+    Accounting of the live and dead time and of the trigger rate of a run of segmented
+    (rapidBlock) captures. Every capture is added with update(times, armed_at, ready_at,
+    transferred_at), the time axes with the decoded trigger information and the
+    time.perf_counter() values when it was armed, complete and transferred; the
+    read_channel_rapidblock* methods do it for the accounting passed to them.
+
+    The wall time of the run is split into live time (armed and waiting for a trigger) and
+    dead time: the capture window plus rearm_time_ns of every segment, the readout (capture
+    complete until transferred) and the processing (transferred until the next capture is
+    armed, conversion and the consumer included). The trigger rate of a capture comes from
+    its trigger timestamps, true_rate_hz also takes out the capture windows and rearms
+    between the triggers. The inter-trigger intervals within the captures are histogrammed
+    in interval_bins_ns. Every update takes a few NumPy operations on the segments.
+    '''
+
+    def __init__(self, rearm_time_ns = 0., interval_bins_ns = DEFAULT_INTERVAL_BINS_NS):
+
+        self.rearm_time_ns = rearm_time_ns
+        self.interval_bins_ns = np.asarray(interval_bins_ns, dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+
+        self.n_batches = 0
+        self.n_segments = 0
+        self.n_missed = 0
+        self.n_intervals = 0
+        self.interval_sum_ns = 0.
+        self.live_span_ns = 0.  # interval sum without the capture windows and rearms
+        self.interval_counts = np.zeros(len(self.interval_bins_ns) - 1, dtype=np.int64)
+
+        self.live_s = 0.
+        self.capture_dead_s = 0.
+        self.readout_dead_s = 0.
+        self.processing_dead_s = 0.
+        self.started_at = None
+        self.transferred_at = None
+        self.last = None
+
+    def update(self, times, armed_at, ready_at, transferred_at = None):
+        '''
+        Method to add a capture given by its SegmentedTimeAxis, returns its BatchAccounting
+        '''
+
+        if transferred_at is None:
+            transferred_at = time.perf_counter()
+
+        # the processing of the previous capture lasts until this one was armed
+        processing_dead_s = 0.
+        if self.transferred_at is not None:
+            processing_dead_s = max(0., armed_at - self.transferred_at)
+            self.processing_dead_s += processing_dead_s
+            if self.last is not None:
+                self.last = self.last._replace(processing_dead_s = processing_dead_s)
+        if self.started_at is None:
+            self.started_at = armed_at
+        self.transferred_at = transferred_at
+
+        t0s = np.asarray(times.t0s, dtype=np.float64)
+        n_segments = len(t0s)
+        segment_dead_ns = times.n * times.dt + self.rearm_time_ns
+
+        # intervals across a reset of the timestamp counter are only lower bounds
+        intervals_ns = np.diff(t0s)
+        trigger_info = getattr(times, 'trigger_info', None)
+        n_missed = 0
+        if trigger_info is not None:
+            intervals_ns = intervals_ns[~trigger_info.timestamp_reset[1:n_segments]]
+            n_missed = int(np.sum(trigger_info.missed_triggers[:n_segments]))
+        span_ns = float(intervals_ns.sum())
+        trigger_rate_hz = 1e9 * len(intervals_ns) / span_ns if span_ns > 0 else 0.
+        live_span_ns = span_ns - len(intervals_ns) * segment_dead_ns
+        true_rate_hz = 1e9 * len(intervals_ns) / live_span_ns if live_span_ns > 0 else 0.
+
+        self.interval_counts += np.histogram(intervals_ns, self.interval_bins_ns)[0]
+        self.n_intervals += len(intervals_ns)
+        self.interval_sum_ns += span_ns
+        self.live_span_ns += live_span_ns
+
+        # wall time of the capture, the segments fill it with their windows and rearms
+        capture_s = max(0., ready_at - armed_at)
+        capture_dead_s = min(capture_s, n_segments * segment_dead_ns * 1e-9)
+        live_s = capture_s - capture_dead_s
+        readout_dead_s = max(0., transferred_at - ready_at)
+
+        self.n_batches += 1
+        self.n_segments += n_segments
+        self.n_missed += n_missed
+        self.live_s += live_s
+        self.capture_dead_s += capture_dead_s
+        self.readout_dead_s += readout_dead_s
+        self.last = BatchAccounting(n_segments, n_missed, trigger_rate_hz, true_rate_hz, live_s, capture_dead_s, readout_dead_s, 0.)
+
+        return self.last
+
+    @property
+    def dead_s(self):
+        return self.capture_dead_s + self.readout_dead_s + self.processing_dead_s
+
+    @property
+    def elapsed_s(self):
+        return self.live_s + self.dead_s
+
+    def interval_quantiles(self, quantiles = (0.01, 0.5, 0.99)):
+        '''
+        Method to get quantiles in ns of the inter-trigger intervals from the histogram, with
+        the resolution of its bins
+        '''
+
+        if self.n_intervals == 0:
+            return np.full(len(quantiles), np.nan)
+
+        cumulative = np.concatenate(([0.], np.cumsum(self.interval_counts) / max(1, self.interval_counts.sum())))
+        return np.interp(quantiles, cumulative, self.interval_bins_ns)
+
+    def summary(self):
+        '''
+        Method to get the totals of the run as a dict of plain types, the rates are the ones
+        of BatchAccounting over the intervals of all captures
+        '''
+
+        elapsed_s = self.elapsed_s
+        mean_interval_ns = self.interval_sum_ns / self.n_intervals if self.n_intervals else 0.
+        p01, p50, p99 = self.interval_quantiles()
+
+        return {
+            'n_batches': self.n_batches,
+            'n_segments': self.n_segments,
+            'n_missed': self.n_missed,
+            'elapsed_s': elapsed_s,
+            'live_s': self.live_s,
+            'dead_s': self.dead_s,
+            'capture_dead_s': self.capture_dead_s,
+            'readout_dead_s': self.readout_dead_s,
+            'processing_dead_s': self.processing_dead_s,
+            'live_fraction': self.live_s / elapsed_s if elapsed_s > 0 else 0.,
+            'average_rate_hz': self.n_segments / elapsed_s if elapsed_s > 0 else 0.,
+            'trigger_rate_hz': 1e9 / mean_interval_ns if mean_interval_ns > 0 else 0.,
+            'true_rate_hz': 1e9 * self.n_intervals / self.live_span_ns if self.live_span_ns > 0 else 0.,
+            'interval_p01_ns': float(p01),
+            'interval_median_ns': float(p50),
+            'interval_p99_ns': float(p99),
+            'interval_bins_ns': self.interval_bins_ns.tolist(),
+            'interval_counts': self.interval_counts.tolist()
+        }
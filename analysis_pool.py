@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+
+'''Hand-off of raw blocks to a pool of analysis processes through a shared memory ring
+'''
+
+import queue
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+Slot = namedtuple('Slot', ['index', 'array'])
+
+class SharedRing:
+    '''
+    Ring of n_slots arrays of slot_shape in one multiprocessing.shared_memory block. The
+    owner hands out free slots with reserve() and gets them back with release(), the other
+    processes attach to the block by its name and only exchange slot indices.
+    '''
+
+    def __init__(self, n_slots, slot_shape, dtype = np.int16, name = None):
+
+        self.n_slots = n_slots
+        self.slot_shape = tuple(slot_shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+
+        n_bytes = n_slots * int(np.prod(self.slot_shape)) * self.dtype.itemsize
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(n_bytes, 1))
+        else:
+            self.shm = _attach_shared_memory(name)
+        self.name = self.shm.name
+        self.slots = np.ndarray((n_slots,) + self.slot_shape, dtype=self.dtype, buffer=self.shm.buf)
+
+        self.free = queue.Queue()
+        if self.owner:
+            for i_slot in range(n_slots):
+                self.free.put(i_slot)
+
+    def reserve(self, timeout = None):
+        '''
+        Method to get a free Slot, waits up to timeout seconds (forever if None) and returns
+        None if none got free
+        '''
+
+        try:
+            i_slot = self.free.get(timeout=timeout) if timeout != 0 else self.free.get_nowait()
+        except queue.Empty:
+            return None
+
+        return Slot(i_slot, self.slots[i_slot])
+
+    def release(self, i_slot):
+
+        self.free.put(i_slot)
+
+    def close(self):
+
+        # the arrays must not be used any more, they point into the shared block
+        self.slots = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def _attach_shared_memory(name):
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # before Python 3.13 attaching registers the block with the resource tracker again,
+        # the workers share the tracker of the process owning the ring so it is left to unlink it
+        return shared_memory.SharedMemory(name=name)
+
+# ring and analysis callback of a worker process, set by the pool initializer
+_worker_ring = None
+_worker_callback = None
+
+def _init_worker(name, n_slots, slot_shape, dtype, callback):
+
+    global _worker_ring, _worker_callback
+    _worker_ring = SharedRing(n_slots, slot_shape, dtype, name=name)
+    _worker_callback = callback
+
+def _run_callback(i_slot, metadata):
+
+    # the callback sees the slot in place, it is handed back to the producer afterwards
+    return _worker_callback(_worker_ring.slots[i_slot], metadata)
+
+class AnalysisPool:
+    '''
+    Pool of worker processes running callback(block, metadata) on raw blocks written into a
+    SharedRing, so the analysis is not limited by the GIL of the acquisition process. Only the
+    slot index and the metadata (e.g. the trigger time offsets) are sent to the workers, the
+    block is a view into the shared memory that is valid until the callback returns, and the
+    callback returns what should be sent back (e.g. features, not waveforms). callback must be
+    a module level function so that it can be sent to the workers.
+
+    The ring is the backpressure: when all n_slots are in use put() and reserve() wait for a
+    free slot (policy 'block') or drop the block (policy 'drop'), n_dropped counts them. Use as
+
+        with AnalysisPool(analyse, (n_channels, n_segments, n_samples), n_slots = 16) as pool:
+            for buffer, times in ...:
+                pool.put(buffer, {'t0s': times.t0s, 'dt': times.dt})
+        results = pool.results()
+
+    or write straight into the shared memory with reserve(), then submit() the slot.
+    '''
+
+    def __init__(self, callback, slot_shape, **kwargs):
+
+        self.ring = SharedRing(kwargs.get('n_slots', 8), slot_shape, kwargs.get('dtype', np.int16))
+        self.policy = kwargs.get('policy', 'block')
+        if self.policy not in ('block', 'drop'):
+            raise ValueError(f'Backpressure policy {self.policy} unknown, use block or drop')
+        self.timeout_s = kwargs.get('timeout_s', None)  # longest wait for a slot with policy 'block'
+        self.keep_results = kwargs.get('keep_results', True)
+
+        self.executor = ProcessPoolExecutor(
+            max_workers = kwargs.get('n_workers', None),
+            mp_context = kwargs.get('mp_context', None),
+            initializer = _init_worker,
+            initargs = (self.ring.name, self.ring.n_slots, self.ring.slot_shape, self.ring.dtype, callback)
+        )
+
+        # results in submission order, the futures are kept until they are collected
+        self.futures = []
+        self.lock = threading.Lock()
+
+        # keep track of the blocks
+        self.n_submitted = 0
+        self.n_dropped = 0
+        self.n_completed = 0
+        self.n_failed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    @property
+    def n_pending(self):
+        return self.n_submitted - self.n_completed - self.n_failed
+
+    def reserve(self):
+        '''
+        Method to get a free Slot to write a block into, e.g. as buffer of a raw rapidBlock
+        acquisition. Returns None (and counts a dropped block) if no slot got free.
+        '''
+
+        slot = self.ring.reserve(timeout = self.timeout_s if self.policy == 'block' else 0)
+        if slot is None:
+            with self.lock:
+                self.n_dropped += 1
+
+        return slot
+
+    def submit(self, slot, metadata = None):
+        '''
+        Method to hand a filled Slot to the workers, returns the Future of the callback result
+        '''
+
+        try:
+            future = self.executor.submit(_run_callback, slot.index, metadata)
+        except Exception:
+            self.ring.release(slot.index)
+            raise
+        with self.lock:
+            self.n_submitted += 1
+            if self.keep_results:
+                self.futures.append(future)
+        future.add_done_callback(lambda done, i_slot = slot.index: self._done(done, i_slot))
+
+        return future
+
+    def put(self, block, metadata = None):
+        '''
+        Method to copy a block into a free slot and hand it to the workers, returns the Future
+        of the callback result or None if the block was dropped
+        '''
+
+        slot = self.reserve()
+        if slot is None:
+            return None
+        slot.array[...] = block
+
+        return self.submit(slot, metadata)
+
+    def _done(self, future, i_slot):
+
+        self.ring.release(i_slot)
+        with self.lock:
+            if future.cancelled() or future.exception() is not None:
+                self.n_failed += 1
+            else:
+                self.n_completed += 1
+
+    def results(self):
+        '''
+        Method to wait for the submitted blocks and get the callback results in submission
+        order, the result of a failed callback is its exception
+        '''
+
+        with self.lock:
+            futures, self.futures = self.futures, []
+
+        return [future.exception() or future.result() for future in futures]
+
+    def close(self):
+
+        if self.executor is None:
+            return
+        self.executor.shutdown(wait = True)
+        self.executor = None
+        self.ring.close()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+'''Benchmarks of the host-side overhead of the acquisition, conversion and output stages
+with the simulated ps6000a driver. Run from the directory containing the package as
+
+    python -m pico_acq.benchmark --output bench.json
+
+The results are written as JSON, one record per benchmark and parameter set with the wall
+times of the repetitions, the time spent in the (simulated) driver and the driver calls.
+'''
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+BENCHMARK_FORMAT_VERSION = 1
+
+def _git_commit():
+
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _timed(func, repeat, library = None):
+    '''
+    Method to run func once to warm up and then repeat times, returns the wall times and the
+    driver time and calls per repetition
+    '''
+
+    func()
+    if library is not None:
+        library.reset_counters()
+
+    wall_times_s = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        wall_times_s.append(time.perf_counter() - start)
+
+    record = {
+        'wall_s': wall_times_s,
+        'min_s': min(wall_times_s),
+        'median_s': float(np.median(wall_times_s))
+    }
+    if library is not None:
+        driver_s = sum(library.driver_time_s.values()) / repeat
+        record.update({
+            'driver_s': driver_s,
+            'host_s': record['median_s'] - driver_s,
+            'driver_calls': {name: n_calls // repeat for name, n_calls in sorted(library.calls.items())}
+        })
+
+    return record
+
+def run_benchmarks(args):
+    '''
+    Method to run all benchmarks with the simulated driver, returns the JSON document
+    '''
+
+    package = __package__ or 'pico_acq'
+    simulator = importlib.import_module('.simulator', package)
+
+    # triggers arrive right away and streaming is not paced, only the host code is timed
+    library = simulator.install(call_latency_s=args.latency_us * 1e-6, trigger_rate_hz=1e12, rearm_time_s=0.,
+                                realtime=False, noise_adc=50.)
+    utils = importlib.import_module('.utils', package)
+    conversion = importlib.import_module('.conversion', package)
+    writer = importlib.import_module('.writer', package)
+    features = importlib.import_module('.features', package)
+    PS6000a = importlib.import_module('.PS6000a', package).PS6000a
+
+    scope = PS6000a()
+    channel_names = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
+    results = []
+
+    def record(name, params, n_samples_total, func, with_driver = True):
+        timing = _timed(func, args.repeat, library if with_driver else None)
+        timing['samples_per_s'] = n_samples_total / timing['median_s'] if timing['median_s'] > 0 else None
+        results.append(dict(name=name, params=params, **timing))
+        if not args.quiet:
+            print(f'{name:<24} {json.dumps(params):<60} {1e3 * timing["median_s"]:10.3f} ms', file=sys.stderr)
+
+    for n_channels in args.channels:
+        channels = channel_names[:n_channels]
+        scope.activate_channels(channels, ['PICO_500MV'] * n_channels, ['PICO_DC'] * n_channels)
+        common = dict(
+            waiter = scope.block_waiter,
+            buffer_pool = scope.buffer_pool,
+            device_state = scope.device_state
+        )
+
+        for n_samples, raw in itertools.product(args.samples, (False, True)):
+            record('read_channel_runblock', {'channels': n_channels, 'samples': n_samples, 'raw': raw}, n_channels * n_samples,
+                   lambda: utils.read_channel_runblock(scope.status, scope.handle, scope.resolution, scope.readout_channels,
+                                                       scope.channel_ranges, args.sample_interval_ns,
+                                                       n_pretrigger_samples=n_samples // 10, n_posttrigger_samples=n_samples - n_samples // 10,
+                                                       raw=raw, **common))
+
+        for n_segments, n_samples in itertools.product(args.segments, args.segment_samples):
+            if n_segments * n_samples * n_channels > args.max_block_samples:
+                continue
+            acq_window_ns = n_samples * args.sample_interval_ns
+            for raw in (False, True):
+                record('read_channel_rapidblock', {'channels': n_channels, 'segments': n_segments, 'samples': n_samples, 'raw': raw},
+                       n_channels * n_segments * n_samples,
+                       lambda: utils.read_channel_rapidblock(scope.status, scope.handle, scope.resolution, scope.readout_channels,
+                                                             scope.channel_ranges, args.sample_interval_ns, n_segments,
+                                                             acq_window_ns=acq_window_ns, raw=raw, **common))
+
+        for n_samples in args.samples:
+            record('read_channel_streaming', {'channels': n_channels, 'samples': n_samples}, n_channels * n_samples,
+                   lambda: utils.read_channel_streaming(scope.status, scope.handle, scope.resolution, scope.readout_channels,
+                                                        scope.channel_ranges,
+                                                        n_pretrigger_samples=n_samples // 10, n_posttrigger_samples=n_samples - n_samples // 10,
+                                                        sample_interval=args.sample_interval_ns, device_state=scope.device_state))
+        scope.buffer_pool.invalidate()
+
+        # conversion and output stages on blocks like the ones of the acquisitions
+        max_ADC = utils.get_max_adc(scope.status, scope.handle, scope.resolution, device_state=scope.device_state)
+        scale_factors, _ = utils.conversion_factors(scope.readout_channels, scope.channel_ranges, max_ADC)
+        rng = np.random.default_rng(0)
+        for n_segments, n_samples in itertools.product(args.segments, args.segment_samples):
+            if n_segments * n_samples * n_channels > args.max_block_samples:
+                continue
+            block = rng.integers(-2**14, 2**14, size=(n_channels, n_segments, n_samples), dtype=np.int16)
+            params = {'channels': n_channels, 'segments': n_segments, 'samples': n_samples}
+            out = np.empty(block.shape, dtype=np.float32)
+            record('adc2mV_block', params, block.size,
+                   lambda: conversion.adc2mV_block(block, scale_factors, out=out), with_driver=False)
+            record('extract_features', params, block.size,
+                   lambda: features.extract_features(block, n_samples // 2, args.sample_interval_ns), with_driver=False)
+
+            with tempfile.TemporaryDirectory() as output_dir:
+                raw_writer = writer.RawWriter(os.path.join(output_dir, 'bench'), channels, scale_factors, args.sample_interval_ns)
+
+                def write_block():
+                    raw_writer.write(block)
+                    raw_writer.flush()
+
+                record('RawWriter.write', params, block.size, write_block, with_driver=False)
+                raw_writer.close()
+
+    scope.close()
+
+    return {
+        'format_version': BENCHMARK_FORMAT_VERSION,
+        'commit': _git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'simulator': library.config,
+        'settings': vars(args),
+        'results': results
+    }
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the host-side overhead with the simulated ps6000a driver')
+    parser.add_argument('--output', metavar='text', default=None, help='JSON output file (default: stdout)')
+    parser.add_argument('--repeat', type=int, default=5, help='repetitions of every benchmark')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 4], help='numbers of channels')
+    parser.add_argument('--samples', type=int, nargs='+', default=[1000, 100000, 1000000], help='samples of runBlock and streaming captures')
+    parser.add_argument('--segments', type=int, nargs='+', default=[1, 100, 10000], help='numbers of rapidBlock segments')
+    parser.add_argument('--segment-samples', type=int, nargs='+', default=[100, 1000], help='samples per rapidBlock segment')
+    parser.add_argument('--max-block-samples', type=float, default=5e7, help='largest block (channels x segments x samples) to run')
+    parser.add_argument('--sample-interval-ns', type=float, default=0.8, help='sample interval in ns')
+    parser.add_argument('--latency-us', type=float, default=0., help='simulated latency of every driver call in us')
+    parser.add_argument('--quick', action='store_true', help='small parameter sets and 2 repetitions, for a smoke test')
+    parser.add_argument('--quiet', action='store_true', help='no progress on stderr')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.repeat = 2
+        args.channels = [1, 2]
+        args.samples = [1000, 10000]
+        args.segments = [1, 100]
+        args.segment_samples = [100]
+
+    document = run_benchmarks(args)
+    if args.output is None:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as output_file:
+            json.dump(document, output_file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+'''Compact container of a capture: the raw int16 block and what is needed to get mV and ns
+'''
+
+import numpy as np
+
+from .conversion import adc2mV_block
+from .timing import TimeAxis, SegmentedTimeAxis, TriggerInfo
+
+class CaptureBlock:
+    '''
+    Result of any acquisition mode kept as the raw (channels, segments, samples) int16 ADC
+    counts, a single capture being one segment, together with small per-channel and
+    per-segment arrays: the mV per count and analogue offsets of the channels, the trigger
+    time offsets t0s in ns and the overflow bits (bit i for the i-th channel) of the segments.
+    mV and times are computed on demand, so a block takes 4 times less memory than the
+    float64 mV arrays and is cheap to hand to other threads.
+
+    Indexing selects segments without a copy, block[10:20] is a CaptureBlock of 10 segments
+    and block[3] one of a single segment. The ADC counts of a live acquisition are a view into
+    the buffers registered with the driver and are overwritten by the next acquisition with
+    the same settings, copy() gives a block owning its data.
+    '''
+
+    __slots__ = ('adc', 'channels', 'scale_factors_mV', 'offsets_mV', 'sample_interval_ns', 'n_pretrigger_samples',
+                 't0s', 'overflow', 'channel_ranges', 'max_adc', 'trigger_info')
+
+    def __init__(self, adc, channels, scale_factors_mV, sample_interval_ns, **kwargs):
+
+        adc = np.asarray(adc)
+        if adc.ndim == 2:
+            adc = adc[:, np.newaxis]
+        if adc.ndim != 3 or adc.shape[0] != len(channels):
+            raise ValueError(f'ADC counts must have shape (channels, [segments,] samples) with {len(channels)} channels')
+
+        self.adc = adc
+        self.channels = tuple(channels)
+        self.scale_factors_mV = np.asarray(scale_factors_mV, dtype=np.float64)
+        offsets_mV = kwargs.get('offsets_mV', None)
+        self.offsets_mV = np.zeros(len(channels)) if offsets_mV is None else np.asarray(offsets_mV, dtype=np.float64)
+        self.sample_interval_ns = float(sample_interval_ns)
+        self.n_pretrigger_samples = int(kwargs.get('n_pretrigger_samples', 0))
+
+        t0s = kwargs.get('t0s', None)
+        self.t0s = np.zeros(adc.shape[1]) if t0s is None else np.asarray(t0s, dtype=np.float64)
+        overflow = kwargs.get('overflow', None)
+        self.overflow = np.zeros(adc.shape[1], dtype=np.int16) if overflow is None else np.asarray(overflow, dtype=np.int16)
+
+        # PICO_CONNECT_PROBE_RANGE names and max ADC count the scale factors come from, if known
+        self.channel_ranges = kwargs.get('channel_ranges', None)
+        self.max_adc = kwargs.get('max_adc', None)
+        self.trigger_info = kwargs.get('trigger_info', None)
+
+    def __len__(self):
+        return self.adc.shape[1]
+
+    def __getitem__(self, segments):
+
+        if isinstance(segments, (int, np.integer)):
+            if segments < 0:
+                segments += len(self)
+            if not 0 <= segments < len(self):
+                raise IndexError('CaptureBlock segment out of range')
+            segments = slice(segments, segments + 1)
+
+        # the decoded trigger information has one entry per segment in every field
+        trigger_info = None
+        if self.trigger_info is not None:
+            trigger_info = TriggerInfo(*(np.asarray(field)[segments] for field in self.trigger_info))
+
+        return CaptureBlock(self.adc[:, segments], self.channels, self.scale_factors_mV, self.sample_interval_ns,
+                            offsets_mV=self.offsets_mV, n_pretrigger_samples=self.n_pretrigger_samples, t0s=self.t0s[segments],
+                            overflow=self.overflow[segments], channel_ranges=self.channel_ranges, max_adc=self.max_adc,
+                            trigger_info=trigger_info)
+
+    def __repr__(self):
+        return (f'CaptureBlock(channels={list(self.channels)}, segments={self.n_segments}, samples={self.n_samples}, '
+                f'dt={self.sample_interval_ns})')
+
+    @property
+    def n_segments(self):
+        return self.adc.shape[1]
+
+    @property
+    def n_samples(self):
+        return self.adc.shape[2]
+
+    @property
+    def nbytes(self):
+        return self.adc.nbytes + self.t0s.nbytes + self.overflow.nbytes
+
+    @property
+    def times(self):
+        '''SegmentedTimeAxis of the segments'''
+        return SegmentedTimeAxis(self.t0s, self.sample_interval_ns, self.n_samples, self.trigger_info)
+
+    def time(self, segment = 0):
+        '''TimeAxis of one segment'''
+        return TimeAxis(self.t0s[segment], self.sample_interval_ns, self.n_samples)
+
+    def channel(self, channel_name):
+        '''
+        Method to get the (segments, samples) ADC counts of one channel, without a copy
+        '''
+
+        return self.adc[self.channels.index(channel_name)]
+
+    def mV(self, channel_name = None, out = None, dtype = np.float32):
+        '''
+        Method to convert to mV, the (segments, samples) array of one channel or the
+        (channels, segments, samples) array of all
+        '''
+
+        if channel_name is None:
+            return adc2mV_block(self.adc, self.scale_factors_mV, self.offsets_mV, out=out, dtype=dtype)
+
+        i_channel = self.channels.index(channel_name)
+        return adc2mV_block(self.adc[i_channel:i_channel + 1], self.scale_factors_mV[i_channel:i_channel + 1],
+                            self.offsets_mV[i_channel:i_channel + 1], out=None if out is None else out[np.newaxis], dtype=dtype)[0]
+
+    def overflowed(self, channel_name):
+        '''
+        Method to get the flags of the segments in which the channel went over range
+        '''
+
+        return (self.overflow & (1 << self.channels.index(channel_name))) != 0
+
+    def to_dict(self, dtype = np.float64):
+        '''
+        Method to get the ({channel: (segments, samples) mV}, SegmentedTimeAxis) returned by the
+        rapidBlock acquisitions without as_block
+        '''
+
+        buffer_mV = self.mV(dtype=dtype)
+        return {channel_name: buffer_mV[i_channel] for i_channel, channel_name in enumerate(self.channels)}, self.times
+
+    def copy(self):
+
+        block = self[:]
+        block.adc = self.adc.copy()
+        return block
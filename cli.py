@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+'''Command line interface of the acquisition, run from the directory containing the package as
+
+    python -m pico_acq {block,rapidblock,stream} [options]
+
+Only argparse is imported at start, the driver, NumPy, matplotlib and the output backends
+are imported when a run needs them, so a short run is dominated by opening the device.
+'''
+
+import argparse
+import sys
+import time
+
+def _open_scope(args):
+    '''
+    Method to open and configure the scope, or the replay of a recording
+    '''
+
+    if args.replay is not None:
+        from .ReplayPS6000a import ReplayPS6000a
+        scope = ReplayPS6000a(args.replay, speed = args.speed or None, loop = args.loop)
+    else:
+        from .PS6000a import PS6000a
+        scope = PS6000a(serial = args.serial)
+        scope.set_resolution(args.resolution)
+
+    channel_ranges = args.range * len(args.channels) if len(args.range) == 1 else args.range
+    if len(channel_ranges) != len(args.channels):
+        raise ValueError(f'Give one range or one per channel, got {len(channel_ranges)} for {len(args.channels)} channels')
+    scope.activate_channels(args.channels, channel_ranges, [args.coupling] * len(args.channels))
+
+    if args.trigger_mV is not None:
+        scope.set_simple_trigger(args.trigger_mV, args.direction, channel = args.trigger_channel,
+                                 autoTriggerMicroSeconds = args.auto_trigger_us)
+
+    if args.func is not None:
+        if args.replay is not None:
+            raise ValueError('The signal generator is not available in a replay')
+        waveform = args.func
+        if waveform.endswith('.npy'):
+            import numpy as np
+            waveform = np.load(waveform)
+        scope.set_awg(waveform, peak_to_peak_volts = args.ampl, offset_volts = args.offset, frequency_hz = args.freq)
+
+    return scope
+
+def _captures(scope, args):
+    '''
+    Generator of the raw (channels, [segments,] samples) ADC counts and time axes of the run
+    '''
+
+    if args.command == 'block':
+        for _ in range(args.captures):
+            yield scope.acquire(args.sample_interval_ns, mode = 'runBlock', n_pretrigger_samples = args.pretrigger,
+                                n_posttrigger_samples = args.posttrigger, raw = True, timeout_s = args.timeout_s)
+    elif args.command == 'rapidblock' and args.events is not None:
+        yield from scope.acquire_events(args.events, args.sample_interval_ns, acq_window_ns = args.window_ns, raw = True,
+                                        batch_timeout_s = args.timeout_s)
+    elif args.command == 'rapidblock':
+        for _ in range(args.captures):
+            yield scope.acquire(args.sample_interval_ns, mode = 'rapidBlock', number_segments = args.segments,
+                                acq_window_ns = args.window_ns, raw = True, timeout_s = args.timeout_s)
+    else:
+        # the chunks are collected into a single record of the requested samples
+        import numpy as np
+        from .timing import TimeAxis
+        buffer = np.empty((len(args.channels), args.samples), dtype=np.int16)
+        n_samples = 0
+        for chunk in scope.stream(args.sample_interval_ns, max_samples = args.samples, buffer_samples = args.buffer_samples):
+            n_new = min(chunk.data.shape[1], args.samples - n_samples)
+            buffer[:, n_samples:n_samples + n_new] = chunk.data[:, :n_new]
+            n_samples += n_new
+        yield buffer[:, :n_samples], TimeAxis(0, args.sample_interval_ns, n_samples)
+
+def _plot(buffer, times, channels, scale_factors, offsets_mV, args):
+
+    import numpy as np
+    try:
+        import matplotlib
+    except ImportError as exc:
+        raise ImportError('Plotting requires matplotlib') from exc
+    if not args.show:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from .conversion import adc2mV_block
+
+    # first segment of a rapidBlock capture
+    if buffer.ndim == 3:
+        buffer, times = buffer[:, 0], times[0]
+    buffer_mV = adc2mV_block(buffer, scale_factors, offsets_mV, dtype=np.float64)
+
+    plt.figure(figsize=(10, 10))
+    for channel_name, signal in zip(channels, buffer_mV):
+        plt.plot(np.asarray(times), signal, label=channel_name)
+    plt.xlabel('time (ns)')
+    plt.ylabel('voltage (mV)')
+    plt.legend()
+    if args.plot is not None:
+        plt.savefig(args.plot)
+    if args.show:
+        plt.show()
+
+def run(args):
+
+    start = time.perf_counter()
+    scope = _open_scope(args)
+    time_open = time.perf_counter() - start
+
+    writer = None
+    n_captures = n_segments = 0
+    try:
+        scale_factors, offsets_mV = scope.conversion_factors()
+        if args.output is not None:
+            writer = scope.open_writer(args.output, args.sample_interval_ns, file_format = args.format)
+
+        for buffer, times in _captures(scope, args):
+            if writer is not None:
+                writer.write(buffer, times)
+            n_captures += 1
+            n_segments += buffer.shape[1] if buffer.ndim == 3 else 1
+    finally:
+        if writer is not None:
+            writer.close()
+        scope.close()
+
+    if not args.quiet:
+        print(f'{n_captures} captures, {n_segments} segments in {time.perf_counter() - start:.3f} s '
+              f'({time_open:.3f} s to open the scope)', file=sys.stderr)
+
+    if n_captures and (args.plot is not None or args.show):
+        _plot(buffer, times, args.channels, scale_factors, offsets_mV, args)
+
+def main(argv = None):
+
+    parser = argparse.ArgumentParser(prog='pico_acq', description='Acquisition with a 6000 A series Picoscope')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    scope_options = common.add_argument_group('scope')
+    scope_options.add_argument('--serial', metavar='text', default=None, help='serial number of the scope (default: the first one found)')
+    scope_options.add_argument('--resolution', metavar='text', default='PICO_DR_10BIT', help='device resolution')
+    scope_options.add_argument('--channels', metavar='text', nargs='+', default=['A'], help='channels for readout')
+    scope_options.add_argument('--range', metavar='text', nargs='+', default=['PICO_1V'], help='range of all channels or of each channel')
+    scope_options.add_argument('--coupling', metavar='text', default='PICO_DC', help='coupling of the channels')
+    scope_options.add_argument('--sample-interval-ns', type=float, default=0.8, help='sample interval in ns')
+    scope_options.add_argument('--timeout-s', type=float, default=None, help='longest wait for a block capture in s')
+    scope_options.add_argument('--replay', metavar='text', default=None, help='replay this recording instead of opening a scope')
+    scope_options.add_argument('--speed', type=float, default=1., help='replay speed relative to real time, 0 for as fast as possible')
+    scope_options.add_argument('--loop', action='store_true', help='start the replay over at the end of the recording')
+    trigger_options = common.add_argument_group('trigger')
+    trigger_options.add_argument('--trigger-mV', type=float, default=None, help='trigger threshold in mV (default: no trigger)')
+    trigger_options.add_argument('--trigger-channel', metavar='text', default='A', help='trigger channel')
+    trigger_options.add_argument('--direction', metavar='text', default='PICO_RISING', help='trigger direction')
+    trigger_options.add_argument('--auto-trigger-us', type=int, default=0, help='auto trigger after this time in us, 0 to wait forever')
+    awg_options = common.add_argument_group('signal generator')
+    awg_options.add_argument('--func', metavar='text', default=None, help='generated function, e.g. PICO_SINE, or a .npy file with one period '
+                             'of an arbitrary waveform in [-1, 1] (default: off)')
+    awg_options.add_argument('--ampl', type=float, default=2., help='peak-to-peak amplitude in V')
+    awg_options.add_argument('--freq', type=int, default=1000, help='frequency in Hz')
+    awg_options.add_argument('--offset', type=float, default=0., help='offset in V')
+    output_options = common.add_argument_group('output')
+    output_options.add_argument('--output', metavar='text', default=None, help='raw output file (.bin with .json sidecar, .h5 or Zarr directory)')
+    output_options.add_argument('--format', metavar='text', default='binary', choices=['binary', 'hdf5', 'zarr'], help='raw output format')
+    output_options.add_argument('--plot', metavar='text', default=None, help='pdf file with the signals of the last capture')
+    output_options.add_argument('--show', action='store_true', help='show the signals of the last capture')
+    output_options.add_argument('--quiet', action='store_true', help='no summary on stderr')
+
+    block = subparsers.add_parser('block', parents=[common], help='runBlock captures')
+    block.add_argument('--pretrigger', type=int, default=1000, help='samples before the trigger')
+    block.add_argument('--posttrigger', type=int, default=9000, help='samples after the trigger')
+    block.add_argument('--captures', type=int, default=1, help='number of captures')
+
+    rapidblock = subparsers.add_parser('rapidblock', parents=[common], help='rapidBlock captures')
+    rapidblock.add_argument('--segments', type=int, default=100, help='segments per capture')
+    rapidblock.add_argument('--window-ns', type=float, default=100., help='acquisition window around the trigger in ns')
+    rapidblock.add_argument('--captures', type=int, default=1, help='number of captures')
+    rapidblock.add_argument('--events', type=int, default=None, help='collect this many segments in captures sized to the device memory, '
+                            'a capture running longer than --timeout-s is stopped and its completed segments are read')
+
+    stream = subparsers.add_parser('stream', parents=[common], help='streaming run')
+    stream.add_argument('--samples', type=int, default=1000000, help='samples per channel')
+    stream.add_argument('--buffer-samples', type=int, default=1000000, help='samples per driver buffer')
+
+    args = parser.parse_args(argv)
+    if args.command == 'stream' and args.replay is not None:
+        parser.error('Streaming is not available in a replay, use block or rapidblock')
+
+    try:
+        run(args)
+    except (OSError, ValueError, NotImplementedError, EOFError) as exc:
+        parser.exit(1, f'{parser.prog}: error: {exc}\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+'''Conversion of raw ADC counts to mV for whole (channels x segments x samples) blocks
+'''
+
+import numpy as np
+
+# full scale of the PICO_CONNECT_PROBE_RANGE values in mV
+CHANNEL_RANGES_MV = np.array([10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000], dtype=np.float64)
+
+def adc_scale_factors(channel_ranges, max_adc):
+    '''
+    Method to get the mV per ADC count for a list of PICO_CONNECT_PROBE_RANGE values
+    '''
+
+    if hasattr(max_adc, 'value'):
+        max_adc = max_adc.value
+
+    return CHANNEL_RANGES_MV[np.asarray(channel_ranges, dtype=np.intp)] / float(max_adc)
+
+def adc2mV_block(buffer_adc, scale_factors, offsets_mV = None, out = None, dtype = np.float32):
+    '''
+    Method to convert a block of ADC counts with the channels on the first axis to mV in a
+    single pass, mV = counts * scale_factors[channel] - offsets_mV[channel]. The analogue
+    offsets are the ones applied to the channels, so they are subtracted to get the input
+    voltage back. If out is given the result is written there, otherwise a new array of
+    the given dtype is allocated.
+    '''
+
+    buffer_adc = np.asarray(buffer_adc)
+    if out is None:
+        out = np.empty(buffer_adc.shape, dtype=dtype)
+    elif out.shape != buffer_adc.shape:
+        raise ValueError(f'Output array has shape {out.shape}, expected {buffer_adc.shape}')
+
+    # broadcast the per-channel factors over all remaining axes
+    channel_shape = (-1,) + (1,) * (buffer_adc.ndim - 1)
+    scale_factors = np.asarray(scale_factors, dtype=out.dtype).reshape(channel_shape)
+    np.multiply(buffer_adc, scale_factors, out=out)
+
+    if offsets_mV is not None and np.any(offsets_mV):
+        np.subtract(out, np.asarray(offsets_mV, dtype=out.dtype).reshape(channel_shape), out=out)
+
+    return out
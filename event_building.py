@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+'''Event building across several units from the trigger timestamps of their segments
+'''
+
+from collections import namedtuple
+import numpy as np
+
+UnitAlignment = namedtuple('UnitAlignment', ['offset_ns', 'drift_ppm', 'residual_ns', 'n_matched', 'n_unmatched'])
+BuiltEvents = namedtuple('BuiltEvents', ['segments', 't0s', 'alignments'])
+
+def _match(reference_t0s, t0s, tolerance_ns):
+    '''
+    Method to get for every entry of t0s the index of the nearest entry of the sorted
+    reference_t0s and whether it is closer than tolerance_ns
+    '''
+
+    index = np.clip(np.searchsorted(reference_t0s, t0s), 1, max(len(reference_t0s) - 1, 1))
+    previous = np.maximum(index - 1, 0)
+    use_previous = np.abs(t0s - reference_t0s[previous]) < np.abs(t0s - reference_t0s[np.minimum(index, len(reference_t0s) - 1)])
+    nearest = np.where(use_previous, previous, np.minimum(index, len(reference_t0s) - 1))
+
+    return nearest, np.abs(t0s - reference_t0s[nearest]) <= tolerance_ns
+
+def align_unit(reference_t0s, t0s, tolerance_ns, n_candidates = 4, n_first_segments = 64):
+    '''
+    Method to map the trigger times t0s (ns) of a unit onto the clock of the reference unit,
+    t_reference = offset_ns + t * (1 + drift_ppm * 1e-6). The clocks of the units start at
+    different times, so the offset is taken from the pairing of the first n_candidates
+    segments of either unit that matches most of the first n_first_segments (a unit may have
+    missed the first triggers), the drift is then fitted on the matched pairs. Returns the
+    UnitAlignment and the index of the matched reference segment of every segment, -1 if
+    unmatched.
+    '''
+
+    reference_t0s = np.asarray(reference_t0s, dtype=np.float64)
+    t0s = np.asarray(t0s, dtype=np.float64)
+    if len(reference_t0s) == 0 or len(t0s) == 0:
+        return UnitAlignment(0., 0., np.nan, 0, len(t0s)), np.full(len(t0s), -1, dtype=np.intp)
+
+    # offset candidates scored on the first segments, where the drift has not added up yet
+    n_fit = min(len(t0s), n_first_segments)
+    candidates = np.concatenate([reference_t0s[0] - t0s[:n_candidates], reference_t0s[:n_candidates] - t0s[0]])
+    n_matches = [np.count_nonzero(_match(reference_t0s, t0s[:n_fit] + offset, tolerance_ns)[1]) for offset in candidates]
+    offset_ns = candidates[int(np.argmax(n_matches))]
+    drift = 0.
+
+    # refine the offset and the drift on twice as many segments at every step, the fit on the
+    # previous ones extrapolates well enough to match them
+    while True:
+        nearest, matched = _match(reference_t0s, offset_ns + t0s[:n_fit] * (1. + drift), tolerance_ns)
+        fit_t0s = t0s[:n_fit][matched]
+        if len(fit_t0s) >= 2 and np.ptp(fit_t0s) > 0:
+            drift, offset_ns = np.polyfit(fit_t0s, reference_t0s[nearest[matched]] - fit_t0s, 1)
+        elif len(fit_t0s) > 0:
+            offset_ns = np.mean(reference_t0s[nearest[matched]] - fit_t0s)
+        if n_fit == len(t0s):
+            break
+        n_fit = min(len(t0s), 2 * n_fit)
+
+    nearest, matched = _match(reference_t0s, offset_ns + t0s * (1. + drift), tolerance_ns)
+    # a reference segment can only be taken once, keep the closest pair
+    residuals = offset_ns + t0s * (1. + drift) - reference_t0s[nearest]
+    order = np.lexsort((np.abs(residuals), nearest))
+    taken = np.zeros(len(t0s), dtype=bool)
+    taken[order[np.r_[True, nearest[order][1:] != nearest[order][:-1]]]] = True
+    matched &= taken
+
+    reference_segments = np.where(matched, nearest, -1)
+    residual_ns = float(np.sqrt(np.mean(residuals[matched]**2))) if np.any(matched) else np.nan
+    alignment = UnitAlignment(float(offset_ns), float(drift * 1e6), residual_ns, int(np.count_nonzero(matched)),
+                              int(np.count_nonzero(~matched)))
+
+    return alignment, reference_segments
+
+def build_events(t0s_by_unit, tolerance_ns, reference = None):
+    '''
+    Method to merge the segments of several units into events by their trigger times. t0s_by_unit
+    maps every unit to the trigger times in ns of its segments, e.g. the t0s of the
+    SegmentedTimeAxis of a rapidBlock capture, reference is the unit whose clock is used (the
+    first one by default). Returns BuiltEvents with
+      - segments: (events, units) segment indices in the order of t0s_by_unit, -1 where a unit
+        has no segment for the event
+      - t0s: trigger time of every event in ns on the reference clock
+      - alignments: UnitAlignment per unit with the clock offset and drift to the reference
+        and the number of matched and unmatched segments
+    Segments without a partner in the reference unit become events of their own.
+    '''
+
+    units = list(t0s_by_unit)
+    reference = units[0] if reference is None else reference
+    reference_t0s = np.asarray(t0s_by_unit[reference], dtype=np.float64)
+
+    columns = []
+    extra_t0s = []
+    extra_segments = []
+    alignments = {}
+    for i_unit, unit in enumerate(units):
+        t0s = np.asarray(t0s_by_unit[unit], dtype=np.float64)
+        if unit == reference:
+            alignments[unit] = UnitAlignment(0., 0., 0., len(t0s), 0)
+            columns.append(np.arange(len(t0s)))
+            continue
+
+        alignment, reference_segments = align_unit(reference_t0s, t0s, tolerance_ns)
+        alignments[unit] = alignment
+
+        column = np.full(len(reference_t0s), -1, dtype=np.intp)
+        matched = reference_segments >= 0
+        column[reference_segments[matched]] = np.flatnonzero(matched)
+        columns.append(column)
+
+        unmatched = np.flatnonzero(~matched)
+        extra_t0s.append(alignment.offset_ns + t0s[unmatched] * (1. + alignment.drift_ppm * 1e-6))
+        extra_segment = np.full((len(unmatched), len(units)), -1, dtype=np.intp)
+        extra_segment[:, i_unit] = unmatched
+        extra_segments.append(extra_segment)
+
+    segments = np.concatenate([np.stack(columns, axis=1)] + extra_segments)
+    event_t0s = np.concatenate([reference_t0s] + extra_t0s)
+    order = np.argsort(event_t0s, kind='stable')
+
+    return BuiltEvents(segments[order], event_t0s[order], alignments)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+'''Vectorized pulse feature extraction on whole blocks of segments
+'''
+
+import numpy as np
+
+FEATURES = ('baseline', 'amplitude', 'peak_time', 'charge', 'rise_time', 'cfd_time')
+FEATURE_DTYPE = np.dtype([(feature, np.float32) for feature in FEATURES])
+
+def _edge_crossing(signal, peak_index, level):
+    '''
+    Method to get the interpolated sample index where the leading edge of every row of
+    signal crosses its level, i.e. the last upward crossing before the peak. NaN for the
+    rows that do not go below their level before the peak.
+    '''
+
+    n_samples = signal.shape[1]
+    below = signal < level[:, np.newaxis]
+    below &= np.arange(n_samples) < peak_index[:, np.newaxis]
+
+    # last sample below the level, from the first True of the reversed rows
+    last_below = n_samples - 1 - np.argmax(below[:, ::-1], axis=1)
+    found = np.take_along_axis(below, last_below[:, np.newaxis], axis=1)[:, 0]
+
+    next_sample = np.minimum(last_below + 1, n_samples - 1)
+    value_below = np.take_along_axis(signal, last_below[:, np.newaxis], axis=1)[:, 0]
+    value_above = np.take_along_axis(signal, next_sample[:, np.newaxis], axis=1)[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = last_below + (level - value_below) / (value_above - value_below)
+    crossing[~found] = np.nan
+
+    return crossing
+
+def _chunk_features(chunk, features, n_pretrigger_samples, sample_interval_ns, n_baseline_samples, polarity,
+                    integration_window, rise_fractions, cfd_fraction):
+
+    signal = chunk.astype(np.float32)
+    rows = np.arange(len(signal))
+
+    # baseline from the pretrigger samples, pulses made positive
+    baseline = signal[:, :n_baseline_samples].mean(axis=1)
+    signal -= baseline[:, np.newaxis]
+    if polarity < 0:
+        np.negative(signal, out=signal)
+
+    peak_index = signal.argmax(axis=1)
+    amplitude = signal[rows, peak_index]
+
+    t_low = _edge_crossing(signal, peak_index, rise_fractions[0] * amplitude)
+    t_high = _edge_crossing(signal, peak_index, rise_fractions[1] * amplitude)
+    t_cfd = _edge_crossing(signal, peak_index, cfd_fraction * amplitude)
+
+    # times in ns relative to the trigger
+    features['baseline'] = baseline
+    features['amplitude'] = amplitude
+    features['peak_time'] = (peak_index - n_pretrigger_samples) * sample_interval_ns
+    features['charge'] = signal[:, integration_window[0]:integration_window[1]].sum(axis=1) * sample_interval_ns
+    features['rise_time'] = (t_high - t_low) * sample_interval_ns
+    features['cfd_time'] = (t_cfd - n_pretrigger_samples) * sample_interval_ns
+
+def extract_features(waveforms, n_pretrigger_samples, sample_interval_ns, **kwargs):
+    '''
+    Method to extract the pulse features of a block of ADC counts of shape (..., samples),
+    e.g. (segments, samples) of one channel or (channels, segments, samples), in one
+    vectorized pass. Returns a FEATURE_DTYPE array of shape (...) with
+      - baseline: mean of the first n_baseline_samples (default: the pretrigger samples)
+      - amplitude: height of the maximum above the baseline
+      - peak_time: time of the maximum in ns after the trigger
+      - charge: baseline-subtracted sum over integration_window (samples, default: all)
+        times the sample interval
+      - rise_time: time in ns between the rise_fractions (default 10% and 90%) of the
+        amplitude on the leading edge
+      - cfd_time: time in ns after the trigger where the leading edge crosses cfd_fraction
+        (default 20%) of the amplitude, interpolated between samples
+    Negative pulses are handled with polarity = -1. Values are in ADC counts unless the
+    scale_factor_mV (and offset_mV) of the channel, or one per entry of the leading axis,
+    are given. Times are NaN where a pulse does not cross the level before its peak. The
+    block is processed in chunks of chunk_segments rows to stay in the CPU cache.
+    '''
+
+    waveforms = np.asarray(waveforms)
+    n_baseline_samples = kwargs.get('n_baseline_samples', None) or n_pretrigger_samples
+    polarity = kwargs.get('polarity', 1)
+    integration_window = kwargs.get('integration_window', (0, waveforms.shape[-1]))
+    rise_fractions = kwargs.get('rise_fractions', (0.1, 0.9))
+    cfd_fraction = kwargs.get('cfd_fraction', 0.2)
+    chunk_segments = kwargs.get('chunk_segments', 4096)
+
+    if n_baseline_samples < 1:
+        raise ValueError('Baseline needs at least one pretrigger sample, set n_baseline_samples')
+
+    rows = waveforms.reshape(-1, waveforms.shape[-1])
+    features = np.empty(len(rows), dtype=FEATURE_DTYPE)
+    for start in range(0, len(rows), chunk_segments):
+        _chunk_features(rows[start:start + chunk_segments], features[start:start + chunk_segments], n_pretrigger_samples,
+                        sample_interval_ns, n_baseline_samples, polarity, integration_window, rise_fractions, cfd_fraction)
+    features = features.reshape(waveforms.shape[:-1])
+
+    scale_factor_mV = kwargs.get('scale_factor_mV', None)
+    if scale_factor_mV is not None:
+        # per entry of the leading axis, e.g. per channel
+        scale_shape = np.shape(scale_factor_mV) + (1,) * (features.ndim - np.ndim(scale_factor_mV))
+        scale_factor_mV = np.reshape(scale_factor_mV, scale_shape)
+        offset_mV = kwargs.get('offset_mV', None)
+        offset_mV = 0. if offset_mV is None else np.reshape(offset_mV, scale_shape)
+        features['baseline'] = features['baseline'] * scale_factor_mV - offset_mV
+        features['amplitude'] *= scale_factor_mV
+        features['charge'] *= scale_factor_mV
+
+    return features
+
+def event_dtype(n_channels):
+    '''
+    Method to get the dtype of the per-event records of event_features
+    '''
+
+    return np.dtype([('t0', np.float64), ('overflow', np.int16)] + [(feature, np.float32, (n_channels,)) for feature in FEATURES])
+
+def event_features(buffer, times, overflow, **kwargs):
+    '''
+    Method to reduce a (channels, segments, samples) rapidBlock capture to one record per
+    segment with its trigger time offset t0 in ns, its overflow flags and the features of
+    every channel (see extract_features for the keywords). Fits the process hook of the
+    pipelined rapidBlock readout, e.g.
+
+        functools.partial(event_features, scale_factor_mV = scale_factors, polarity = -1)
+
+    The baseline defaults to the first half of the samples, the pretrigger part of the
+    symmetric rapidBlock window.
+    '''
+
+    n_pretrigger_samples = kwargs.pop('n_pretrigger_samples', None)
+    if n_pretrigger_samples is None:
+        n_pretrigger_samples = times.n // 2
+
+    features = extract_features(buffer, n_pretrigger_samples, times.dt, **kwargs)
+
+    events = np.empty(buffer.shape[1], dtype=event_dtype(buffer.shape[0]))
+    events['t0'] = times.t0s
+    events['overflow'] = overflow
+    for feature in FEATURES:
+        # (channels, segments) -> (segments, channels)
+        events[feature] = features[feature].T
+
+    return events
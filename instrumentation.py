@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+'''Counts, cumulative times and latency histograms of the driver calls and the phases of
+the acquisitions
+'''
+
+import bisect
+import json
+import threading
+import time
+
+# upper bounds in s of the latency histogram buckets, from 1 us to 10 s
+DEFAULT_BUCKETS_S = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3,
+                     1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+class _Timing:
+    '''
+    Count, cumulative and maximum time, number of errors and histogram counts of one
+    driver function or phase
+    '''
+
+    __slots__ = ('count', 'total_s', 'max_s', 'errors', 'buckets')
+
+    def __init__(self, n_buckets):
+
+        self.count = 0
+        self.total_s = 0.
+        self.max_s = 0.
+        self.errors = 0
+        self.buckets = [0] * (n_buckets + 1)  # the last one is above the largest bound
+
+class _Phase:
+
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+
+        self.stats.record('phases', self.name, time.perf_counter() - self.start, exc_type is not None)
+
+class DriverStats:
+    '''
+    Statistics of the driver calls, by function name, and of the phases of the acquisitions
+    (setup, arm, wait, transfer, convert), by phase name: number of calls, cumulative and
+    maximum time, number of failures (a return code other than PICO_OK or an exception) and
+    a latency histogram with the upper bounds buckets_s. The duration of the last occurrence of
+    every phase is kept in last_phases. Thread safe, the units of MultiPS6000a share the
+    process-wide driver_stats.
+    '''
+
+    def __init__(self, buckets_s = DEFAULT_BUCKETS_S):
+
+        self.buckets_s = tuple(buckets_s)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+
+        with self.lock:
+            self.tables = {'calls': {}, 'phases': {}}
+            self.last_phases = {}
+            self.started = time.time()
+
+    def record(self, table, name, elapsed_s, failed = False):
+
+        i_bucket = bisect.bisect_left(self.buckets_s, elapsed_s)
+        with self.lock:
+            timing = self.tables[table].get(name)
+            if timing is None:
+                timing = self.tables[table][name] = _Timing(len(self.buckets_s))
+            timing.count += 1
+            timing.total_s += elapsed_s
+            timing.max_s = max(timing.max_s, elapsed_s)
+            timing.errors += bool(failed)
+            timing.buckets[i_bucket] += 1
+            if table == 'phases':
+                self.last_phases[name] = elapsed_s
+
+    def timed(self, name, function):
+        '''
+        Method to wrap a driver function so that its calls are recorded
+        '''
+
+        def timed_function(*args):
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args)
+                failed = result != 0  # PICO_OK
+                return result
+            finally:
+                self.record('calls', name, time.perf_counter() - start, failed)
+
+        timed_function.__name__ = name
+        timed_function.__doc__ = getattr(function, '__doc__', None)
+
+        return timed_function
+
+    def phase(self, name):
+        '''
+        Method to get a context manager timing one phase of an acquisition, e.g.
+
+            with driver_stats.phase('wait'):
+                waiter.wait(timeout_s)
+        '''
+
+        return _Phase(self, name)
+
+    def snapshot(self):
+        '''
+        Method to get the statistics as a dict of plain types, with the histograms as cumulative
+        counts per upper bound like Prometheus
+        '''
+
+        with self.lock:
+            tables = {
+                table: {name: (timing.count, timing.total_s, timing.max_s, timing.errors, list(timing.buckets))
+                        for name, timing in entries.items()}
+                for table, entries in self.tables.items()
+            }
+            last_phases = dict(self.last_phases)
+            started = self.started
+
+        snapshot = {'started': started, 'elapsed_s': time.time() - started, 'buckets_s': list(self.buckets_s), 'last_phases': last_phases}
+        for table, entries in tables.items():
+            snapshot[table] = {}
+            for name, (count, total_s, max_s, errors, buckets) in sorted(entries.items()):
+                cumulative = []
+                n_below = 0
+                for n_bucket in buckets[:-1]:
+                    n_below += n_bucket
+                    cumulative.append(n_below)
+                snapshot[table][name] = {
+                    'count': count,
+                    'total_s': total_s,
+                    'mean_s': total_s / count if count else 0.,
+                    'max_s': max_s,
+                    'errors': errors,
+                    'histogram': cumulative
+                }
+
+        return snapshot
+
+    def to_json(self, path = None):
+        '''
+        Method to dump the snapshot as JSON, to path if given, and return the text
+        '''
+
+        text = json.dumps(self.snapshot(), indent=2)
+        if path is not None:
+            with open(path, 'w') as output_file:
+                output_file.write(text)
+
+        return text
+
+    def to_prometheus(self, prefix = 'pico_acq'):
+        '''
+        Method to get the statistics in the Prometheus text exposition format
+        '''
+
+        snapshot = self.snapshot()
+        bounds = [f'{bound:g}' for bound in self.buckets_s] + ['+Inf']
+        lines = []
+        for table, metric, label, help_text in (('calls', 'driver_call', 'function', 'the ps6000a driver calls'),
+                                                ('phases', 'phase', 'phase', 'the phases of the acquisitions')):
+            metric = f'{prefix}_{metric}'
+            lines.append(f'# HELP {metric}_seconds Duration of {help_text}')
+            lines.append(f'# TYPE {metric}_seconds histogram')
+            for name, entry in snapshot[table].items():
+                for bound, n_below in zip(bounds, entry['histogram'] + [entry['count']]):
+                    lines.append(f'{metric}_seconds_bucket{{{label}="{name}",le="{bound}"}} {n_below}')
+                lines.append(f'{metric}_seconds_sum{{{label}="{name}"}} {entry["total_s"]!r}')
+                lines.append(f'{metric}_seconds_count{{{label}="{name}"}} {entry["count"]}')
+
+            lines.append(f'# HELP {metric}_errors_total Number of failed {help_text}')
+            lines.append(f'# TYPE {metric}_errors_total counter')
+            for name, entry in snapshot[table].items():
+                lines.append(f'{metric}_errors_total{{{label}="{name}"}} {entry["errors"]}')
+
+        return '\n'.join(lines) + '\n'
+
+class InstrumentedLibrary:
+    '''
+    Proxy of the picosdk ps6000a library object recording every ps6000a* call in a
+    DriverStats, the other attributes (e.g. BlockReadyType) are passed through
+    '''
+
+    def __init__(self, library, stats):
+
+        self._library = library
+        self._stats = stats
+
+    def __getattr__(self, name):
+
+        attribute = getattr(self._library, name)
+        if name.startswith('ps6000a') and callable(attribute):
+            attribute = self._stats.timed(name, attribute)
+        # cached, later lookups do not go through __getattr__
+        self.__dict__[name] = attribute
+
+        return attribute
+
+# process-wide statistics of all units
+driver_stats = DriverStats()
+
+def instrument(library):
+    '''
+    Method to get the instrumented proxy of a picosdk library object recording into driver_stats
+    '''
+
+    return InstrumentedLibrary(library, driver_stats)
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+'''Lazy reader of the captures saved with RawWriter
+'''
+
+import json
+import os
+import numpy as np
+
+from .conversion import adc2mV_block
+from .timing import TimeAxis, SegmentedTimeAxis
+from .writer import FORMAT_VERSION
+from .capture import CaptureBlock
+
+class RawReader:
+    '''
+    Reader opening a capture saved with RawWriter without loading it. adc is the
+    (segments, channels, samples) array of ADC counts, a read-only np.memmap for binary
+    files and the dataset itself for HDF5/Zarr, so only the slices that are used are read.
+    Indexing converts to mV on the fly, reader[100:200] gives the (100, channels, samples)
+    mV array of segments 100 to 199 and reader[5] the (channels, samples) one of segment 5.
+    A file that is still being written can be opened, it shows the segments written until
+    its last sidecar update.
+    '''
+
+    def __init__(self, path, **kwargs):
+
+        self.path = path
+        self.dtype = kwargs.get('dtype', np.float32)  # dtype of the mV arrays
+        self.file = None
+
+        file_format = kwargs.get('file_format', None)
+        if file_format is None:
+            if path.endswith(('.h5', '.hdf5')):
+                file_format = 'hdf5'
+            elif os.path.isdir(path):
+                file_format = 'zarr'
+            else:
+                file_format = 'binary'
+        self.file_format = file_format
+
+        if file_format == 'binary':
+            self._open_binary()
+        elif file_format == 'hdf5':
+            self._open_hdf5()
+        elif file_format == 'zarr':
+            self._open_zarr()
+        else:
+            raise NotImplementedError(f'File format {file_format} unknown!')
+
+        if self.metadata.get('format_version', 0) > FORMAT_VERSION:
+            raise ValueError(f'{path} has format version {self.metadata["format_version"]}, at most {FORMAT_VERSION} is supported')
+
+        self.channels = self.metadata['channels']
+        self.scale_factors_mV = np.array(self.metadata['scale_factors_mV'])
+        self.offsets_mV = np.array(self.metadata['offsets_mV'])
+        self.sample_interval_ns = self.metadata['sample_interval_ns']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.adc.shape[0]
+
+    def __getitem__(self, index):
+        return self.to_mV(self.adc[index])
+
+    def __iter__(self):
+        return (self[i_segment] for i_segment in range(len(self)))
+
+    def __repr__(self):
+        return f'RawReader({self.path!r}, segments={len(self)}, channels={self.channels}, samples={self.adc.shape[2]})'
+
+    def _open_binary(self):
+
+        with open(f'{self.path}.json') as sidecar:
+            self.metadata = json.load(sidecar)
+
+        # only the segments covered by the sidecar, the writer may have appended more since
+        n_segments = self.metadata['n_segments']
+        record_shape = tuple(self.metadata['record_shape'] or (len(self.metadata['channels']), 0))
+        if n_segments == 0 or record_shape[1] == 0:
+            self.adc = np.empty((0,) + record_shape, dtype=np.int16)
+            self.t0s = np.empty(0, dtype=np.float64)
+        else:
+            self.adc = np.memmap(f'{self.path}.bin', dtype=np.int16, mode='r', shape=(n_segments,) + record_shape)
+            self.t0s = np.memmap(f'{self.path}.t0.bin', dtype=np.float64, mode='r', shape=(n_segments,))
+
+    def _open_hdf5(self):
+
+        try:
+            import h5py
+        except ImportError as exc:
+            raise ImportError('Reading HDF5 files requires h5py') from exc
+
+        self.file = h5py.File(self.path, 'r')
+        self.metadata = json.loads(self.file.attrs['metadata'])
+        self.adc = self.file['adc']
+        self.t0s = self.file['t0']
+
+    def _open_zarr(self):
+
+        try:
+            import zarr
+        except ImportError as exc:
+            raise ImportError('Reading Zarr stores requires zarr') from exc
+
+        group = zarr.open_group(self.path, mode='r')
+        self.metadata = dict(group.attrs['metadata'])
+        self.adc = group['adc']
+        self.t0s = group['t0']
+
+    def close(self):
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.adc = None
+        self.t0s = None
+
+    def channel(self, channel_name):
+        '''
+        Method to get the (segments, samples) ADC counts of one channel, without reading them
+        '''
+
+        return self.adc[:, self.channels.index(channel_name)]
+
+    def to_mV(self, block_adc, out = None):
+        '''
+        Method to convert ADC counts of shape (channels, samples) or (segments, channels,
+        samples), as read from adc, to mV
+        '''
+
+        block_adc = np.asarray(block_adc)
+        if block_adc.ndim == 2:
+            return adc2mV_block(block_adc, self.scale_factors_mV, self.offsets_mV, out=out, dtype=self.dtype)
+
+        # channels on the first axis for the conversion, the result is swapped back
+        if out is not None:
+            out = out.swapaxes(0, 1)
+        return adc2mV_block(block_adc.swapaxes(0, 1), self.scale_factors_mV, self.offsets_mV, out=out, dtype=self.dtype).swapaxes(0, 1)
+
+    def times(self, index = slice(None)):
+        '''
+        Method to get the time axes in ns of the given segments, a TimeAxis for a single
+        segment and a SegmentedTimeAxis otherwise
+        '''
+
+        n_samples = self.adc.shape[2]
+        if isinstance(index, (int, np.integer)):
+            return TimeAxis(self.t0s[index], self.sample_interval_ns, n_samples)
+
+        return SegmentedTimeAxis(np.asarray(self.t0s[index]), self.sample_interval_ns, n_samples)
+
+    def block(self, index = slice(None)):
+        '''
+        Method to read the given segments into a CaptureBlock, (channels, segments, samples)
+        as returned by the acquisitions with as_block
+        '''
+
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, index + 1 if index != -1 else None)
+        records = np.asarray(self.adc[index])
+
+        return CaptureBlock(records.swapaxes(0, 1), self.channels, self.scale_factors_mV, self.sample_interval_ns,
+                            offsets_mV=self.offsets_mV, n_pretrigger_samples=self.metadata.get('n_pretrigger_samples') or 0,
+                            t0s=np.asarray(self.t0s[index]))
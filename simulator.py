@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+
+'''Simulated ps6000a driver to run the acquisition code without a PicoScope
+'''
+
+import ctypes
+import sys
+import threading
+import time
+import numpy as np
+from picosdk.constants import PICO_STATUS
+
+# values of picoEnum, which can not be imported before the library is loaded
+PICO_RATIO_MODE_AGGREGATE = 1
+PICO_RATIO_MODE_DECIMATE = 2
+PICO_RATIO_MODE_AVERAGE = 4
+PICO_RATIO_MODE_RAW = 0x80000000
+PICO_CLEAR_ALL = 0x00000001
+
+# max ADC count per resolution (8 and 10 bit), 32767 for the others
+MAX_ADC = {0: 32512, 10: 32704}
+
+def _value(arg):
+    return arg.value if hasattr(arg, 'value') else arg
+
+def _target(arg):
+    # the ctypes object referenced by a byref() argument
+    return arg._obj if hasattr(arg, '_obj') else arg
+
+def _address(arg):
+
+    if arg is None or isinstance(arg, int):
+        return arg
+    if isinstance(arg, ctypes.c_void_p):
+        return arg.value
+    if hasattr(arg, '_obj'):
+        return ctypes.addressof(arg._obj)
+    if isinstance(arg, ctypes._Pointer):
+        return ctypes.cast(arg, ctypes.c_void_p).value
+
+    return ctypes.addressof(arg)
+
+def _int16_array(address, n_samples):
+    return np.ctypeslib.as_array((ctypes.c_int16 * n_samples).from_address(address))
+
+class SimulatedUnit:
+    '''
+    State of one simulated 6000 A series unit
+    '''
+
+    def __init__(self, serial, resolution, config):
+
+        self.serial = serial
+        self.resolution = resolution
+        self.config = config
+        self.rng = np.random.default_rng(config['seed'])
+        self.channels = {}
+        self.buffers = {}
+        self.n_segments = 1
+        self.n_captures = 1
+        self.auto_trigger_us = 0
+        self.block = None
+        self.ready_at = None
+        self.streaming = None
+        self.timestamp = 0
+        self.templates = {}
+
+    @property
+    def max_adc(self):
+        return MAX_ADC.get(self.resolution, 32767)
+
+    def waveforms(self, n_segments, n_pretrigger, n_samples):
+        '''
+        Method to get synthetic detector pulses starting at the trigger point on top of
+        gaussian noise, of shape (segments, samples). With waveform_cache a set of
+        cache_segments pulses is generated once and repeated, so the simulation does not
+        dominate the timing of the host code.
+        '''
+
+        if not self.config['waveform_cache']:
+            return self._generate(n_segments, n_pretrigger, n_samples)
+
+        key = (n_pretrigger, n_samples, self.resolution)
+        if key not in self.templates:
+            self.templates[key] = self._generate(self.config['cache_segments'], n_pretrigger, n_samples)
+        template = self.templates[key]
+
+        return template[np.arange(n_segments) % len(template)]
+
+    def _generate(self, n_segments, n_pretrigger, n_samples):
+
+        noise = self.config['noise_adc']
+        data = self.rng.normal(0., noise, size=(n_segments, n_samples)) if noise else np.zeros((n_segments, n_samples))
+        amplitude = self.rng.uniform(0.2, 0.8, size=(n_segments, 1)) * self.max_adc
+        t = np.clip(np.arange(n_samples) - n_pretrigger, 0, None)
+        shape = np.exp(-t / self.config['pulse_fall_samples']) - np.exp(-t / self.config['pulse_rise_samples'])
+        shape[:n_pretrigger] = 0.
+        if shape.max() > 0:
+            shape /= shape.max()
+        data += self.config['polarity'] * amplitude * shape
+
+        return np.clip(data, -self.max_adc, self.max_adc).astype(np.int16)
+
+class SimulatedLibrary:
+    '''
+    Stand-in for the ctypes library of libps6000a. Every ps6000a* function the picosdk
+    wrappers look up resolves to a method of this class (or to a no-op returning PICO_OK),
+    after sleeping for call_latency_s. Block captures take the time of their triggers,
+    drawn at trigger_rate_hz, and streaming produces samples in real time unless realtime
+    is False, in which case every poll fills the buffers. In real time the samples taken
+    while the driver waits for data buffers are lost, as without spare device memory. The
+    number of calls and the time spent in the driver are counted per function in calls and
+    driver_time_s.
+    '''
+
+    def __init__(self, **config):
+
+        self.config = {
+            'call_latency_s': 0.,
+            'trigger_rate_hz': 1e5,
+            'rearm_time_s': 1e-6,
+            'realtime': True,
+            'noise_adc': 50.,
+            'pulse_rise_samples': 2.,
+            'pulse_fall_samples': 20.,
+            'polarity': -1,
+            'waveform_cache': True,
+            'cache_segments': 64,
+            'memory_samples': 2**31,
+            'serials': ['SIM0001'],
+            'seed': 1234
+        }
+        unknown = set(config) - set(self.config)
+        if unknown:
+            raise ValueError(f'Unknown simulator settings {sorted(unknown)}')
+        self.config.update(config)
+
+        self.units = {}
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.driver_time_s = {}
+
+    def __getattr__(self, name):
+
+        if not name.startswith('ps6000a'):
+            raise AttributeError(name)
+        implementation = getattr(type(self), '_' + name[len('ps6000a'):], None)
+
+        def function(*args):
+            start = time.perf_counter()
+            if self.config['call_latency_s']:
+                time.sleep(self.config['call_latency_s'])
+            result = PICO_STATUS['PICO_OK'] if implementation is None else implementation(self, *args)
+            with self.lock:
+                self.calls[name] = self.calls.get(name, 0) + 1
+                self.driver_time_s[name] = self.driver_time_s.get(name, 0.) + time.perf_counter() - start
+            return result
+
+        function.__name__ = name
+        self.__dict__[name] = function
+
+        return function
+
+    def reset_counters(self):
+
+        with self.lock:
+            self.calls = {}
+            self.driver_time_s = {}
+
+    def unit(self, handle):
+        return self.units[_value(handle)]
+
+    @staticmethod
+    def interval_ns(timebase):
+        return 2**timebase / 5. if timebase < 5 else (timebase - 4) / 156.25e-3
+
+    @staticmethod
+    def nearest_timebase(interval_ns):
+
+        if interval_ns < 3.2:
+            return max(0, int(round(np.log2(interval_ns * 5))))
+
+        return int(round(interval_ns * 156.25e-3 + 4))
+
+    # device handling
+    def _OpenUnit(self, handle, serial, resolution):
+
+        serial = serial.decode() if isinstance(serial, bytes) else _value(serial)
+        with self.lock:
+            opened = {unit.serial for unit in self.units.values()}
+            candidates = [cur_serial for cur_serial in self.config['serials'] if cur_serial not in opened and serial in (None, cur_serial)]
+            if not candidates:
+                return PICO_STATUS['PICO_NOT_FOUND']
+            new_handle = max(self.units, default=0) + 1
+            self.units[new_handle] = SimulatedUnit(candidates[0], _value(resolution), dict(self.config, seed=self.config['seed'] + new_handle))
+        _target(handle).value = new_handle
+
+        return PICO_STATUS['PICO_OK']
+
+    def _CloseUnit(self, handle):
+
+        self.units.pop(_value(handle), None)
+        return PICO_STATUS['PICO_OK']
+
+    def _EnumerateUnits(self, count, serials, serial_length):
+
+        opened = {unit.serial for unit in self.units.values()}
+        text = ','.join(serial for serial in self.config['serials'] if serial not in opened).encode()
+        _target(count).value = len(self.config['serials']) - len(opened)
+        if serials is not None:
+            ctypes.memmove(serials, text, min(len(text), _target(serial_length).value))
+        _target(serial_length).value = len(text)
+
+        return PICO_STATUS['PICO_OK']
+
+    def _SetDeviceResolution(self, handle, resolution):
+
+        self.unit(handle).resolution = _value(resolution)
+        return PICO_STATUS['PICO_OK']
+
+    def _GetAdcLimits(self, handle, resolution, min_adc, max_adc):
+
+        limit = MAX_ADC.get(_value(resolution), 32767)
+        _target(min_adc).value = -limit
+        _target(max_adc).value = limit
+
+        return PICO_STATUS['PICO_OK']
+
+    def _SetChannelOn(self, handle, channel, coupling, channel_range, offset, bandwidth):
+
+        self.unit(handle).channels[_value(channel)] = (_value(coupling), _value(channel_range), _value(offset))
+        return PICO_STATUS['PICO_OK']
+
+    def _SetChannelOff(self, handle, channel):
+
+        self.unit(handle).channels.pop(_value(channel), None)
+        return PICO_STATUS['PICO_OK']
+
+    # timebases
+    def _GetMinimumTimebaseStateless(self, handle, flags, timebase, interval_s, resolution):
+
+        _target(timebase).value = 0
+        _target(interval_s).value = self.interval_ns(0) * 1e-9
+
+        return PICO_STATUS['PICO_OK']
+
+    def _NearestSampleIntervalStateless(self, handle, flags, interval_requested_s, resolution, timebase, interval_available_s):
+
+        cur_timebase = self.nearest_timebase(_value(interval_requested_s) * 1e9)
+        _target(timebase).value = cur_timebase
+        _target(interval_available_s).value = self.interval_ns(cur_timebase) * 1e-9
+
+        return PICO_STATUS['PICO_OK']
+
+    def _GetTimebase(self, handle, timebase, n_samples, interval_ns, max_samples, segment_index):
+
+        unit = self.unit(handle)
+        if interval_ns is not None:
+            _target(interval_ns).value = self.interval_ns(_value(timebase))
+        if max_samples is not None:
+            _target(max_samples).value = self.config['memory_samples'] // max(1, unit.n_segments) // max(1, len(unit.channels))
+
+        return PICO_STATUS['PICO_OK']
+
+    # memory and buffers
+    def _MemorySegments(self, handle, n_segments, max_samples):
+
+        unit = self.unit(handle)
+        unit.n_segments = _value(n_segments)
+        if max_samples is not None:
+            _target(max_samples).value = self.config['memory_samples'] // unit.n_segments
+
+        return PICO_STATUS['PICO_OK']
+
+    def _SetNoOfCaptures(self, handle, n_captures):
+
+        self.unit(handle).n_captures = _value(n_captures)
+        return PICO_STATUS['PICO_OK']
+
+    def _GetNoOfCaptures(self, handle, n_captures):
+
+        unit = self.unit(handle)
+        _target(n_captures).value = unit.block['completed'] if unit.block else 0
+
+        return PICO_STATUS['PICO_OK']
+
+    def _SetDataBuffers(self, handle, channel, buffer_max, buffer_min, n_samples, data_type, waveform, mode, action):
+
+        unit = self.unit(handle)
+        if _value(action) & PICO_CLEAR_ALL:
+            unit.buffers.clear()
+        if _address(buffer_max) is not None or _address(buffer_min) is not None:
+            unit.buffers[_value(channel), _value(waveform), _value(mode)] = (_address(buffer_max), _address(buffer_min), _value(n_samples))
+
+        return PICO_STATUS['PICO_OK']
+
+    def _SetDataBuffer(self, handle, channel, buffer, n_samples, data_type, waveform, mode, action):
+
+        unit = self.unit(handle)
+        if _value(action) & PICO_CLEAR_ALL:
+            unit.buffers.clear()
+        key = (_value(channel), _value(waveform), _value(mode))
+        if unit.streaming is not None and not unit.streaming['stopped']:
+            # buffers handed over during streaming are used once the current ones are full, the
+            # samples taken while the driver was waiting for them are lost in real time
+            streaming = unit.streaming
+            streaming['next'].setdefault(key[0], []).append((_address(buffer), _value(n_samples)))
+            if self.config['realtime'] and any(current[2] >= current[1] for current in streaming['buffers'].values()):
+                streaming.setdefault('resume_at', int((time.perf_counter() - streaming['start']) / streaming['interval_s']))
+        else:
+            unit.buffers[key] = (_address(buffer), None, _value(n_samples))
+
+        return PICO_STATUS['PICO_OK']
+
+    # triggers
+    def _SetTriggerChannelProperties(self, handle, properties, n_properties, aux_enable, auto_trigger_us):
+
+        self.unit(handle).auto_trigger_us = _value(auto_trigger_us)
+        return PICO_STATUS['PICO_OK']
+
+    # block mode
+    def _RunBlock(self, handle, n_pretrigger, n_posttrigger, timebase, time_indisposed_ms, segment_index, lp_ready, parameter):
+
+        unit = self.unit(handle)
+        n_pretrigger, n_posttrigger = _value(n_pretrigger), _value(n_posttrigger)
+        dt_s = self.interval_ns(_value(timebase)) * 1e-9
+
+        # exponential trigger gaps, the counters of the trigger times are in sample intervals
+        n_captures = unit.n_captures
+        gaps = unit.rng.exponential(1. / self.config['trigger_rate_hz'], size=n_captures) + self.config['rearm_time_s']
+        if unit.auto_trigger_us:
+            gaps = np.minimum(gaps, unit.auto_trigger_us * 1e-6)
+        duration = float(np.sum(gaps)) + n_captures * (n_pretrigger + n_posttrigger) * dt_s
+        counters = unit.timestamp + np.cumsum(np.round(gaps / dt_s).astype(np.uint64) + np.uint64(n_pretrigger + n_posttrigger))
+        unit.timestamp = int(counters[-1])
+
+        unit.block = {'n_pretrigger': n_pretrigger, 'n_samples': n_pretrigger + n_posttrigger, 'first_segment': _value(segment_index),
+                      'n_captures': n_captures, 'completed': n_captures, 'timestamps': counters, 'duration_s': duration,
+                      'timers': []}
+        unit.ready_at = time.perf_counter() + duration
+        if time_indisposed_ms is not None:
+            _target(time_indisposed_ms).value = int(duration * 1e3)
+        if lp_ready is not None:
+            unit.block['timers'].append(threading.Timer(duration, lp_ready, args=(_value(handle), PICO_STATUS['PICO_OK'], _address(parameter))))
+        for timer in unit.block['timers']:
+            timer.daemon = True
+            timer.start()
+
+        return PICO_STATUS['PICO_OK']
+
+    def _IsReady(self, handle, ready):
+
+        unit = self.unit(handle)
+        _target(ready).value = int(unit.ready_at is not None and time.perf_counter() >= unit.ready_at)
+
+        return PICO_STATUS['PICO_OK']
+
+    def _Stop(self, handle):
+
+        unit = self.units.get(_value(handle))
+        if unit is None:
+            return PICO_STATUS['PICO_OK']
+
+        unit.streaming = None
+        now = time.perf_counter()
+        if unit.block is not None and unit.ready_at is not None and now < unit.ready_at:
+            # a stopped capture keeps the segments taken so far
+            started_at = unit.ready_at - unit.block['duration_s']
+            elapsed = (now - started_at) / max(unit.ready_at - started_at, 1e-12)
+            unit.block['completed'] = int(unit.block['n_captures'] * min(1., elapsed))
+            unit.ready_at = now
+
+            # the stopped capture does not call back later
+            for timer in unit.block['timers']:
+                timer.cancel()
+
+        return PICO_STATUS['PICO_OK']
+
+    @staticmethod
+    def _reduce(raw, ratio, buffer_mode):
+        '''
+        Method to downsample (segments, samples) raw data like the scope does, returns (max, min)
+        '''
+
+        if buffer_mode == PICO_RATIO_MODE_RAW or ratio <= 1:
+            return raw, raw
+
+        n_out = -(-raw.shape[-1] // ratio)
+        pad = n_out * ratio - raw.shape[-1]
+        padded = np.concatenate([raw, np.repeat(raw[..., -1:], pad, axis=-1)], axis=-1).reshape(raw.shape[:-1] + (n_out, ratio))
+        if buffer_mode == PICO_RATIO_MODE_AGGREGATE:
+            return padded.max(axis=-1), padded.min(axis=-1)
+        if buffer_mode == PICO_RATIO_MODE_DECIMATE:
+            return padded[..., 0], padded[..., 0]
+
+        average = np.round(padded.mean(axis=-1)).astype(np.int16)
+        return average, average
+
+    def _GetValues(self, handle, start, n_samples, ratio, mode, segment_index, overflow):
+
+        return self._GetValuesBulk(handle, start, n_samples, segment_index, segment_index, ratio, mode, overflow)
+
+    def _GetValuesBulk(self, handle, start, n_samples, first, last, ratio, mode, overflow):
+
+        unit = self.unit(handle)
+        first, last, ratio, mode, start = _value(first), _value(last), max(1, _value(ratio)), _value(mode), _value(start)
+        block = unit.block
+        n_requested = min(_value(_target(n_samples)), block['n_samples'] - start)
+        raw = {channel: unit.waveforms(last - first + 1, block['n_pretrigger'], block['n_samples'])[:, start:start + n_requested]
+               for channel in unit.channels}
+
+        reduced = {}
+        n_written = 0
+        for (channel, waveform, buffer_mode), (address_max, address_min, buffer_samples) in unit.buffers.items():
+            if not first <= waveform <= last or not buffer_mode & mode or channel not in raw:
+                continue
+            if (channel, buffer_mode) not in reduced:
+                reduced[channel, buffer_mode] = self._reduce(raw[channel], ratio, buffer_mode)
+            reduced_max, reduced_min = reduced[channel, buffer_mode]
+            n_out = min(reduced_max.shape[-1], buffer_samples)
+            if address_max is not None:
+                _int16_array(address_max, buffer_samples)[:n_out] = reduced_max[waveform - first, :n_out]
+            if address_min is not None:
+                _int16_array(address_min, buffer_samples)[:n_out] = reduced_min[waveform - first, :n_out]
+            n_written = max(n_written, n_out)
+
+        _target(n_samples).value = n_written
+        if overflow is not None:
+            ctypes.memset(_address(overflow), 0, ctypes.sizeof(ctypes.c_int16) * (last - first + 1))
+
+        return PICO_STATUS['PICO_OK']
+
+    def _GetTriggerInfo(self, handle, trigger_infos, first, count):
+
+        unit = self.unit(handle)
+        infos = _target(trigger_infos)
+        first, count = _value(first), _value(count)
+        timestamps = unit.block['timestamps']
+        for i in range(count):
+            infos[i].status = PICO_STATUS['PICO_OK']
+            infos[i].segmentIndex = first + i
+            infos[i].timeStampCounter = int(timestamps[min(first + i, len(timestamps) - 1)])
+
+        return PICO_STATUS['PICO_OK']
+
+    # streaming
+    def _RunStreaming(self, handle, sample_interval, time_units, n_pretrigger, n_posttrigger, auto_stop, ratio, mode):
+
+        unit = self.unit(handle)
+        interval_s = _target(sample_interval).value * 10.**(3 * _value(time_units) - 15)
+        buffers = {}
+        for (channel, _, _), (address, _, n_samples) in unit.buffers.items():
+            buffers[channel] = [address, n_samples, 0]
+        unit.streaming = {'interval_s': interval_s, 'start': time.perf_counter(), 'produced': 0, 'buffers': buffers, 'next': {},
+                          'trigger_at': int(_value(n_pretrigger)), 'auto_stop': _value(auto_stop), 'stopped': False}
+
+        return PICO_STATUS['PICO_OK']
+
+    def _GetStreamingLatestValues(self, handle, infos, n_infos, trigger_info):
+
+        unit = self.unit(handle)
+        streaming = unit.streaming
+        infos = _target(infos)
+        if streaming['stopped']:
+            for i in range(_value(n_infos)):
+                infos[i].noOfSamples = 0
+            return PICO_STATUS['PICO_OK']
+
+        # switch to the next buffers when the current ones are full
+        if any(buffer[2] >= buffer[1] for buffer in streaming['buffers'].values()):
+            if not all(streaming['next'].get(channel) for channel in streaming['buffers']):
+                for i in range(_value(n_infos)):
+                    infos[i].noOfSamples = 0
+                return PICO_STATUS['PICO_WAITING_FOR_DATA_BUFFERS']
+            for channel in streaming['buffers']:
+                address, n_samples = streaming['next'][channel].pop(0)
+                streaming['buffers'][channel] = [address, n_samples, 0]
+            streaming['produced'] = max(streaming['produced'], streaming.pop('resume_at', 0))
+
+        n_new = min(buffer[1] - buffer[2] for buffer in streaming['buffers'].values())
+        if self.config['realtime']:
+            n_new = min(n_new, int((time.perf_counter() - streaming['start']) / streaming['interval_s']) - streaming['produced'])
+        n_new = max(n_new, 0)
+
+        # 1 kHz sine wave at half of the full scale
+        t = np.arange(streaming['produced'], streaming['produced'] + n_new) * streaming['interval_s']
+        signal = (0.5 * unit.max_adc * np.sin(2 * np.pi * 1e3 * t)).astype(np.int16)
+        for i in range(_value(n_infos)):
+            address, n_samples, filled = streaming['buffers'][infos[i].channel]
+            _int16_array(address, n_samples)[filled:filled + n_new] = signal
+            infos[i].startIndex = filled
+            infos[i].noOfSamples = n_new
+            infos[i].overflow = 0
+        for buffer in streaming['buffers'].values():
+            buffer[2] += n_new
+
+        _target(trigger_info).triggered = int(streaming['produced'] <= streaming['trigger_at'] < streaming['produced'] + n_new)
+        _target(trigger_info).triggerAt = streaming['trigger_at'] - streaming['produced'] + infos[0].startIndex
+        streaming['produced'] += n_new
+
+        full = any(buffer[2] >= buffer[1] for buffer in streaming['buffers'].values())
+        if full and not streaming['auto_stop']:
+            return PICO_STATUS['PICO_WAITING_FOR_DATA_BUFFERS']
+        # with auto stop the capture ends when the buffers are full
+        streaming['stopped'] = full
+
+        return PICO_STATUS['PICO_OK']
+
+def install(**config):
+    '''
+    Method to route the picosdk ps6000a wrappers to a SimulatedLibrary with the given
+    settings (see SimulatedLibrary). Must be called before picosdk.ps6000a, or anything
+    importing it, is imported. Returns the simulated library.
+    '''
+
+    from picosdk.library import Library
+
+    if 'picosdk.ps6000a' in sys.modules or 'picosdk.PicoDeviceEnums' in sys.modules:
+        raise RuntimeError('The simulated driver must be installed before picosdk.ps6000a is imported')
+
+    library = SimulatedLibrary(**config)
+    Library._load = lambda self: library
+
+    return library
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+'''Software trigger and zero-suppression of streamed data
+'''
+
+from collections import namedtuple
+import numpy as np
+
+from .timing import SegmentedTimeAxis
+
+TriggeredEvents = namedtuple('TriggeredEvents', ['data', 'times', 'trigger_samples', 'overflow'])
+
+def _run_edges(mask):
+    '''
+    Method to get the first and last indices of the runs of True in a boolean array
+    '''
+
+    padded = np.zeros(len(mask) + 2, dtype=bool)
+    padded[1:-1] = mask
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+
+    return changes[::2], changes[1::2] - 1
+
+class _ChannelTrigger:
+    '''
+    Threshold crossing with hysteresis of one channel: it fires when the signal reaches the
+    threshold after it has been beyond threshold - hysteresis (re-armed) since the last time
+    it was over the threshold. The state is kept from one chunk to the next.
+    '''
+
+    def __init__(self, threshold, hysteresis, rising):
+
+        self.sign = 1 if rising else -1
+        self.threshold = self.sign * threshold
+        self.rearm_level = self.threshold - abs(hysteresis)
+        self.armed = False
+        self.last_above = False
+
+    def reset(self):
+
+        self.armed = False
+        self.last_above = False
+
+    def crossings(self, values):
+        '''
+        Method to get the indices of the crossings in a chunk of ADC counts
+        '''
+
+        values = values if self.sign > 0 else -values.astype(np.int32)
+        above = values >= self.threshold
+        below = values < self.rearm_level
+
+        above_starts, above_ends = _run_edges(above)
+        below_starts, _ = _run_edges(below)
+
+        # a run above the threshold fires if the signal was re-armed since the previous run ended
+        previous_ends = np.empty(len(above_starts), dtype=np.intp)
+        previous_ends[:1] = -1
+        previous_ends[1:] = above_ends[:-1]
+        n_arms_before = np.searchsorted(below_starts, above_starts)
+        n_arms_after_previous = np.searchsorted(below_starts, previous_ends, side='right')
+        fires = n_arms_before > n_arms_after_previous
+        if len(fires) > 0 and above_starts[0] == 0 and self.last_above:
+            # the signal is still over the threshold from the previous chunk
+            fires[0] = False
+        elif len(fires) > 0 and self.armed:
+            fires[0] = True
+
+        # state at the end of the chunk
+        last_above = above_ends[-1] if len(above_ends) > 0 else -1
+        last_arm = below_starts[-1] if len(below_starts) > 0 else -1
+        if last_above >= 0 or last_arm >= 0:
+            self.armed = last_arm > last_above
+        if len(values) > 0:
+            self.last_above = bool(above[-1])
+
+        return above_starts[fires]
+
+class SoftwareTrigger:
+    '''
+    Software trigger turning a stream of (channels, samples) int16 chunks into events with
+    n_pretrigger_samples before and n_posttrigger_samples after the trigger, the samples in
+    between are dropped. Every trigger channel (index into the channel axis) has a threshold
+    in ADC counts, a direction ('RISING' or 'FALLING', also with PICO_ prefix) and a
+    hysteresis in counts. An event needs n_coincidence (default: all) trigger channels to
+    fire within coincidence_samples, it is placed at the crossing completing the
+    coincidence, and further triggers are ignored for holdoff_samples (default: the
+    posttrigger samples, so windows do not overlap). Crossings and windows spanning chunk
+    boundaries are handled, the chunks must be consecutive unless reset() is called.
+    '''
+
+    def __init__(self, trigger_channels, thresholds, directions, n_pretrigger_samples, n_posttrigger_samples, **kwargs):
+
+        hysteresis = kwargs.get('hysteresis', [0] * len(trigger_channels))
+        self.trigger_channels = list(trigger_channels)
+        self.channel_triggers = [
+            _ChannelTrigger(threshold, cur_hysteresis, direction.replace('PICO_', '') == 'RISING')
+            for threshold, direction, cur_hysteresis in zip(thresholds, directions, hysteresis)
+        ]
+        for direction in directions:
+            if direction.replace('PICO_', '') not in ('RISING', 'FALLING'):
+                raise ValueError(f'Trigger direction {direction} not supported, use RISING or FALLING')
+
+        self.n_pretrigger_samples = n_pretrigger_samples
+        self.n_posttrigger_samples = n_posttrigger_samples
+        self.n_samples = n_pretrigger_samples + n_posttrigger_samples
+        self.coincidence_samples = kwargs.get('coincidence_samples', 0)
+        self.n_coincidence = kwargs.get('n_coincidence', None) or len(self.trigger_channels)
+        self.holdoff_samples = kwargs.get('holdoff_samples', None)
+        if self.holdoff_samples is None:
+            self.holdoff_samples = n_posttrigger_samples
+        self.sample_interval_ns = kwargs.get('sample_interval_ns', 1.)
+
+        # keep track of the triggers and the dropped data
+        self.n_triggers = 0
+        self.n_events = 0
+        self.n_incomplete = 0  # events without all pretrigger samples at the start or a gap
+        self.n_samples_seen = 0
+
+        self.reset()
+
+    def reset(self):
+        '''
+        Method to forget the state of the stream, e.g. after samples were lost
+        '''
+
+        for channel_trigger in self.channel_triggers:
+            channel_trigger.reset()
+        self.tail = None  # last samples of the previous chunks, (channels, <= n_samples)
+        self.next_sample = None
+        self.recent_crossings = [np.empty(0, dtype=np.int64) for _ in self.channel_triggers]
+        self.pending = np.empty(0, dtype=np.int64)  # triggers still waiting for their posttrigger samples
+        self.last_trigger = None
+
+    def _coincidences(self, crossings):
+        '''
+        Method to get the samples where n_coincidence channels have crossed within the
+        coincidence window, from the (absolute) crossings of every channel
+        '''
+
+        if len(crossings) == 1:
+            return crossings[0]
+
+        candidates = np.unique(np.concatenate(crossings))
+        n_fired = np.zeros(len(candidates), dtype=np.intp)
+        for channel_crossings in crossings:
+            first = np.searchsorted(channel_crossings, candidates - self.coincidence_samples)
+            last = np.searchsorted(channel_crossings, candidates, side='right')
+            n_fired += last > first
+
+        return candidates[n_fired >= self.n_coincidence]
+
+    def _apply_holdoff(self, triggers):
+
+        accepted = []
+        for trigger in triggers:
+            if self.last_trigger is None or trigger >= self.last_trigger + self.holdoff_samples:
+                accepted.append(trigger)
+                self.last_trigger = trigger
+
+        return np.array(accepted, dtype=np.int64)
+
+    def process(self, data, first_sample = None, overflow = 0):
+        '''
+        Method to run the trigger on the next (channels, samples) chunk starting at sample
+        first_sample of the run. Returns the TriggeredEvents completed with this chunk, data
+        of shape (channels, events, samples) like a rapidBlock capture and times whose t0s
+        are the times in ns of the first sample of every window since the start of the run.
+        '''
+
+        if first_sample is None:
+            first_sample = self.next_sample or 0
+        if self.next_sample is not None and first_sample != self.next_sample:
+            # samples were lost, the pending windows can not be completed
+            self.n_incomplete += len(self.pending)
+            self.reset()
+        n_new = data.shape[1]
+        self.n_samples_seen += n_new
+
+        # crossings of every trigger channel, with the ones of the previous chunks still in the window
+        crossings = []
+        for i_trigger, (channel, channel_trigger) in enumerate(zip(self.trigger_channels, self.channel_triggers)):
+            channel_crossings = first_sample + channel_trigger.crossings(data[channel]).astype(np.int64)
+            channel_crossings = np.concatenate([self.recent_crossings[i_trigger], channel_crossings])
+            crossings.append(channel_crossings)
+            self.recent_crossings[i_trigger] = channel_crossings[channel_crossings >= first_sample + n_new - self.coincidence_samples]
+
+        triggers = self._coincidences(crossings)
+        triggers = triggers[triggers >= first_sample]
+        self.n_triggers += len(triggers)
+        triggers = np.concatenate([self.pending, self._apply_holdoff(triggers)])
+
+        # windows that are complete with this chunk, the others wait for the next one
+        end_sample = first_sample + n_new
+        complete = triggers + self.n_posttrigger_samples <= end_sample
+        self.pending = triggers[~complete]
+        triggers = triggers[complete]
+
+        tail_first = first_sample - (0 if self.tail is None else self.tail.shape[1])
+        has_pretrigger = triggers - self.n_pretrigger_samples >= tail_first
+        self.n_incomplete += np.count_nonzero(~has_pretrigger)
+        triggers = triggers[has_pretrigger]
+
+        events_data = self._windows(data, first_sample, triggers)
+        self.n_events += len(triggers)
+
+        # keep the samples the pending and upcoming windows may need
+        if n_new >= self.n_samples or self.tail is None:
+            self.tail = data[:, -self.n_samples:].copy()
+        else:
+            self.tail = np.concatenate([self.tail, data], axis=1)[:, -self.n_samples:]
+        self.next_sample = end_sample
+
+        t0s = (triggers - self.n_pretrigger_samples) * self.sample_interval_ns
+        times = SegmentedTimeAxis(t0s, self.sample_interval_ns, self.n_samples)
+
+        return TriggeredEvents(events_data, times, triggers, np.full(len(triggers), overflow, dtype=np.int16))
+
+    def _windows(self, data, first_sample, triggers):
+        '''
+        Method to cut the (channels, events, samples) windows around the triggers out of
+        the chunk, windows starting before the chunk come from the tail of the previous ones
+        '''
+
+        starts = triggers - self.n_pretrigger_samples
+        offsets = np.arange(self.n_samples)
+        in_chunk = starts >= first_sample
+
+        events_data = np.empty((data.shape[0], len(triggers), self.n_samples), dtype=data.dtype)
+        if np.any(in_chunk):
+            events_data[:, in_chunk] = data[:, (starts[in_chunk] - first_sample)[:, np.newaxis] + offsets]
+        if not np.all(in_chunk):
+            # only the beginning of the chunk is needed, the windows end before first_sample + n_samples
+            joined = np.concatenate([self.tail, data[:, :self.n_samples]], axis=1)
+            joined_first = first_sample - self.tail.shape[1]
+            events_data[:, ~in_chunk] = joined[:, (starts[~in_chunk] - joined_first)[:, np.newaxis] + offsets]
+
+        return events_data
+
+def trigger_stream(chunks, software_trigger):
+    '''
+    Generator running a SoftwareTrigger on StreamChunks, e.g. from stream_channels, and
+    yielding the TriggeredEvents of every chunk that completes at least one event
+    '''
+
+    for chunk in chunks:
+        events = software_trigger.process(chunk.data, chunk.first_sample, chunk.overflow)
+        if len(events.trigger_samples) > 0:
+            yield events
@@ -0,0 +1,41 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+import pytest
+
+# the repository is the pico_acq package, register it under that name whatever the checkout is called
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if 'pico_acq' not in sys.modules:
+    spec = importlib.machinery.ModuleSpec('pico_acq', None, is_package=True)
+    spec.submodule_search_locations = [REPOSITORY]
+    sys.modules['pico_acq'] = importlib.util.module_from_spec(spec)
+
+from pico_acq import simulator
+
+# the simulated driver has to be in place before picosdk.ps6000a is imported, once for all tests;
+# every streaming poll fills the driver buffers, so the tests do not wait for the samples
+LIBRARY = simulator.install(realtime=False)
+
+from pico_acq.PS6000a import PS6000a
+
+@pytest.fixture
+def driver():
+
+    # the simulated library, settings changed by a test are restored after it
+    config = dict(LIBRARY.config)
+    LIBRARY.reset_counters()
+    yield LIBRARY
+    LIBRARY.config.clear()
+    LIBRARY.config.update(config)
+
+@pytest.fixture
+def scope(driver):
+
+    # the settings of the simulator are taken when the unit is opened
+    scope = PS6000a()
+    scope.activate_channels(['A', 'B'], ['PICO_1V', 'PICO_1V'], ['PICO_DC', 'PICO_DC'])
+    yield scope
+    scope.close()
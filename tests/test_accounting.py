@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from pico_acq.accounting import RunAccounting
+from pico_acq.timing import SegmentedTimeAxis
+
+DT_NS = 0.8
+N_SAMPLES = 125  # 100 ns capture window
+
+def capture(intervals_ns):
+    return SegmentedTimeAxis(np.concatenate(([0.], np.cumsum(intervals_ns))), DT_NS, N_SAMPLES)
+
+def test_batch_rates():
+
+    accounting = RunAccounting(rearm_time_ns = 900.)
+    batch = accounting.update(capture([2000., 3000., 5000.]), 0., 1e-5, 2e-5)
+
+    assert batch.n_segments == 4
+    assert batch.trigger_rate_hz == pytest.approx(3 / 10000e-9)
+    # every interval holds a 100 ns window and a 900 ns rearm
+    assert batch.true_rate_hz == pytest.approx(3 / 7000e-9)
+    assert batch.readout_dead_s == pytest.approx(1e-5)
+
+def test_summary_rates_match_the_batches():
+
+    accounting = RunAccounting(rearm_time_ns = 900.)
+    batch = accounting.update(capture([2000., 3000., 5000.]), 0., 1e-5, 2e-5)
+    summary = accounting.summary()
+    assert summary['trigger_rate_hz'] == pytest.approx(batch.trigger_rate_hz)
+    assert summary['true_rate_hz'] == pytest.approx(batch.true_rate_hz)
+
+    # the run rates are the ones of all intervals together
+    accounting.update(capture([1500., 1500.]), 3e-5, 4e-5, 5e-5)
+    summary = accounting.summary()
+    assert summary['n_segments'] == 7
+    assert summary['trigger_rate_hz'] == pytest.approx(5 / 13000e-9)
+    assert summary['true_rate_hz'] == pytest.approx(5 / 8000e-9)
+    assert summary['processing_dead_s'] == pytest.approx(1e-5)
@@ -0,0 +1,21 @@
+import asyncio
+
+from pico_acq.AsyncPS6000a import AsyncPS6000a
+
+def test_events(driver):
+
+    # the example of the class docstring, with the default acquisition window
+    async def run():
+        captures = []
+        async with await AsyncPS6000a.open() as scope:
+            await scope.activate_channels(['A'], ['PICO_1V'], ['PICO_DC'])
+            async for waveform_mV, times in scope.events(0.8, n_captures = 3, number_segments = 100):
+                captures.append((waveform_mV['A'].shape, len(times)))
+        return captures
+
+    captures = asyncio.run(run())
+
+    assert len(captures) == 3
+    for (n_segments, n_samples), n_times in captures:
+        assert n_segments == n_times == 100
+        assert n_samples > 0
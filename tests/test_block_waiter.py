@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from pico_acq.utils import BlockWaiter, run_block
+
+TIMEBASE = 5  # 6.4 ns
+
+def arm(scope, waiter):
+    run_block(scope.status, scope.handle, 100, 100, TIMEBASE, waiter)
+
+@pytest.mark.parametrize('use_callback', [True, False])
+def test_wait_returns_when_the_capture_is_complete(scope, use_callback):
+
+    waiter = BlockWaiter(use_callback = use_callback)
+    arm(scope, waiter)
+    waiter.wait(5.)
+
+    assert waiter.future.done()
+    assert waiter.n_waits == 1
+    assert waiter.ready_at >= waiter.armed_at
+    # with the callback ps6000aIsReady is never called
+    assert (waiter.n_polls == 0) == use_callback
+
+@pytest.mark.parametrize('use_callback', [True, False])
+def test_timeout_stops_the_capture(scope, driver, use_callback):
+
+    driver.config['rearm_time_s'] = 10.
+    waiter = BlockWaiter(use_callback = use_callback)
+    arm(scope, waiter)
+    with pytest.raises(TimeoutError):
+        waiter.wait(0.05)
+
+    assert waiter.n_timeouts == 1
+    assert driver.calls['ps6000aStop'] >= 1
+
+@pytest.mark.parametrize('use_callback', [True, False])
+def test_cancel_from_another_thread(scope, driver, use_callback):
+
+    driver.config['rearm_time_s'] = 10.
+    waiter = BlockWaiter(use_callback = use_callback)
+    arm(scope, waiter)
+    threading.Timer(0.05, waiter.cancel).start()
+    with pytest.raises(CancelledError):
+        waiter.wait(5.)
+
+    assert waiter.n_cancelled == 1
+    assert driver.calls['ps6000aStop'] >= 1
+
+def test_late_callback_of_a_stopped_capture_is_ignored(scope, driver):
+
+    driver.config['rearm_time_s'] = 10.
+    waiter = BlockWaiter()
+    arm(scope, waiter)
+    stale_generation = waiter.generation
+    with pytest.raises(TimeoutError):
+        waiter.wait(0.01)
+
+    arm(scope, waiter)
+    waiter._block_ready(scope.handle, 0, stale_generation)
+    assert not waiter.future.done()
+
+    waiter._block_ready(scope.handle, 0, waiter.generation)
+    assert waiter.future.done()
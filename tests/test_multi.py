@@ -0,0 +1,29 @@
+import numpy as np
+
+from pico_acq.MultiPS6000a import MultiPS6000a
+from pico_acq.capture import CaptureBlock
+
+SERIALS = ['SIM0001', 'SIM0002']
+
+def test_acquire_events_on_all_units(driver):
+
+    driver.config['serials'] = SERIALS
+    # the example of the class docstring, with the default acquisition window
+    with MultiPS6000a() as scopes:
+        assert sorted(scopes.scopes) == SERIALS
+        scopes.activate_channels(['A', 'B'], ['PICO_1V', 'PICO_1V'], ['PICO_DC', 'PICO_DC'])
+        scopes.set_simple_trigger(-100., 'PICO_FALLING')
+        results, events = scopes.acquire_events(0.8, number_segments = 20, tolerance_ns = 10)
+
+        assert sorted(results) == SERIALS
+        default_samples = int(100 / 0.8)
+        for data, times in results.values():
+            assert data['A'].shape == (20, times.n)
+            assert abs(times.n - default_samples) <= 2
+            assert len(times.t0s) == 20
+
+        blocks, _ = scopes.acquire_events(0.8, number_segments = 20, tolerance_ns = 10, acq_window_ns = 200, as_block = True)
+        for block in blocks.values():
+            assert isinstance(block, CaptureBlock)
+            assert abs(block.n_samples - 2 * default_samples) <= 2
+            np.testing.assert_array_equal(block.t0s[0], 0.)
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+SAMPLE_INTERVAL_NS = 0.8
+ACQ_WINDOW_NS = 80.
+
+def acquire_block(scope, number_segments):
+    return scope.acquire(SAMPLE_INTERVAL_NS, mode = 'rapidBlock', number_segments = number_segments,
+                         acq_window_ns = ACQ_WINDOW_NS, as_block = True)
+
+def test_sliced_blocks_keep_the_trigger_information(scope):
+
+    block = acquire_block(scope, 10)
+    assert block.trigger_info is not None
+    assert len(block.trigger_info.timestamps) == 10
+
+    for segments in (slice(2, 5), slice(None, None, 3), 7, -1):
+        sliced = block[segments]
+        expected = np.atleast_1d(np.arange(10)[segments])
+        assert len(sliced) == len(expected)
+        np.testing.assert_array_equal(sliced.t0s, block.t0s[expected])
+        for field, sliced_field in zip(block.trigger_info, sliced.trigger_info):
+            np.testing.assert_array_equal(sliced_field, np.asarray(field)[expected])
+
+    copy = block.copy()
+    assert copy.adc is not block.adc
+    np.testing.assert_array_equal(copy.trigger_info.offsets, block.trigger_info.offsets)
+
+def test_events_are_collected_in_batches(scope):
+
+    blocks = list(scope.acquire_events(100, SAMPLE_INTERVAL_NS, acq_window_ns = ACQ_WINDOW_NS, max_segments = 30, as_block = True))
+
+    assert [len(block) for block in blocks] == [30, 30, 30, 10]
+
+def test_timed_out_batches_keep_the_completed_segments(scope, driver):
+
+    # about 20 triggers per batch timeout
+    driver.config['trigger_rate_hz'] = 1e3
+    blocks = list(scope.acquire_events(100, SAMPLE_INTERVAL_NS, acq_window_ns = ACQ_WINDOW_NS, batch_timeout_s = 0.02,
+                                       as_block = True))
+
+    assert sum(len(block) for block in blocks) == 100
+    assert len(blocks) > 1
+    assert driver.calls['ps6000aGetNoOfCaptures'] >= len(blocks) - 1
+    assert all(0 < len(block) < 100 for block in blocks)
+
+def test_no_trigger_raises_after_empty_batches(scope, driver):
+
+    driver.config['rearm_time_s'] = 10.
+    with pytest.raises(TimeoutError):
+        list(scope.acquire_events(10, SAMPLE_INTERVAL_NS, acq_window_ns = ACQ_WINDOW_NS, batch_timeout_s = 0.01,
+                                  max_empty_batches = 2))
+
+    assert driver.calls['ps6000aRunBlock'] == 2
+    assert driver.calls['ps6000aGetNoOfCaptures'] == 2
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from pico_acq.capture import CaptureBlock
+from pico_acq.reader import RawReader
+from pico_acq.timing import SegmentedTimeAxis
+from pico_acq.writer import RawWriter
+
+CHANNELS = ['A', 'B']
+SCALE_FACTORS_MV = [0.03, 0.06]
+OFFSETS_MV = [0., 100.]
+SAMPLE_INTERVAL_NS = 0.8
+
+FILE_NAMES = {'binary': 'run', 'hdf5': 'run.h5', 'zarr': 'run.zarr'}
+
+def random_blocks(n_blocks, n_segments, n_samples, seed = 1):
+
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for _ in range(n_blocks):
+        adc = rng.integers(-32000, 32000, size=(len(CHANNELS), n_segments, n_samples), dtype=np.int16)
+        t0s = np.sort(rng.uniform(0., 1e6, size=n_segments))
+        blocks.append((adc, SegmentedTimeAxis(t0s, SAMPLE_INTERVAL_NS, n_samples)))
+    return blocks
+
+@pytest.fixture(params=['binary', 'hdf5', 'zarr'])
+def file_format(request):
+
+    if request.param != 'binary':
+        pytest.importorskip({'hdf5': 'h5py', 'zarr': 'zarr'}[request.param])
+    return request.param
+
+def test_round_trip(tmp_path, file_format):
+
+    path = str(tmp_path / FILE_NAMES[file_format])
+    blocks = random_blocks(3, 5, 64)
+    with RawWriter(path, CHANNELS, SCALE_FACTORS_MV, SAMPLE_INTERVAL_NS, offsets_mV = OFFSETS_MV,
+                   n_pretrigger_samples = 16, file_format = file_format, chunk_segments = 4) as writer:
+        for adc, times in blocks:
+            writer.write(adc, times)
+        # a CaptureBlock brings its own times
+        adc, times = blocks[0]
+        writer.write(CaptureBlock(adc, CHANNELS, SCALE_FACTORS_MV, SAMPLE_INTERVAL_NS, t0s = times.t0s))
+    blocks.append(blocks[0])
+
+    with RawReader(path, file_format = file_format) as reader:
+        assert len(reader) == 20
+        assert reader.channels == CHANNELS
+        assert reader.sample_interval_ns == SAMPLE_INTERVAL_NS
+
+        adc = np.concatenate([adc for adc, _ in blocks], axis=1)
+        t0s = np.concatenate([times.t0s for _, times in blocks])
+        np.testing.assert_array_equal(np.asarray(reader.adc), adc.swapaxes(0, 1))
+        np.testing.assert_array_equal(np.asarray(reader.t0s), t0s)
+
+        # mV on the fly, the same conversion as the live acquisitions
+        expected_mV = adc * np.array(SCALE_FACTORS_MV)[:, None, None] - np.array(OFFSETS_MV)[:, None, None]
+        np.testing.assert_allclose(reader[7], expected_mV[:, 7], atol=1e-3)
+        np.testing.assert_allclose(reader[2:4], expected_mV[:, 2:4].swapaxes(0, 1), atol=1e-3)
+
+        block = reader.block(slice(5, 10))
+        assert block.n_pretrigger_samples == 16
+        np.testing.assert_array_equal(block.adc, adc[:, 5:10])
+        np.testing.assert_array_equal(block.t0s, t0s[5:10])
+        np.testing.assert_allclose(block.mV('B'), expected_mV[1, 5:10], atol=1e-3)
+
+def test_flushed_segments_are_visible(tmp_path, file_format):
+
+    path = str(tmp_path / FILE_NAMES[file_format])
+    (adc, times), = random_blocks(1, 4, 32)
+    with RawWriter(path, CHANNELS, SCALE_FACTORS_MV, SAMPLE_INTERVAL_NS, file_format = file_format) as writer:
+        writer.write(adc, times)
+        writer.flush()
+        with RawReader(path, file_format = file_format) as reader:
+            assert len(reader) == 4
+            np.testing.assert_array_equal(np.asarray(reader.adc), adc.swapaxes(0, 1))
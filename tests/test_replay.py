@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from pico_acq.ReplayPS6000a import ReplayPS6000a
+from pico_acq.writer import RawWriter
+
+SAMPLE_INTERVAL_NS = 0.8
+ACQ_WINDOW_NS = 80.
+NUMBER_SEGMENTS = 16
+
+@pytest.fixture
+def recording(scope, tmp_path):
+
+    # two rapidBlock captures of the simulator, saved as they come
+    path = str(tmp_path / 'run')
+    blocks = []
+    writer = None
+    for _ in range(2):
+        block = scope.acquire(SAMPLE_INTERVAL_NS, mode = 'rapidBlock', number_segments = NUMBER_SEGMENTS,
+                              acq_window_ns = ACQ_WINDOW_NS, as_block = True).copy()
+        if writer is None:
+            writer = scope.open_writer(path, SAMPLE_INTERVAL_NS, n_pretrigger_samples = block.n_pretrigger_samples)
+        writer.write(block)
+        blocks.append(block)
+    writer.close()
+
+    return path, blocks
+
+def test_replay_serves_the_recorded_captures(recording):
+
+    path, blocks = recording
+    with ReplayPS6000a(path, speed = None) as replay:
+        assert replay.n_records == 2 * NUMBER_SEGMENTS
+        for recorded in blocks:
+            block = replay.acquire(SAMPLE_INTERVAL_NS, mode = 'rapidBlock', number_segments = NUMBER_SEGMENTS,
+                                   acq_window_ns = ACQ_WINDOW_NS, as_block = True)
+            np.testing.assert_array_equal(block.adc, recorded.adc)
+            np.testing.assert_allclose(block.t0s, recorded.t0s)
+            np.testing.assert_allclose(block.scale_factors_mV, recorded.scale_factors_mV)
+            assert block.n_pretrigger_samples == recorded.n_pretrigger_samples
+
+        with pytest.raises(EOFError):
+            replay.acquire(SAMPLE_INTERVAL_NS, mode = 'rapidBlock', number_segments = 1, acq_window_ns = ACQ_WINDOW_NS)
+
+def test_replay_converts_like_the_scope(recording):
+
+    path, blocks = recording
+    with ReplayPS6000a(path, speed = None) as replay:
+        data, times = replay.acquire(SAMPLE_INTERVAL_NS, mode = 'rapidBlock', number_segments = NUMBER_SEGMENTS,
+                                     acq_window_ns = ACQ_WINDOW_NS)
+
+    assert set(data) == {'A', 'B'}
+    np.testing.assert_allclose(data['A'], blocks[0].mV('A'), rtol=1e-6)
+    np.testing.assert_allclose(times.values(), blocks[0].times.values())
+
+def test_replay_loops_over_the_recording(recording):
+
+    path, blocks = recording
+    with ReplayPS6000a(path, speed = None, loop = True) as replay:
+        for _ in range(3):
+            replay.acquire(SAMPLE_INTERVAL_NS, mode = 'rapidBlock', number_segments = NUMBER_SEGMENTS, acq_window_ns = ACQ_WINDOW_NS)
+        block = replay.acquire(SAMPLE_INTERVAL_NS, mode = 'rapidBlock', number_segments = NUMBER_SEGMENTS,
+                               acq_window_ns = ACQ_WINDOW_NS, as_block = True)
+
+    np.testing.assert_array_equal(block.adc, blocks[1].adc)
+
+@pytest.mark.parametrize('n_pretrigger_samples, expected', [(0, 0), (10, 10), (None, 32)])
+def test_recorded_pretrigger_samples(tmp_path, n_pretrigger_samples, expected):
+
+    # a recorded 0 is kept, half the samples are taken only if the writer did not know them
+    path = str(tmp_path / 'run')
+    adc = np.arange(2 * 3 * 64, dtype=np.int16).reshape(2, 3, 64)
+    with RawWriter(path, ['A', 'B'], [0.03, 0.03], SAMPLE_INTERVAL_NS, n_pretrigger_samples = n_pretrigger_samples) as writer:
+        writer.write(adc)
+
+    with ReplayPS6000a(path, speed = None) as replay:
+        assert replay.n_record_pretrigger_samples == expected
+        buffer, _ = replay.acquire(SAMPLE_INTERVAL_NS, n_pretrigger_samples = 0, n_posttrigger_samples = 16, raw = True)
+
+    np.testing.assert_array_equal(buffer, adc[:, 0, expected:expected + 16])
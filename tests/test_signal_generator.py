@@ -0,0 +1,27 @@
+import numpy as np
+
+from pico_acq.waveforms import pulse
+
+def test_standard_wave_keeps_the_buffer_length(scope, driver):
+
+    scope.set_awg('PICO_SQUARE', frequency_hz = 1000.)
+
+    assert driver.calls['ps6000aSigGenWaveform'] == 1
+    assert scope.device_state['sig_gen']['waveform'] == ('PICO_SQUARE', 100000)
+
+def test_unchanged_settings_are_not_sent_again(scope, driver):
+
+    waveform = pulse(1000, 100, 200, rise_samples = 10, fall_samples = 50)
+    scope.set_awg(waveform, frequency_hz = 1000.)
+    scope.set_awg(waveform.copy(), frequency_hz = 1000.)
+    assert driver.calls['ps6000aSigGenWaveform'] == 1
+    assert driver.calls['ps6000aSigGenApply'] == 1
+
+    # only the frequency changed, the waveform is not uploaded again
+    scope.set_awg(waveform, frequency_hz = 2000.)
+    assert driver.calls['ps6000aSigGenWaveform'] == 1
+    assert driver.calls['ps6000aSigGenFrequency'] == 2
+    assert driver.calls['ps6000aSigGenApply'] == 2
+
+    scope.set_awg(np.roll(waveform, 10), frequency_hz = 2000.)
+    assert driver.calls['ps6000aSigGenWaveform'] == 2
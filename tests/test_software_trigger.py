@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from pico_acq.software_trigger import SoftwareTrigger
+
+N_PRETRIGGER = 20
+N_POSTTRIGGER = 60
+
+def pulse_stream(n_samples, n_pulses, seed = 3):
+
+    # negative pulses at random times on two channels with noise, B a few samples after A
+    rng = np.random.default_rng(seed)
+    data = rng.normal(0., 30., size=(2, n_samples))
+    starts = np.sort(rng.choice(np.arange(100, n_samples - 100), size=n_pulses, replace=False))
+    shape = -3000. * np.exp(-np.arange(40) / 10.)
+    for start in starts:
+        data[0, start:start + 40] += shape
+        data[1, start + 3:start + 43] += shape
+    return data.astype(np.int16)
+
+def make_trigger():
+
+    return SoftwareTrigger([0, 1], [-1000, -1000], ['FALLING', 'PICO_FALLING'], N_PRETRIGGER, N_POSTTRIGGER,
+                           hysteresis = [100, 100], coincidence_samples = 5, sample_interval_ns = 0.8)
+
+def run(data, chunk_samples):
+
+    trigger = make_trigger()
+    results = [trigger.process(data[:, first:first + chunk_samples], first) for first in range(0, data.shape[1], chunk_samples)]
+    events = np.concatenate([result.data for result in results], axis=1)
+    samples = np.concatenate([result.trigger_samples for result in results])
+    t0s = np.concatenate([result.times.t0s for result in results])
+    return trigger, events, samples, t0s
+
+@pytest.mark.parametrize('chunk_samples', [3, 7, 50, 81, 1000, 4096])
+def test_events_do_not_depend_on_the_chunks(chunk_samples):
+
+    data = pulse_stream(20000, 60)
+    reference, reference_events, reference_samples, reference_t0s = run(data, data.shape[1])
+    trigger, events, samples, t0s = run(data, chunk_samples)
+
+    assert reference.n_events > 0
+    np.testing.assert_array_equal(samples, reference_samples)
+    np.testing.assert_array_equal(events, reference_events)
+    np.testing.assert_allclose(t0s, reference_t0s)
+    assert (trigger.n_triggers, trigger.n_events, trigger.n_incomplete) == \
+        (reference.n_triggers, reference.n_events, reference.n_incomplete)
+
+def test_windows_are_cut_around_the_trigger():
+
+    data = pulse_stream(20000, 60)
+    _, events, samples, t0s = run(data, 333)
+
+    for i_event, sample in enumerate(samples):
+        np.testing.assert_array_equal(events[:, i_event], data[:, sample - N_PRETRIGGER:sample + N_POSTTRIGGER])
+    np.testing.assert_allclose(t0s, (samples - N_PRETRIGGER) * 0.8)
+    # the coincidence is completed on channel B
+    assert np.all(data[1, samples] < -1000)
+
+def test_gap_in_the_stream_drops_the_pending_windows():
+
+    data = pulse_stream(20000, 60)
+    _, _, samples, _ = run(data, data.shape[1])
+
+    # the stream stops before the posttrigger samples of the first event are complete
+    trigger = make_trigger()
+    first_chunk = trigger.process(data[:, :samples[0] + 10], 0)
+    assert len(first_chunk.trigger_samples) == 0
+    events = trigger.process(data[:, samples[0] + 1000:], samples[0] + 1000)
+
+    assert trigger.n_incomplete == 1
+    assert np.all(events.trigger_samples > samples[0] + 1000)
@@ -0,0 +1,86 @@
+import time
+
+import numpy as np
+import pytest
+
+from pico_acq.utils import get_max_adc
+
+# the simulated driver fills the buffers faster than this sample clock, so no sample is lost
+SAMPLE_INTERVAL_NS = 10000.
+
+def expected_signal(scope, first_sample, n_samples, sample_interval_ns = SAMPLE_INTERVAL_NS):
+
+    # the simulator streams a 1 kHz sine at half of the full scale on every channel
+    max_adc = get_max_adc(scope.status, scope.handle, scope.resolution).value
+    t = np.arange(first_sample, first_sample + n_samples) * sample_interval_ns * 1e-9
+    return (0.5 * max_adc * np.sin(2 * np.pi * 1e3 * t)).astype(np.int16)
+
+@pytest.mark.parametrize('buffer_samples, n_buffers', [(1000, 2), (1500, 3), (20000, 4)])
+def test_chunks_are_contiguous(scope, buffer_samples, n_buffers):
+
+    max_samples = 10000
+    chunks = list(scope.stream(SAMPLE_INTERVAL_NS, max_samples = max_samples, buffer_samples = buffer_samples,
+                               n_buffers = n_buffers, copy = True))
+
+    assert chunks[0].first_sample == 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.first_sample == previous.first_sample + previous.data.shape[1]
+
+    data = np.concatenate([chunk.data for chunk in chunks], axis=1)
+    assert data.shape[0] == 2
+    assert data.shape[1] >= max_samples
+
+    reference = expected_signal(scope, 0, data.shape[1])
+    np.testing.assert_array_equal(data[0], reference)
+    np.testing.assert_array_equal(data[1], reference)
+    assert all(chunk.overflow == 0 for chunk in chunks)
+    assert chunks[-1].dropped_samples == 0
+
+def test_views_are_valid_until_the_buffer_is_reused(scope):
+
+    chunks = []
+    for chunk in scope.stream(SAMPLE_INTERVAL_NS, max_samples = 3000, buffer_samples = 1000, n_buffers = 4):
+        chunks.append((chunk.first_sample, chunk.data.copy(), chunk.data))
+
+    # 3 buffer fills with 4 rotating buffers, none is handed back to the driver before the end
+    for first_sample, data_copy, view in chunks:
+        np.testing.assert_array_equal(view, data_copy)
+        np.testing.assert_array_equal(view[0], expected_signal(scope, first_sample, view.shape[1]))
+
+def test_late_buffers_drop_samples(scope, driver):
+
+    # in real time a buffer of 100 samples is full after 10 ms, the consumer takes 15 ms per chunk
+    driver.config['realtime'] = True
+    sample_interval_ns = 1e5
+    chunks = []
+    for chunk in scope.stream(sample_interval_ns, max_samples = 500, buffer_samples = 100, n_buffers = 2, copy = True):
+        chunks.append(chunk)
+        time.sleep(15e-3)
+
+    assert chunks[0].first_sample == 0
+    assert chunks[-1].dropped_samples > 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        # the lost samples are skipped on the time line of the run
+        gap = chunk.first_sample - (previous.first_sample + previous.data.shape[1])
+        assert gap == chunk.dropped_samples - previous.dropped_samples
+
+    # the samples after a gap are the ones the scope took then, within the timing of the host
+    for chunk in chunks:
+        assert any(np.array_equal(chunk.data[0], expected_signal(scope, chunk.first_sample + shift, chunk.data.shape[1],
+                                                                 sample_interval_ns))
+                   for shift in range(-5, 6))
+
+def test_streaming_capture_uses_the_channel_ranges(scope):
+
+    scope.activate_channels(['A', 'B'], ['PICO_1V', 'PICO_2V'], ['PICO_DC', 'PICO_DC'], analogue_offsets = [0., 0.1])
+    block = scope.acquire(SAMPLE_INTERVAL_NS, mode = 'runStreaming', n_pretrigger_samples = 100, n_posttrigger_samples = 900,
+                          as_block = True)
+
+    max_adc = get_max_adc(scope.status, scope.handle, scope.resolution).value
+    assert block.channel_ranges == ['PICO_1V', 'PICO_2V']
+    np.testing.assert_allclose(block.scale_factors_mV, [1000. / max_adc, 2000. / max_adc])
+    np.testing.assert_allclose(block.offsets_mV, [0., 100.])
+
+    data, times = scope.acquire(SAMPLE_INTERVAL_NS, mode = 'runStreaming', n_pretrigger_samples = 100, n_posttrigger_samples = 900)
+    assert len(times) == 1000
+    np.testing.assert_allclose(data['B'], block.mV('B', dtype = np.float64)[0])
@@ -0,0 +1,45 @@
+import numpy as np
+
+from picosdk.PicoDeviceStructs import picoStruct as structs
+from picosdk.constants import PICO_STATUS
+
+from pico_acq.timing import decode_trigger_infos, SegmentedTimeAxis
+
+RESET_FLAG = PICO_STATUS['PICO_DEVICE_TIME_STAMP_RESET']
+
+def trigger_infos(timestamps, status = None):
+
+    infos = (structs.PICO_TRIGGER_INFO * len(timestamps))()
+    for i, timestamp in enumerate(timestamps):
+        infos[i].segmentIndex = i
+        infos[i].timeStampCounter = timestamp
+        infos[i].status = 0 if status is None else status[i]
+        infos[i].missedTriggers = i
+    return infos
+
+def test_offsets_are_relative_to_the_first_segment():
+
+    info = decode_trigger_infos(trigger_infos([1000, 1250, 1700, 1701]), RESET_FLAG)
+
+    np.testing.assert_array_equal(info.timestamps, [1000, 1250, 1700, 1701])
+    np.testing.assert_array_equal(info.offsets, [0, 250, 700, 701])
+    assert info.offsets.dtype == np.int64
+    assert not np.any(info.timestamp_reset)
+    np.testing.assert_array_equal(info.missed_triggers, [0, 1, 2, 3])
+
+def test_counter_reset_keeps_the_offsets_monotonic():
+
+    # the counter restarts before the third segment, its value is the distance to the second one
+    info = decode_trigger_infos(trigger_infos([5000, 5400, 300, 800], status = [0, 0, RESET_FLAG, 0]), RESET_FLAG)
+
+    np.testing.assert_array_equal(info.timestamp_reset, [False, False, True, False])
+    np.testing.assert_array_equal(info.offsets, [0, 400, 700, 1200])
+    assert np.all(np.diff(info.offsets) > 0)
+
+def test_segmented_time_axis():
+
+    times = SegmentedTimeAxis([0., 100., 250.], 0.8, 5)
+
+    assert len(times) == 3
+    np.testing.assert_allclose(times.values()[2], 250. + 0.8 * np.arange(5))
+    np.testing.assert_allclose(np.asarray(times[1]), times.values()[1])
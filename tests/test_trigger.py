@@ -0,0 +1,45 @@
+import pytest
+
+from picosdk.PicoDeviceEnums import picoEnum as enums
+
+from pico_acq.utils import trigger_condition_on_channel, get_max_adc
+
+def condition(scope, threshold_mV, **kwargs):
+
+    return trigger_condition_on_channel(scope.status, scope.handle, scope.resolution, 'PICO_CHANNEL_A', 'PICO_1V',
+                                        threshold_mV, 'PICO_FALLING', device_state = scope.device_state, **kwargs)
+
+def test_trigger_condition_on_channel(scope):
+
+    trigger_cond, trigger_dir, trigger_prop = condition(scope, -100.)
+    max_adc = get_max_adc(scope.status, scope.handle, scope.resolution).value
+
+    assert trigger_cond.source == enums.PICO_CHANNEL['PICO_CHANNEL_A']
+    assert trigger_cond.condition == enums.PICO_TRIGGER_STATE['PICO_CONDITION_TRUE']
+    assert trigger_dir.direction == enums.PICO_THRESHOLD_DIRECTION['PICO_FALLING']
+    assert trigger_dir.thresholdMode == enums.PICO_THRESHOLD_MODE['PICO_LEVEL']
+    assert trigger_prop.thresholdUpper == pytest.approx(-0.1 * max_adc, abs=1)
+    assert trigger_prop.thresholdUpperHysteresis == pytest.approx(0.002 * max_adc, abs=1)
+
+    inverted_cond, _, _ = condition(scope, -100., inverted = True)
+    assert inverted_cond.condition == enums.PICO_TRIGGER_STATE['PICO_CONDITION_FALSE']
+
+def test_analogue_offset_shifts_the_threshold(scope):
+
+    # with +200 mV of offset the ADC sees the -100 mV input level at +100 mV
+    _, _, with_offset = condition(scope, -100., analogue_offset = 0.2)
+    _, _, reference = condition(scope, 100.)
+
+    assert with_offset.thresholdUpper == reference.thresholdUpper
+
+def test_set_simple_trigger(scope, driver):
+
+    scope.set_simple_trigger(-100., 'PICO_FALLING', autoTriggerMicroSeconds = 1000)
+    for function in ('ps6000aSetTriggerChannelConditions', 'ps6000aSetTriggerChannelDirections',
+                     'ps6000aSetTriggerChannelProperties'):
+        assert driver.calls[function] == 1
+    assert driver.unit(scope.handle).auto_trigger_us == 1000
+
+    # an unchanged trigger is not sent again
+    scope.set_simple_trigger(-100., 'PICO_FALLING', autoTriggerMicroSeconds = 1000)
+    assert driver.calls['ps6000aSetTriggerChannelConditions'] == 1
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+'''Lazy time axes and decoding of the trigger information of segmented captures
+'''
+
+import ctypes
+from collections import namedtuple
+import numpy as np
+
+TriggerInfo = namedtuple('TriggerInfo', ['status', 'timestamps', 'offsets', 'timestamp_reset', 'missed_triggers'])
+
+class TimeAxis:
+    '''
+    Evenly spaced time axis t0 + i * dt, i = 0 ... n - 1, that only stores its three
+    parameters. Indexing returns the times on demand and np.asarray() gives the full array.
+    '''
+
+    __slots__ = ('t0', 'dt', 'n')
+
+    def __init__(self, t0, dt, n):
+        self.t0 = float(t0)
+        self.dt = float(dt)
+        self.n = int(n)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.t0 + np.arange(*index.indices(self.n)) * self.dt
+        if not isinstance(index, (int, np.integer)):
+            return self.t0 + np.arange(self.n)[index] * self.dt
+        if index < 0:
+            index += self.n
+        if not 0 <= index < self.n:
+            raise IndexError('TimeAxis index out of range')
+        return self.t0 + index * self.dt
+
+    def __array__(self, dtype = None, copy = None):
+        return self.values(np.float64 if dtype is None else dtype)
+
+    def __repr__(self):
+        return f'TimeAxis(t0={self.t0}, dt={self.dt}, n={self.n})'
+
+    def values(self, dtype = np.float64):
+        return (self.t0 + np.arange(self.n) * self.dt).astype(dtype, copy=False)
+
+class SegmentedTimeAxis:
+    '''
+    Time axes of a segmented capture: one TimeAxis per segment sharing dt and n, shifted by
+    the per-segment trigger time offsets t0s. Behaves like a list of TimeAxis.
+    '''
+
+    __slots__ = ('t0s', 'dt', 'n', 'trigger_info')
+
+    def __init__(self, t0s, dt, n, trigger_info = None):
+        self.t0s = np.asarray(t0s, dtype=np.float64)
+        self.dt = float(dt)
+        self.n = int(n)
+        self.trigger_info = trigger_info
+
+    def __len__(self):
+        return len(self.t0s)
+
+    def __getitem__(self, segment):
+        return TimeAxis(self.t0s[segment], self.dt, self.n)
+
+    def __iter__(self):
+        return (TimeAxis(t0, self.dt, self.n) for t0 in self.t0s)
+
+    def __repr__(self):
+        return f'SegmentedTimeAxis(segments={len(self.t0s)}, dt={self.dt}, n={self.n})'
+
+    def values(self, dtype = np.float64):
+        '''(segments, samples) array of all times'''
+        return (self.t0s[:, np.newaxis] + np.arange(self.n) * self.dt).astype(dtype, copy=False)
+
+def struct_dtype(struct_type):
+    '''
+    Method to build the NumPy dtype matching the memory layout of a (packed) ctypes structure
+    '''
+
+    names = [name for name, _ in struct_type._fields_]
+    return np.dtype({
+        'names': names,
+        'formats': [np.dtype(ctype) for _, ctype in struct_type._fields_],
+        'offsets': [getattr(struct_type, name).offset for name in names],
+        'itemsize': ctypes.sizeof(struct_type)
+    })
+
+def decode_trigger_infos(trigger_infos, timestamp_reset_flag):
+    '''
+    Method to decode a ctypes array of PICO_TRIGGER_INFO in one vectorized pass. Returns the
+    status flags, the raw timestamp counters (uint64, in sample intervals) and the trigger
+    offsets of every segment relative to the first one (int64, in sample intervals). When the
+    counter was reset before a segment (timestamp_reset_flag in its status) the counter value
+    of that segment is taken as the distance to the previous one, so the offsets stay
+    monotonic but the gap across a reset is only a lower bound.
+    '''
+
+    records = np.frombuffer(trigger_infos, dtype=struct_dtype(trigger_infos._type_)).view(np.recarray)
+    status = records.status.astype(np.uint32)
+    timestamps = records.timeStampCounter.astype(np.uint64)
+    timestamp_reset = (status & timestamp_reset_flag) != 0
+
+    deltas = np.diff(timestamps.astype(np.int64))
+    deltas[timestamp_reset[1:]] = timestamps[1:][timestamp_reset[1:]].astype(np.int64)
+    offsets = np.zeros(len(timestamps), dtype=np.int64)
+    np.cumsum(deltas, out=offsets[1:])
+
+    return TriggerInfo(status, timestamps, offsets, timestamp_reset, records.missedTriggers.astype(np.uint64))
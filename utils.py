@@ -5,12 +5,27 @@
 
 import ctypes
 import string
+import time
+import functools
+import hashlib
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError, InvalidStateError, TimeoutError as FutureTimeoutError
 import numpy as np
-from picosdk.ps6000a import ps6000a as ps
+from picosdk.ps6000a import ps6000a
 from picosdk.PicoDeviceEnums import picoEnum as enums
 from picosdk.PicoDeviceStructs import picoStruct as structs
 from picosdk.constants import PICO_STATUS
-from picosdk.functions import adc2mV, mV2adc, assert_pico_ok
+from picosdk.functions import mV2adc, assert_pico_ok
+from picosdk.errors import PicoSDKCtypesError
+
+from .conversion import adc_scale_factors, adc2mV_block
+from .timing import TimeAxis, SegmentedTimeAxis, decode_trigger_infos
+from .instrumentation import instrument, driver_stats
+from .capture import CaptureBlock
+from .waveforms import to_awg_buffer
+
+# every driver call is counted and timed in driver_stats
+ps = instrument(ps6000a)
 
 # for some reasons there is no PICO_CONNECT_PROBE_RANGE in picoEnum
 PICO_CONNECT_PROBE_RANGE = {
@@ -27,6 +42,51 @@ PICO_CONNECT_PROBE_RANGE = {
     'PICO_20V': 10
 }
 
+def new_device_state():
+    '''
+    Method to create an empty shadow copy of the device configuration. The methods taking a
+    device_state keyword compare the requested settings with it and only send what changed,
+    an entry that is None (or missing) is unknown and always sent to the device.
+    '''
+
+    return {
+        'channels': None,  # channel name -> (coupling, range, analogue offset), None if off
+        'trigger': None,  # description of the trigger that was set last
+        'adc_limits': {},  # resolution -> max ADC count
+        'memory_segments': None,  # (number of segments, max samples per segment)
+        'n_captures': None,
+        'timebases': {},  # (channel flags, resolution, demanded interval) -> (timebase, sample interval in ns)
+        'max_samples': {},  # (timebase, channel flags, resolution, number of segments) -> TimebaseSolution
+        'sig_gen': None  # settings of the AWG that were applied last
+    }
+
+def invalidate_device_state(device_state, keep_adc_limits = True):
+    '''
+    Method to forget the shadowed device configuration, e.g. after a resolution change. The
+    ADC limits only depend on the resolution and are kept unless the device was reopened.
+    '''
+
+    adc_limits = device_state['adc_limits'] if keep_adc_limits else {}
+    device_state.clear()
+    device_state.update(new_device_state())
+    device_state['adc_limits'] = adc_limits
+
+def enumerate_units(status):
+    '''
+    Method to get the serial numbers of the 6000 A series units that are connected and not
+    opened yet
+    '''
+
+    count = ctypes.c_int16()
+    serials = ctypes.create_string_buffer(1024)
+    serial_length = ctypes.c_int16(len(serials))
+    status['enumerateUnits'] = ps.ps6000aEnumerateUnits(ctypes.byref(count), serials, ctypes.byref(serial_length))
+    if status['enumerateUnits'] == PICO_STATUS['PICO_NOT_FOUND']:
+        return []
+    assert_pico_ok(status['enumerateUnits'])
+
+    return [serial for serial in serials.value.decode().split(',') if serial]
+
 def turnon_readout_channel_DC(status, handle, channel_names, channel_ranges, channel_couplings, **kwargs):
     '''
     Method to turn on a channel for DC readout
@@ -36,19 +96,32 @@ def turnon_readout_channel_DC(status, handle, channel_names, channel_ranges, cha
     if not isinstance(channel_names, list):
         channel_names = [channel_names]
 
+    analogue_offsets = kwargs.get('analogue_offsets', [0.] * len(channel_names))  # V
+
+    # settings already on the device, None if unknown
+    device_state = kwargs.get('device_state', None)
+    current_settings = None
+    if device_state is not None:
+        current_settings = device_state['channels']
+        device_state['channels'] = None  # unknown until all channels are set
+    new_settings = {ch: None for ch in list(string.ascii_uppercase)[:8]}
+
     # Set channels on
     channels_on = {}
-    for channel_name, channel_range, channel_coupling in zip(channel_names, channel_ranges, channel_couplings):
+    for channel_name, channel_range, channel_coupling, analogue_offset in zip(channel_names, channel_ranges, channel_couplings, analogue_offsets):
         channels_on[channel_name] = enums.PICO_CHANNEL[f'PICO_CHANNEL_{channel_name}']
         coupling = enums.PICO_COUPLING[channel_coupling]
         channel_range = PICO_CONNECT_PROBE_RANGE[channel_range]
         bandwidth = enums.PICO_BANDWIDTH_LIMITER['PICO_BW_FULL']
+        new_settings[channel_name] = (coupling, channel_range, analogue_offset)
+        if current_settings is not None and current_settings.get(channel_name) == new_settings[channel_name]:
+            continue
         status[f'setChannel{channel_name}'] = ps.ps6000aSetChannelOn(
             handle,
             channels_on[channel_name],
             coupling,
             channel_range,
-            0,  # analogueOffset = 0 V
+            analogue_offset,
             bandwidth
         )
         assert_pico_ok(status[f'setChannel{channel_name}'])
@@ -56,66 +129,127 @@ def turnon_readout_channel_DC(status, handle, channel_names, channel_ranges, cha
     # set other channels off
     for ch in list(string.ascii_uppercase)[:8]:
         if ch not in channel_names:
+            if current_settings is not None and ch in current_settings and current_settings[ch] is None:
+                continue
             channel = enums.PICO_CHANNEL[f'PICO_CHANNEL_{ch}']
             status['setChannel', channel] = ps.ps6000aSetChannelOff(handle, channel)
             assert_pico_ok(status['setChannel', channel])
 
+    if device_state is not None:
+        device_state['channels'] = new_settings
+
     return channels_on
 
 
-def generate_signal(status, handle, func='PICO_SINE', **kwargs):
+SigGenFrequencies = namedtuple('SigGenFrequencies', ['frequency_hz', 'stop_frequency_hz', 'frequency_increment_hz', 'dwell_time_s'])
+
+@functools.lru_cache(maxsize=None)
+def _standard_wave_buffer(buffer_length):
+
+    # the samples are ignored for the standard wave types, only sent with them
+    return (ctypes.c_int16 * buffer_length)()
+
+def set_signal_generator(status, handle, waveform='PICO_SINE', **kwargs):
     '''
-    Method to generate a signal using the AWG
+    Method to set up the AWG and start it, waveform is a PICO_WAVE_TYPE name or one period of
+    an arbitrary waveform (see waveforms.to_awg_buffer). With a device_state only the
+    settings that changed are sent, an arbitrary waveform with the same hash is not uploaded
+    again and nothing is sent if all settings are unchanged. A frequency sweep from
+    frequency_hz to stop_frequency_hz is set up with frequency_increment_hz, dwell_time_s and
+    sweep_type. The standard wave types are sent with an empty buffer of buffer_length
+    samples. Returns the SigGenFrequencies applied by the driver.
     '''
 
     peak_to_peak_volts = kwargs.get('peak_to_peak_volts', 2.)
     offset_volts = kwargs.get('offset_volts', 0.)
     frequency_hz = kwargs.get('frequency_hz', 10000)
-    buffer_length = kwargs.get('buffer_length', 100000)
-    duty_cycle_percent = kwargs.get('duty_cycle_percent', 50.)    
+    duty_cycle_percent = kwargs.get('duty_cycle_percent', 50.)
     trigger_from_scope = kwargs.get('trigger_from_scope', False)
+    trigger_cycles = kwargs.get('trigger_cycles', 1)
+    stop_frequency_hz = kwargs.get('stop_frequency_hz', None)
+    enabled = kwargs.get('enabled', True)
+
+    # settings already on the device, None if unknown
+    device_state = kwargs.get('device_state', None)
+    current_settings = {}
+    if device_state is not None:
+        current_settings = device_state['sig_gen'] or {}
+        device_state['sig_gen'] = None  # unknown until applied
+
+    if isinstance(waveform, str):
+        buffer = _standard_wave_buffer(kwargs.get('buffer_length', 100000))
+        new_settings = {'waveform': (waveform, len(buffer))}
+    else:
+        buffer = to_awg_buffer(waveform)
+        digest = hashlib.blake2b(buffer.data, digest_size=16).digest()
+        new_settings = {'waveform': ('PICO_ARBITRARY', len(buffer), digest)}
+    new_settings['range'] = (peak_to_peak_volts, offset_volts)
+    new_settings['duty_cycle'] = duty_cycle_percent
+    new_settings['frequency'] = frequency_hz
+    new_settings['sweep'] = None if stop_frequency_hz is None else (stop_frequency_hz, kwargs.get('frequency_increment_hz', 0.),
+                                                                   kwargs.get('dwell_time_s', 0.), kwargs.get('sweep_type', 'PICO_UP'))
+    new_settings['trigger'] = (trigger_cycles, kwargs.get('auto_trigger_ps', 0)) if trigger_from_scope else None
+    new_settings['enabled'] = enabled
+
+    if current_settings.get('applied') is not None and all(current_settings.get(key) == value for key, value in new_settings.items()):
+        device_state['sig_gen'] = current_settings
+        return current_settings['applied']
 
     # Set signal generator waveform
-    wavetype = enums.PICO_WAVE_TYPE[func]
-    buffer = (ctypes.c_int16 * buffer_length)()
-    status['sigGenWaveform'] = ps.ps6000aSigGenWaveform(
-        handle,
-        wavetype,
-        ctypes.byref(buffer),
-        buffer_length
-    )
-    assert_pico_ok(status['sigGenWaveform'])
+    if current_settings.get('waveform') != new_settings['waveform']:
+        wavetype = enums.PICO_WAVE_TYPE[new_settings['waveform'][0]]
+        status['sigGenWaveform'] = ps.ps6000aSigGenWaveform(
+            handle,
+            wavetype,
+            buffer.ctypes.data if isinstance(buffer, np.ndarray) else ctypes.byref(buffer),
+            len(buffer)
+        )
+        assert_pico_ok(status['sigGenWaveform'])
 
     # Set signal generator range
-    status['sigGenRange'] = ps.ps6000aSigGenRange(handle, peak_to_peak_volts, offset_volts)
-    assert_pico_ok(status['sigGenRange'])
+    if current_settings.get('range') != new_settings['range']:
+        status['sigGenRange'] = ps.ps6000aSigGenRange(handle, peak_to_peak_volts, offset_volts)
+        assert_pico_ok(status['sigGenRange'])
 
     # Set signal generator duty cycle
-    status['sigGenDutyCycle'] = ps.ps6000aSigGenWaveformDutyCycle(handle, duty_cycle_percent)
-    assert_pico_ok(status['sigGenDutyCycle'])
-
-    # Set signal generator frequency
-    status['sigGenFreq'] = ps.ps6000aSigGenFrequency(handle, frequency_hz)
-    assert_pico_ok(status['sigGenFreq'])
+    if current_settings.get('duty_cycle') != new_settings['duty_cycle']:
+        status['sigGenDutyCycle'] = ps.ps6000aSigGenWaveformDutyCycle(handle, duty_cycle_percent)
+        assert_pico_ok(status['sigGenDutyCycle'])
+
+    # Set signal generator frequency and sweep
+    if current_settings.get('frequency') != new_settings['frequency']:
+        status['sigGenFreq'] = ps.ps6000aSigGenFrequency(handle, frequency_hz)
+        assert_pico_ok(status['sigGenFreq'])
+    if new_settings['sweep'] is not None and current_settings.get('sweep') != new_settings['sweep']:
+        stop_frequency_hz, frequency_increment_hz, dwell_time_s, sweep_type = new_settings['sweep']
+        status['sigGenFreqSweep'] = ps.ps6000aSigGenFrequencySweep(
+            handle,
+            stop_frequency_hz,
+            frequency_increment_hz,
+            dwell_time_s,
+            enums.PICO_SWEEP_TYPE[sweep_type]
+        )
+        assert_pico_ok(status['sigGenFreqSweep'])
 
     # Set signal generator trigger event
-    if trigger_from_scope:
+    if new_settings['trigger'] is not None and current_settings.get('trigger') != new_settings['trigger']:
         status['sigGenTrigger'] = ps.ps6000aSigGenTrigger(
             handle,
             enums.PICO_SIGGEN_TRIG_TYPE['PICO_SIGGEN_RISING'],
             enums.PICO_SIGGEN_TRIG_SOURCE['PICO_SIGGEN_SCOPE_TRIG'],
-            1, # only play a single cycle
-            0 # no auto-trigger
+            trigger_cycles, # cycles played per trigger
+            new_settings['trigger'][1] # 0 for no auto-trigger
         )
         assert_pico_ok(status['sigGenTrigger'])
-    
-    # Apply signal generator settings
-    sig_gen_enabled = 1
-    sweep_enabled = 0
+
+    # Apply signal generator settings, the driver returns the frequencies it applied
+    sig_gen_enabled = 1 if enabled else 0
+    sweep_enabled = 0 if new_settings['sweep'] is None else 1
     trigger_enabled = 1 if trigger_from_scope else 0
     auto_clock_opt_enabled = 0
     override_auto_clock_and_prescale = 0
-    frequency = ctypes.c_int16(frequency_hz)
+    frequency = ctypes.c_double(frequency_hz)
+    stop_frequency, frequency_increment, dwell_time = (ctypes.c_double(value) for value in (new_settings['sweep'] or (0., 0., 0.))[:3])
     status['sigGenApply'] = ps.ps6000aSigGenApply(
         handle,
         sig_gen_enabled,
@@ -124,33 +258,42 @@ def generate_signal(status, handle, func='PICO_SINE', **kwargs):
         auto_clock_opt_enabled,
         override_auto_clock_and_prescale,
         ctypes.byref(frequency),
-        None,  # stop_frequency
-        None,  # frequency_increment
-        None   # dwell_time
+        ctypes.byref(stop_frequency) if sweep_enabled else None,
+        ctypes.byref(frequency_increment) if sweep_enabled else None,
+        ctypes.byref(dwell_time) if sweep_enabled else None
     )
     assert_pico_ok(status['sigGenApply'])
 
+    applied = SigGenFrequencies(frequency.value, stop_frequency.value if sweep_enabled else None,
+                                frequency_increment.value if sweep_enabled else None, dwell_time.value if sweep_enabled else None)
+    if device_state is not None:
+        # the uploaded buffer is kept alive with the settings
+        device_state['sig_gen'] = dict(new_settings, applied=applied, buffer=buffer)
+
+    return applied
+
+def generate_signal(status, handle, func='PICO_SINE', **kwargs):
+    '''
+    Method to generate a signal using the AWG, see set_signal_generator
+    '''
+
+    return set_signal_generator(status, handle, func, **kwargs)
+
 def trigger_condition_on_channel(status, handle, resolution, channel, channel_range, trigger_thrs_mV, threshold_direction,
-                                 threshold_mode = "PICO_LEVEL", rearm_hysteresis_relative = 0.02, inverted = False):
+                                 threshold_mode = "PICO_LEVEL", rearm_hysteresis_relative = 0.02, inverted = False, device_state = None,
+                                 analogue_offset = 0.):
 
     # some preparatory steps: get max ADC value
-    min_ADC = ctypes.c_int16()
-    max_ADC = ctypes.c_int16()
-    status['getAdcLimits'] = ps.ps6000aGetAdcLimits(
-        handle,
-        resolution,
-        ctypes.byref(min_ADC),
-        ctypes.byref(max_ADC)
-    )
-    assert_pico_ok(status['getAdcLimits'])
+    max_ADC = get_max_adc(status, handle, resolution, device_state = device_state)
 
-    # convert trigger threshold from mV to ADC counts
+    # convert trigger threshold from mV at the input to ADC counts, the inverse of the conversion
+    # to mV: the analogue offset (V) of the channel shifts the level seen by the ADC
     pico_channel_range = PICO_CONNECT_PROBE_RANGE[channel_range]
-    trigger_thrs_adc = mV2adc(trigger_thrs_mV, pico_channel_range, max_ADC)
+    trigger_thrs_adc = mV2adc(trigger_thrs_mV + 1.e+3 * analogue_offset, pico_channel_range, max_ADC)
     trigger_hyst_adc = abs(mV2adc(trigger_thrs_mV * rearm_hysteresis_relative, pico_channel_range, max_ADC))
     
     trigger_cond = structs.PICO_CONDITION(enums.PICO_CHANNEL[channel], 
-                                          enums.Pico_TRIGGER_STATE["PICO_CONDITION_FALSE"] if inverted else enums.Pico_TRIGGER_STATE["PICO_CONDITION_TRUE"]
+                                          enums.PICO_TRIGGER_STATE["PICO_CONDITION_FALSE"] if inverted else enums.PICO_TRIGGER_STATE["PICO_CONDITION_TRUE"]
     )
     
     trigger_dir = structs.PICO_DIRECTION(enums.PICO_CHANNEL[channel], 
@@ -229,71 +372,48 @@ def compose_trigger_DNF(status, handle, autoTriggerMicroSeconds = 0, **kwargs):
     )
     assert_pico_ok(status['setTrigProps'])
 
-def read_channel_streaming(status, handle, resolution, sources, **kwargs):
+def read_channel_streaming(status, handle, resolution, sources, source_ranges, **kwargs):
     '''
-    Method to read out a signal with given source channels using the straming functionality
+    Method to read out a signal with given source channels using the straming functionality,
+    converted to mV with the range (source_ranges) and analogue offset (source_offsets) of
+    every channel
     '''
 
     n_pretrigger_samples = kwargs.get('n_pretrigger_samples', 1000)
     n_posttrigger_samples = kwargs.get('n_posttrigger_samples', 9000)
     sample_interval = kwargs.get('sample_interval', 1)
     time_units = kwargs.get('time_units', 'NS')
-    range_V = kwargs.get('range_V', '10MV')
 
     # set number of samples to be collected
     n_samples = n_pretrigger_samples + n_posttrigger_samples
 
     # set data buffer
-    buffer = {}
-    for i_source, source in enumerate(sources.items()):
-        buffer[source[0]] = (ctypes.c_int16 * n_samples)()
-        data_type = enums.PICO_DATA_TYPE['PICO_INT16_T']
-        waveform = 0
-        downsample_ratio_mode = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
-        clear = enums.PICO_ACTION['PICO_CLEAR_ALL']
-        add = enums.PICO_ACTION['PICO_ADD']
-        if i_source == 0:
-            action = clear|add
-        else:
-            action = add
-        status['setDataBuffer'] = ps.ps6000aSetDataBuffer(
-            handle,
-            source[1],
-            ctypes.byref(buffer[source[0]]),
-            n_samples,
-            data_type,
-            waveform,
-            downsample_ratio_mode,
-            action
-        )
-        assert_pico_ok(status['setDataBuffer'])
+    buffer = np.zeros((len(sources), n_samples), dtype=np.int16)
+    clear = enums.PICO_ACTION['PICO_CLEAR_ALL']
+    add = enums.PICO_ACTION['PICO_ADD']
+    with driver_stats.phase('setup'):
+        _set_streaming_buffers(status, handle, sources, buffer, clear|add)
+    downsample_ratio_mode = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
 
     # run streaming capture
     time_units_pico = enums.PICO_TIME_UNITS[f'PICO_{time_units}']
     sample_interval_pico = ctypes.c_double(sample_interval)
     auto_stop = 1 # stop once buffer is full
-    status['runStreaming'] = ps.ps6000aRunStreaming(
-        handle,
-        ctypes.byref(sample_interval_pico),
-        time_units_pico,
-        n_pretrigger_samples,
-        n_posttrigger_samples,
-        auto_stop,
-        1,  # downSampleRatio
-        downsample_ratio_mode
-    )
+    with driver_stats.phase('arm'):
+        status['runStreaming'] = ps.ps6000aRunStreaming(
+            handle,
+            ctypes.byref(sample_interval_pico),
+            time_units_pico,
+            n_pretrigger_samples,
+            n_posttrigger_samples,
+            auto_stop,
+            1,  # downSampleRatio
+            downsample_ratio_mode
+        )
     assert_pico_ok(status['runStreaming'])
 
     # get max ADC value
-    min_ADC = ctypes.c_int16()
-    max_ADC = ctypes.c_int16()
-    status['getAdcLimits'] = ps.ps6000aGetAdcLimits(
-        handle,
-        resolution,
-        ctypes.byref(min_ADC),
-        ctypes.byref(max_ADC)
-    )
-    assert_pico_ok(status['getAdcLimits'])
+    max_ADC = get_max_adc(status, handle, resolution, device_state = kwargs.get('device_state', None))
 
     time_unit_mult_fact = 1.
     if time_units == 'S':
@@ -308,11 +428,9 @@ def read_channel_streaming(status, handle, resolution, sources, **kwargs):
         time_unit_mult_fact = 1.e-6
 
     # create time data
-    time = np.linspace(0, n_samples * sample_interval * time_unit_mult_fact, n_samples)  # ns
+    time = TimeAxis(0, sample_interval * time_unit_mult_fact, n_samples)  # ns
 
     # get data from scope
-    adc2mV_chmax = {}
-    channel_range = PICO_CONNECT_PROBE_RANGE[f'PICO_{range_V}'] # FIXME
     data_type = enums.PICO_DATA_TYPE['PICO_INT16_T']
     streaming_data_info = []
     streaming_data_info = (structs.PICO_STREAMING_DATA_INFO * len(sources))()
@@ -330,27 +448,166 @@ def read_channel_streaming(status, handle, resolution, sources, **kwargs):
     trigger_info.triggered = 0
     trigger_info.autoStop = auto_stop
 
-    status['getStreamingLatestValues'] = ps.ps6000aGetStreamingLatestValues(
-        handle,
-        ctypes.byref(streaming_data_info),
-        len(sources),
-        ctypes.byref(trigger_info)
-    )
+    with driver_stats.phase('transfer'):
+        status['getStreamingLatestValues'] = ps.ps6000aGetStreamingLatestValues(
+            handle,
+            ctypes.byref(streaming_data_info),
+            len(sources),
+            ctypes.byref(trigger_info)
+        )
     assert_pico_ok(status['getStreamingLatestValues'])    
-    
+
+    scale_factors, offsets_mV = conversion_factors(sources, source_ranges, max_ADC, kwargs.get('source_offsets'))
+    if kwargs.get('as_block', False):
+        overflow = sum(1 << i_source for i_source in range(len(sources)) if streaming_data_info[i_source].overflow)
+        return CaptureBlock(buffer, list(sources), scale_factors, time.dt, offsets_mV=offsets_mV,
+                            n_pretrigger_samples=n_pretrigger_samples, overflow=[overflow],
+                            channel_ranges=[source_ranges[source_name] for source_name in sources], max_adc=max_ADC.value)
+
+    if kwargs.get('raw', False):
+        # (channels, samples) ADC counts
+        return buffer, time
+
     # convert ADC counts data to mV
-    for source in sources:
-        adc2mV_chmax[source] = adc2mV(buffer[source], channel_range, max_ADC)
+    with driver_stats.phase('convert'):
+        buffer_mV = adc2mV_block(buffer, scale_factors, offsets_mV, out=kwargs.get('out'), dtype=kwargs.get('dtype', np.float64))
+    adc2mV_chmax = {source_name: buffer_mV[channel_ind] for channel_ind, source_name in enumerate(sources.keys())}
 
     return adc2mV_chmax, time
 
+StreamChunk = namedtuple('StreamChunk', ['data', 'first_sample', 'overflow', 'trigger_at', 'dropped_samples'])
+
+def _set_streaming_buffers(status, handle, sources, buffer, action):
+    '''
+    Method to hand one (channels, samples) int16 buffer to the driver for streaming
+    '''
+
+    data_type = enums.PICO_DATA_TYPE['PICO_INT16_T']
+    downsample_ratio_mode = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
+    add = enums.PICO_ACTION['PICO_ADD']
+    for i_source, source_handle in enumerate(sources.values()):
+        status['setDataBuffer'] = ps.ps6000aSetDataBuffer(
+            handle,
+            source_handle,
+            buffer[i_source].ctypes.data_as(ctypes.POINTER(ctypes.c_int16)),
+            buffer.shape[1],
+            data_type,
+            0,  # waveform
+            downsample_ratio_mode,
+            action if i_source == 0 else add
+        )
+        assert_pico_ok(status['setDataBuffer'])
+
+def stream_channels(status, handle, sources, sample_interval_ns, **kwargs):
+    '''
+    Generator to stream the given source channels continuously, cycling through a set of
+    rotating driver buffers. It yields a StreamChunk for every block of new samples with
+      - data: int16 view of shape (channels, samples) into the rotating buffers, valid until
+        the buffer is handed back to the driver (n_buffers - 1 buffer fills later) unless copy=True
+      - first_sample: index of the first sample of the chunk since the start of the run
+      - overflow: bit mask of the channels that went over range (bit i for the i-th source)
+      - trigger_at: index of the trigger sample since the start of the run, -1 if not in this chunk
+      - dropped_samples: number of samples lost since the start of the run
+    The scope keeps sampling while the driver waits for the next buffer, the samples it takes
+    until the buffer is handed over are lost. Their number comes from the sample clock, so it
+    is only meaningful for a source streaming in real time, and first_sample skips them.
+    The scope is stopped when the generator is closed or max_samples have been delivered.
+    '''
+
+    buffer_samples = kwargs.get('buffer_samples', 1000000)
+    n_buffers = kwargs.get('n_buffers', 4)
+    n_pretrigger_samples = kwargs.get('n_pretrigger_samples', 0)
+    max_samples = kwargs.get('max_samples', None)  # None: stream until the generator is closed
+    copy = kwargs.get('copy', False)
+    poll_interval_s = kwargs.get('poll_interval_s', 1e-3)
+
+    # one contiguous block of rotating buffers for all channels
+    n_sources = len(sources)
+    buffers = np.zeros((n_buffers, n_sources, buffer_samples), dtype=np.int16)
+    clear = enums.PICO_ACTION['PICO_CLEAR_ALL']
+    add = enums.PICO_ACTION['PICO_ADD']
+    _set_streaming_buffers(status, handle, sources, buffers[0], clear|add)
+
+    # run streaming capture without auto stop
+    downsample_ratio_mode = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
+    sample_interval = ctypes.c_double(sample_interval_ns)
+    status['runStreaming'] = ps.ps6000aRunStreaming(
+        handle,
+        ctypes.byref(sample_interval),
+        enums.PICO_TIME_UNITS['PICO_NS'],
+        n_pretrigger_samples,
+        buffer_samples - n_pretrigger_samples,
+        0,  # autoStop
+        1,  # downSampleRatio
+        downsample_ratio_mode
+    )
+    assert_pico_ok(status['runStreaming'])
+    started_at = time.perf_counter()
+    interval_s = sample_interval.value * 1e-9  # the driver writes back the interval it applied
+
+    streaming_data_info = (structs.PICO_STREAMING_DATA_INFO * n_sources)()
+    for i_source, source_handle in enumerate(sources.values()):
+        streaming_data_info[i_source].channel = source_handle
+        streaming_data_info[i_source].mode = downsample_ratio_mode
+        streaming_data_info[i_source].type = enums.PICO_DATA_TYPE['PICO_INT16_T']
+    trigger_info = structs.PICO_STREAMING_DATA_TRIGGER_INFO()
+
+    waiting_for_buffers = PICO_STATUS['PICO_WAITING_FOR_DATA_BUFFERS']
+    i_buffer = 0
+    buffer_first_sample = 0  # index of the first sample of the current buffer since the start of the run
+    buffer_filled = 0  # number of samples of the current buffer already yielded
+    n_delivered = 0
+    dropped_samples = 0
+    try:
+        while max_samples is None or n_delivered < max_samples:
+            status['getStreamingLatestValues'] = ps.ps6000aGetStreamingLatestValues(
+                handle,
+                ctypes.byref(streaming_data_info),
+                n_sources,
+                ctypes.byref(trigger_info)
+            )
+            if status['getStreamingLatestValues'] != waiting_for_buffers:
+                assert_pico_ok(status['getStreamingLatestValues'])
+
+            n_new = streaming_data_info[0].noOfSamples
+            if n_new > 0:
+                start = streaming_data_info[0].startIndex
+                overflow = 0
+                for i_source in range(n_sources):
+                    if streaming_data_info[i_source].overflow:
+                        overflow |= 1 << i_source
+                trigger_at = buffer_first_sample + trigger_info.triggerAt if trigger_info.triggered else -1
+
+                chunk = buffers[i_buffer, :, start:start + n_new]
+                buffer_filled = start + n_new
+                n_delivered += n_new
+                yield StreamChunk(chunk.copy() if copy else chunk, buffer_first_sample + start, overflow, trigger_at, dropped_samples)
+
+            if status['getStreamingLatestValues'] == waiting_for_buffers:
+                # the current buffer is full, hand the next one of the rotation to the driver
+                buffer_first_sample += buffer_filled
+                buffer_filled = 0
+                i_buffer = (i_buffer + 1) % n_buffers
+                clock_sample = int((time.perf_counter() - started_at) / interval_s)
+                _set_streaming_buffers(status, handle, sources, buffers[i_buffer], add)
+
+                # the samples taken since the full buffer ended had nowhere to go
+                if clock_sample > buffer_first_sample:
+                    dropped_samples += clock_sample - buffer_first_sample
+                    buffer_first_sample = clock_sample
+            elif n_new <= 0:
+                time.sleep(poll_interval_s)
+    finally:
+        status['stop'] = ps.ps6000aStop(handle)
+
 def sample_interval_ns2timebase(sample_interval_ns):
+    # round to the nearest timebase, the intervals double up to 3.2 ns and grow by 6.4 ns after
     if sample_interval_ns < 3.2:
         const = 5
-        timebase = int(np.log2(sample_interval_ns * const))
+        timebase = max(0, int(round(np.log2(sample_interval_ns * const))))
     else:
         const = 156.25e-3
-        timebase = int(sample_interval_ns * const + 4)
+        timebase = int(round(sample_interval_ns * const + 4))
 
     return timebase
 
@@ -364,14 +621,390 @@ def timebase2sample_interval_ns(timebase):
 
     return sample_interval_ns
 
-def read_channel_rapidblock(status, handle, resolution, sources, source_ranges, sample_interval_ns, number_segments, **kwargs):
+class BlockWaiter:
+    '''
+    Completion handling of block captures without spinning on ps6000aIsReady. By default the
+    driver's lpReady callback completes a Future the caller blocks on; with use_callback=False
+    (or if the wrappers have no callback type) ps6000aIsReady is polled with an exponential
+    backoff between min_poll_s and max_poll_s. The Future of the current capture is available
+    as self.future; every capture gets a new generation number, passed to the driver as
+    pParameter, and a late callback of an earlier (stopped) capture is ignored. n_polls,
+    n_waits, n_timeouts, n_cancelled and wait_time_s count the ps6000aIsReady calls,
+    finished waits, timeouts, cancellations and the total time waited. armed_at and ready_at
+    are the time.perf_counter() values when the last capture was armed and when the wait for
+    it ended.
+    '''
 
-    if sample_interval_ns < 0:
-        timebase = ctypes.c_uint32(0)
-        sample_interval_s = ctypes.c_double(0)
+    def __init__(self, use_callback = True, min_poll_s = 1e-5, max_poll_s = 5e-3):
+
+        self.min_poll_s = min_poll_s
+        self.max_poll_s = max_poll_s
+        self.status = None
+        self.handle = None
+        self.armed = (0, None)  # generation and Future of the current capture, replaced together
+
+        self.n_polls = 0
+        self.n_waits = 0
+        self.n_timeouts = 0
+        self.n_cancelled = 0
+        self.wait_time_s = 0.
+        self.armed_at = None
+        self.ready_at = None
+
+        # keep a reference to the ctypes callback, the driver calls it from its own thread
+        block_ready_type = getattr(ps, 'BlockReadyType', None)
+        self.lp_ready = block_ready_type(self._block_ready) if use_callback and block_ready_type is not None else None
+
+    @property
+    def generation(self):
+        return self.armed[0]
+
+    @property
+    def future(self):
+        return self.armed[1]
+
+    def _block_ready(self, handle, pico_status, parameter):
+
+        generation, future = self.armed
+        if future is None or parameter != generation:
+            return  # callback of a capture that was stopped before the current one was armed
+        try:
+            future.set_result(pico_status)
+        except InvalidStateError:
+            pass  # already cancelled
+
+    def arm(self, status, handle):
+        '''
+        Method to get a fresh Future and generation number before the capture is started
+        '''
+
+        self.status = status
+        self.handle = handle
+        self.armed = (self.generation + 1, Future())
+        self.armed_at = time.perf_counter()
+        return self.future
+
+    def wait(self, timeout_s = None):
+        '''
+        Method to block until the armed capture is complete. On timeout the capture is
+        stopped and TimeoutError raised, a cancelled capture raises CancelledError.
+        '''
+
+        start = time.perf_counter()
+        try:
+            if self.lp_ready is not None:
+                pico_status = self.future.result(timeout_s)
+            else:
+                pico_status = self._poll(start, timeout_s)
+        except FutureTimeoutError:
+            self.n_timeouts += 1
+            self.future.cancel()
+            self.status['stop'] = ps.ps6000aStop(self.handle)
+            raise TimeoutError(f'Capture not complete after {timeout_s} s')
+        finally:
+            self.ready_at = time.perf_counter()
+            self.wait_time_s += self.ready_at - start
+
+        self.n_waits += 1
+        self.status['blockReady'] = pico_status
+        assert_pico_ok(pico_status)
+
+    def _poll(self, start, timeout_s):
+
+        ready = ctypes.c_int16(0)
+        poll_s = self.min_poll_s
+        while True:
+            self.status['isReady'] = ps.ps6000aIsReady(self.handle, ctypes.byref(ready))
+            self.n_polls += 1
+            assert_pico_ok(self.status['isReady'])
+            if ready.value:
+                break
+            if self.future.cancelled():
+                raise CancelledError()
+            if timeout_s is not None and time.perf_counter() - start > timeout_s:
+                raise FutureTimeoutError()
+            time.sleep(poll_s)
+            poll_s = min(2 * poll_s, self.max_poll_s)
+
+        try:
+            self.future.set_result(PICO_STATUS['PICO_OK'])
+        except InvalidStateError:
+            raise CancelledError()
+        return PICO_STATUS['PICO_OK']
+
+    def cancel(self):
+        '''
+        Method to abort the armed capture, may be called from any thread
+        '''
+
+        if self.future is not None and self.future.cancel():
+            self.n_cancelled += 1
+        if self.handle is not None:
+            self.status['stop'] = ps.ps6000aStop(self.handle)
+
+def run_block(status, handle, n_pretrigger_samples, n_posttrigger_samples, timebase, waiter):
+    '''
+    Method to arm a block capture that notifies the given BlockWaiter when it is complete
+    '''
+
+    waiter.arm(status, handle)
+    time_indisposed_ms = ctypes.c_double(0)
+    status['runBlock'] = ps.ps6000aRunBlock(
+        handle,
+        n_pretrigger_samples,
+        n_posttrigger_samples,
+        timebase,
+        ctypes.byref(time_indisposed_ms),
+        0,  # segmentIndex
+        waiter.lp_ready,  # lpReady = None when polling with ps6000aIsReady
+        ctypes.c_void_p(waiter.generation)  # pParameter, handed back to lpReady
+    )
+    assert_pico_ok(status['runBlock'])
+
+    return time_indisposed_ms.value
+
+Readout = namedtuple('Readout', ['mode', 'ratio', 'n_samples', 'with_min'])
+
+def ratio_mode(mode):
+    '''
+    Method to get the PICO_RATIO_MODE value of a downsampling mode given by value or by
+    name, e.g. 'AGGREGATE' or 'PICO_RATIO_MODE_AGGREGATE'
+    '''
+
+    if isinstance(mode, str):
+        return enums.PICO_RATIO_MODE[mode if mode.startswith('PICO_RATIO_MODE_') else f'PICO_RATIO_MODE_{mode}']
+
+    return mode
+
+def block_readouts(n_samples, **kwargs):
+    '''
+    Method to get the readouts of a block capture of n_samples: the raw samples, or the
+    samples reduced in the scope with downsample_ratio_mode (aggregate, decimate or
+    average) and downsample_ratio, preceded by the raw samples if with_raw. They are all
+    transferred with a single call, aggregate needs a min and a max buffer.
+    '''
+
+    raw = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
+    downsample_ratio_mode = ratio_mode(kwargs.get('downsample_ratio_mode', None) or raw)
+    downsample_ratio = int(kwargs.get('downsample_ratio', None) or 1)
+
+    if downsample_ratio_mode == raw:
+        if downsample_ratio != 1:
+            raise ValueError(f'Raw readout with downsample_ratio {downsample_ratio}, a downsampling mode is needed')
+        return [Readout(raw, 1, n_samples, False)]
+
+    aggregate = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_AGGREGATE']
+    if downsample_ratio_mode not in (aggregate, enums.PICO_RATIO_MODE['PICO_RATIO_MODE_DECIMATE'], enums.PICO_RATIO_MODE['PICO_RATIO_MODE_AVERAGE']):
+        raise ValueError(f'Downsampling mode {downsample_ratio_mode} not supported')
+    if downsample_ratio < 1:
+        raise ValueError(f'Downsample ratio must be positive, got {downsample_ratio}')
+
+    # the last bin is partially filled if the ratio does not divide the number of samples
+    readouts = [Readout(downsample_ratio_mode, downsample_ratio, -(-n_samples // downsample_ratio), downsample_ratio_mode == aggregate)]
+    if kwargs.get('with_raw', False):
+        readouts.insert(0, Readout(raw, 1, n_samples, False))
+
+    return readouts
+
+def downsampled_times(times, readout):
+    '''
+    Method to get the time axes of a readout from the ones of the raw samples. Decimated
+    values are the first sample of their bin, aggregated and averaged ones are placed at
+    the centre of the bin.
+    '''
+
+    if readout.ratio == 1:
+        return times
+
+    shift = 0. if readout.mode == enums.PICO_RATIO_MODE['PICO_RATIO_MODE_DECIMATE'] else 0.5 * (readout.ratio - 1) * times.dt
+    if isinstance(times, SegmentedTimeAxis):
+        return SegmentedTimeAxis(times.t0s + shift, times.dt * readout.ratio, readout.n_samples, times.trigger_info)
+
+    return TimeAxis(times.t0 + shift, times.dt * readout.ratio, readout.n_samples)
+
+def combined_ratio_mode(readouts):
+    '''
+    Method to get the ratio mode and the ratio transferring all readouts in a single call
+    '''
+
+    if not readouts:
+        return enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW'], 1
+
+    downsample_ratio_mode = 0
+    for readout in readouts:
+        downsample_ratio_mode |= readout.mode
+
+    return downsample_ratio_mode, max(readout.ratio for readout in readouts)
+
+def set_block_buffers(status, handle, sources, buffer_max, buffer_min = None, **kwargs):
+    '''
+    Method to register a (channels, segments, samples) int16 array with the driver, one
+    pointer per channel and segment. The min buffer is only needed by the downsampling
+    modes that return two values per bin (aggregate) and is left out otherwise. With
+    clear = False the buffers registered before, e.g. for another mode, are kept.
+    '''
+
+    data_type = enums.PICO_DATA_TYPE['PICO_INT16_T']
+    downsample_ratio_mode = kwargs.get('downsample_ratio_mode', enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW'])
+    clear = enums.PICO_ACTION['PICO_CLEAR_ALL'] if kwargs.get('clear', True) else 0
+    add = enums.PICO_ACTION['PICO_ADD']
+
+    int16_ptr = ctypes.POINTER(ctypes.c_int16)
+    for channel_ind, source_handle in enumerate(sources.values()):
+        for segment_ind in range(buffer_max.shape[1]):
+            status['setDataBuffers'] = ps.ps6000aSetDataBuffers(
+                handle,
+                source_handle,
+                buffer_max[channel_ind, segment_ind].ctypes.data_as(int16_ptr),
+                None if buffer_min is None else buffer_min[channel_ind, segment_ind].ctypes.data_as(int16_ptr),
+                buffer_max.shape[2],
+                data_type,
+                segment_ind,  # waveform
+                downsample_ratio_mode,
+                clear|add if channel_ind + segment_ind == 0 else add
+            )
+            assert_pico_ok(status['setDataBuffers'])
+
+def allocate_readout_buffers(sources, number_segments, readouts):
+    '''
+    Method to allocate the (channels, segments, samples) max and min (None if not needed)
+    buffers of every readout
+    '''
+
+    buffers = []
+    for readout in readouts:
+        shape = (len(sources), number_segments, readout.n_samples)
+        buffers.append((np.empty(shape, dtype=np.int16), np.empty(shape, dtype=np.int16) if readout.with_min else None))
+
+    return buffers
+
+def set_readout_buffers(status, handle, sources, readouts, buffers):
+    '''
+    Method to register the buffers of all readouts of a block capture with the driver
+    '''
+
+    for i_readout, (readout, (buffer_max, buffer_min)) in enumerate(zip(readouts, buffers)):
+        set_block_buffers(status, handle, sources, buffer_max, buffer_min, downsample_ratio_mode=readout.mode, clear=i_readout == 0)
+
+class BufferPool:
+    '''
+    Data buffers that stay registered with the driver across captures, keyed by (sources,
+    segments, readouts). get_readouts() hands out the (channels, segments, samples) int16
+    max and min buffers of every readout (get() those of a single one) and calls
+    ps6000aSetDataBuffers only when the buffers registered with the driver are different
+    ones, so repeated captures with the same settings need no setup at all. Ownership rules:
+      - the pool owns the buffers, arrays handed out are overwritten by the next capture with
+        the same key, callers that keep raw data longer must copy it
+      - at most max_buffers keys are kept, the least recently used one is dropped
+      - anything else that registers buffers (streaming, caller-supplied buffers) or may
+        drop the registrations (e.g. a resolution change) must call invalidate()
+    '''
+
+    def __init__(self, max_buffers = 4):
+
+        self.max_buffers = max_buffers
+        self.buffers = OrderedDict()
+        self.registered = None
+        self.n_registrations = 0
+        self.n_reuses = 0
+
+    def get(self, status, handle, sources, number_segments, n_samples, **kwargs):
+
+        downsample_ratio_mode = kwargs.get('downsample_ratio_mode', enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW'])
+        readout = Readout(downsample_ratio_mode, 1, n_samples, kwargs.get('with_min', False))
+
+        return self.get_readouts(status, handle, sources, number_segments, [readout])[0]
+
+    def get_readouts(self, status, handle, sources, number_segments, readouts):
 
+        key = (tuple(sources.items()), number_segments, tuple(readouts))
+
+        if key in self.buffers:
+            self.buffers.move_to_end(key)
+        else:
+            self.buffers[key] = allocate_readout_buffers(sources, number_segments, readouts)
+            if len(self.buffers) > self.max_buffers:
+                self.buffers.popitem(last=False)
+        buffers = self.buffers[key]
+
+        if self.registered == key:
+            self.n_reuses += 1
+        else:
+            set_readout_buffers(status, handle, sources, readouts, buffers)
+            self.registered = key
+            self.n_registrations += 1
+
+        return buffers
+
+    def invalidate(self):
+
+        self.registered = None
+
+def _block_buffer(status, handle, sources, number_segments, n_samples, **kwargs):
+    '''
+    Method to get the registered buffer of a block capture: the caller-supplied one, one from
+    the buffer pool or a newly allocated one
+    '''
+
+    buffer_shape = (len(sources), number_segments, n_samples)
+    buffer = kwargs.get('buffer', None)
+    buffer_pool = kwargs.get('buffer_pool', None)
+    if buffer is None and buffer_pool is not None:
+        buffer, _ = buffer_pool.get(status, handle, sources, number_segments, n_samples)
+        return buffer
+
+    if buffer is None:
+        buffer = np.empty(buffer_shape, dtype=np.int16)
+    elif buffer.shape != buffer_shape or buffer.dtype != np.int16 or not buffer.flags.c_contiguous:
+        raise ValueError(f'Buffer must be a contiguous int16 array of shape {buffer_shape}')
+    set_block_buffers(status, handle, sources, buffer)
+    if buffer_pool is not None:
+        buffer_pool.invalidate()
+
+    return buffer
+
+def _block_buffers(status, handle, sources, number_segments, readouts, **kwargs):
+    '''
+    Method to get the registered (max, min) buffers of all readouts of a block capture, a
+    caller-supplied buffer is only possible for a plain raw readout
+    '''
+
+    if len(readouts) == 1 and readouts[0].mode == enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']:
+        return [(_block_buffer(status, handle, sources, number_segments, readouts[0].n_samples, **kwargs), None)]
+    if kwargs.get('buffer', None) is not None:
+        raise ValueError('A caller-supplied buffer can only be used for raw readouts')
+
+    buffer_pool = kwargs.get('buffer_pool', None)
+    if buffer_pool is not None:
+        return buffer_pool.get_readouts(status, handle, sources, number_segments, readouts)
+
+    buffers = allocate_readout_buffers(sources, number_segments, readouts)
+    set_readout_buffers(status, handle, sources, readouts, buffers)
+
+    return buffers
+
+RapidBlockSetup = namedtuple('RapidBlockSetup', ['timebase', 'sample_interval_ns', 'n_pretrigger_samples', 'n_posttrigger_samples', 'n_samples', 'max_samples'])
+
+TimebaseSolution = namedtuple('TimebaseSolution', ['timebase', 'sample_interval_ns', 'max_samples'])
+
+def nearest_timebase(status, handle, resolution, sources, sample_interval_ns, **kwargs):
+    '''
+    Method to get the timebase closest to the demanded sample interval and the interval in ns
+    it gives, a negative interval selects the fastest timebase of the enabled channels. The
+    driver is asked without touching the device configuration, the answers are memoized per
+    (channel flags, resolution, demanded interval) in the device_state given.
+    '''
+
+    device_state = kwargs.get('device_state', None)
+    enabled_channel_flags = sum([enums.PICO_CHANNEL_FLAGS[f'PICO_CHANNEL_{channel_name}_FLAGS'] for channel_name in sources.keys()])
+    key = (enabled_channel_flags, resolution, float(sample_interval_ns))
+    if device_state is not None and key in device_state['timebases']:
+        return device_state['timebases'][key]
+
+    timebase = ctypes.c_uint32(0)
+    sample_interval_s = ctypes.c_double(0)
+    if sample_interval_ns < 0:
         # use the fastest available timebase
-        enabled_channel_flags = sum([enums.PICO_CHANNEL_FLAGS[f'PICO_CHANNEL_{channel_name}_FLAGS'] for channel_name in sources.keys()])
         status['getMinimumTimebaseStateless'] = ps.ps6000aGetMinimumTimebaseStateless(
             handle,
             enabled_channel_flags,
@@ -379,98 +1012,200 @@ def read_channel_rapidblock(status, handle, resolution, sources, source_ranges,
             ctypes.byref(sample_interval_s),
             resolution
         )
-        
-        timebase = timebase.value
-        sample_interval_ns = sample_interval_s.value * 1e9
+        assert_pico_ok(status['getMinimumTimebaseStateless'])
+        result = (timebase.value, sample_interval_s.value * 1e9)
     else:
-        # pick the timebase that's closest to the demanded value
-        timebase = sample_interval_ns2timebase(sample_interval_ns)
-        sample_interval_ns = timebase2sample_interval_ns(timebase)
+        # older drivers lack the stateless query, fall back to the timebase formulas then
+        status['nearestSampleIntervalStateless'] = PICO_STATUS['PICO_NOT_SUPPORTED_BY_THIS_DEVICE']
+        if hasattr(ps, 'ps6000aNearestSampleIntervalStateless'):
+            status['nearestSampleIntervalStateless'] = ps.ps6000aNearestSampleIntervalStateless(
+                handle,
+                enabled_channel_flags,
+                sample_interval_ns * 1e-9,
+                resolution,
+                ctypes.byref(timebase),
+                ctypes.byref(sample_interval_s)
+            )
+        if status['nearestSampleIntervalStateless'] == PICO_STATUS['PICO_OK']:
+            result = (timebase.value, sample_interval_s.value * 1e9)
+        else:
+            fallback_timebase = sample_interval_ns2timebase(sample_interval_ns)
+            result = (fallback_timebase, timebase2sample_interval_ns(fallback_timebase))
 
-    acq_window_ns = kwargs.get('acq_window_ns', 100)
-    n_pretrigger_samples = int(acq_window_ns / sample_interval_ns / 2)
-    n_posttrigger_samples = n_pretrigger_samples
-        
-    # set number of samples to be collected
-    n_samples = n_pretrigger_samples + n_posttrigger_samples
+    if device_state is not None:
+        device_state['timebases'][key] = result
+
+    return result
+
+def solve_timebase(status, handle, resolution, sources, sample_interval_ns, n_samples = 0, **kwargs):
+    '''
+    Method to get the timebase for the demanded sample interval together with the actual
+    sample interval in ns and the max number of samples per segment with the current
+    memory segmentation, so the device memory has to be segmented before. The interval is
+    the one reported by the device for the timebase. Raises a ValueError if n_samples do
+    not fit into a segment or, if max_interval_deviation is given, if the actual interval
+    deviates by more than this fraction from the demanded one.
+    '''
+
+    device_state = kwargs.get('device_state', None)
+    max_interval_deviation = kwargs.get('max_interval_deviation', None)
+
+    timebase, _ = nearest_timebase(status, handle, resolution, sources, sample_interval_ns, device_state=device_state)
+
+    enabled_channel_flags = sum([enums.PICO_CHANNEL_FLAGS[f'PICO_CHANNEL_{channel_name}_FLAGS'] for channel_name in sources.keys()])
+    number_segments = device_state['memory_segments'][0] if device_state is not None and device_state['memory_segments'] else None
+    key = (timebase, enabled_channel_flags, resolution, number_segments)
+    if device_state is not None and number_segments is not None and key in device_state['max_samples']:
+        solution = device_state['max_samples'][key]
+    else:
+        sample_interval = ctypes.c_double(0)
+        max_samples = ctypes.c_uint64(0)
+        status['getTimebase'] = ps.ps6000aGetTimebase(
+            handle,
+            timebase,
+            n_samples,
+            ctypes.byref(sample_interval),
+            ctypes.byref(max_samples),
+            0  # segmentIndex
+        )
+        assert_pico_ok(status['getTimebase'])
+        solution = TimebaseSolution(timebase, sample_interval.value, max_samples.value)
+        if device_state is not None and number_segments is not None:
+            device_state['max_samples'][key] = solution
+
+    if n_samples > solution.max_samples:
+        raise ValueError(f'{n_samples} samples do not fit into a segment, at most {solution.max_samples} are available')
+    if max_interval_deviation is not None and sample_interval_ns >= 0 \
+            and abs(solution.sample_interval_ns - sample_interval_ns) > max_interval_deviation * sample_interval_ns:
+        raise ValueError(f'Sample interval of {sample_interval_ns} ns not available, nearest is {solution.sample_interval_ns} ns')
+
+    return solution
+
+def set_memory_segments(status, handle, number_segments, **kwargs):
+    '''
+    Method to split the device memory into the given number of segments and to capture as
+    many segments per run. Returns the max number of samples per segment. Registered data
+    buffers do not survive a new segmentation, so the buffer_pool given is invalidated.
+    '''
+
+    device_state = kwargs.get('device_state', None)
+    if device_state is not None and device_state['memory_segments'] is not None \
+            and device_state['memory_segments'][0] == number_segments and device_state['n_captures'] == number_segments:
+        return device_state['memory_segments'][1]
+
+    if device_state is not None:
+        device_state['memory_segments'] = None
+        device_state['n_captures'] = None
+    if kwargs.get('buffer_pool', None) is not None:
+        kwargs['buffer_pool'].invalidate()
 
     # set number of memory segments
     max_samples = ctypes.c_uint64(0)
     status['memorySegments'] = ps.ps6000aMemorySegments(handle, number_segments, ctypes.byref(max_samples))
+    assert_pico_ok(status['memorySegments'])
 
     status['noCaptures'] = ps.ps6000aSetNoOfCaptures(handle, number_segments)
     assert_pico_ok(status['noCaptures'])
 
-    # create buffers for all channels and segments
-    buffer_min = {}
-    buffer_max = {}
+    if device_state is not None:
+        device_state['memory_segments'] = (number_segments, max_samples.value)
+        device_state['n_captures'] = number_segments
 
-    for channel_ind, (source_name, source_handle) in enumerate(sources.items()):
+    return max_samples.value
 
-        channel_buffers_max = []
-        channel_buffers_min = []
+def setup_rapidblock(status, handle, resolution, sources, sample_interval_ns, number_segments, **kwargs):
+    '''
+    Method to pick the timebase and acquisition window of a rapidBlock capture and to split
+    the device memory into the given number of segments
+    '''
 
-        for segment_ind in range(number_segments):
-            cur_channel_buffer_max = (ctypes.c_int16 * n_samples)()
-            cur_channel_buffer_min = (ctypes.c_int16 * n_samples)()
+    device_state = kwargs.get('device_state', None)
+    _, nearest_interval_ns = nearest_timebase(status, handle, resolution, sources, sample_interval_ns, device_state=device_state)
 
-            # set data buffers
-            data_type = enums.PICO_DATA_TYPE['PICO_INT16_T']
-            waveform = segment_ind
-            downsample_ratio_mode = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
-            clear = enums.PICO_ACTION['PICO_CLEAR_ALL']
-            add = enums.PICO_ACTION['PICO_ADD']
-            action = clear|add if channel_ind + segment_ind == 0 else add
-            status['setDataBuffers'] = ps.ps6000aSetDataBuffers(
-                handle,
-                source_handle,
-                ctypes.byref(cur_channel_buffer_max),
-                ctypes.byref(cur_channel_buffer_min),
-                n_samples,
-                data_type,
-                waveform,
-                downsample_ratio_mode,
-                action
-            )
-            assert_pico_ok(status['setDataBuffers'])
+    acq_window_ns = kwargs.get('acq_window_ns', 100)
+    n_pretrigger_samples = int(acq_window_ns / nearest_interval_ns / 2)
+    n_posttrigger_samples = n_pretrigger_samples
 
-            channel_buffers_max.append(cur_channel_buffer_max)
-            channel_buffers_min.append(cur_channel_buffer_min)
-    
-        buffer_min[source_name] = channel_buffers_min
-        buffer_max[source_name] = channel_buffers_max
+    # set number of samples to be collected
+    n_samples = n_pretrigger_samples + n_posttrigger_samples
 
-    # run block capture
-    time_indisposed_ms = ctypes.c_double(0)
-    status['runBlock'] = ps.ps6000aRunBlock(
-        handle,
-        n_pretrigger_samples,
-        n_posttrigger_samples,
-        timebase,
-        ctypes.byref(time_indisposed_ms),
-        0,  # segmentIndex
-        None,  # lpReady = None   Using IsReady rather than a callback
-        None  # pParameter
-    )
-    assert_pico_ok(status['runBlock'])
+    set_memory_segments(status, handle, number_segments, device_state=device_state, buffer_pool=kwargs.get('buffer_pool', None))
+    solution = solve_timebase(status, handle, resolution, sources, sample_interval_ns, n_samples, device_state=device_state,
+                              max_interval_deviation=kwargs.get('max_interval_deviation', None))
+
+    return RapidBlockSetup(solution.timebase, solution.sample_interval_ns, n_pretrigger_samples, n_posttrigger_samples, n_samples, solution.max_samples)
+
+def max_rapidblock_segments(status, handle, resolution, sources, sample_interval_ns, n_samples, **kwargs):
+    '''
+    Method to find the largest number of segments of n_samples per channel (at most
+    max_segments) that fit into the device memory with the given sources enabled. The memory
+    of a single segment gives a first guess, which is lowered with the max samples per segment
+    reported for it until the segments fit. The memory is left split into the returned number
+    of segments.
+    '''
+
+    device_state = kwargs.get('device_state', None)
+    buffer_pool = kwargs.get('buffer_pool', None)
+    max_segments = kwargs.get('max_segments', None)
+    too_many_segments = (PICO_STATUS['PICO_TOO_MANY_SEGMENTS'], PICO_STATUS['PICO_CAPTURES_EXCEEDS_NO_OF_SUPPORTED_SEGMENTS'])
+
+    memory_samples = set_memory_segments(status, handle, 1, device_state=device_state, buffer_pool=buffer_pool)
+    number_segments = max(1, memory_samples // (n_samples * len(sources)))
+    if max_segments is not None:
+        number_segments = max(1, min(number_segments, max_segments))
+
+    while number_segments > 1:
+        status['memorySegments'] = status['noCaptures'] = PICO_STATUS['PICO_OK']
+        try:
+            set_memory_segments(status, handle, number_segments, device_state=device_state, buffer_pool=buffer_pool)
+        except PicoSDKCtypesError:
+            # more segments than the device supports
+            if status['memorySegments'] not in too_many_segments and status['noCaptures'] not in too_many_segments:
+                raise
+            number_segments //= 2
+            continue
+
+        max_samples = solve_timebase(status, handle, resolution, sources, sample_interval_ns, device_state=device_state).max_samples
+        if n_samples <= max_samples:
+            break
+        number_segments = max(1, min(number_segments - 1, number_segments * max_samples // n_samples))
 
-    # check for data collection to finish using ps6000aIsReady
-    ready = ctypes.c_int16(0)
-    check = ctypes.c_int16(0)
-    while ready.value == check.value:
-        status['isReady'] = ps.ps6000aIsReady(handle, ctypes.byref(ready))
+    if number_segments == 1:
+        set_memory_segments(status, handle, 1, device_state=device_state, buffer_pool=buffer_pool)
+
+    return number_segments
+
+def get_no_of_captures(status, handle):
+    '''
+    Method to get the number of segments captured so far by the running or last rapidBlock capture
+    '''
+
+    n_captures = ctypes.c_uint64(0)
+    status['getNoOfCaptures'] = ps.ps6000aGetNoOfCaptures(handle, ctypes.byref(n_captures))
+    assert_pico_ok(status['getNoOfCaptures'])
+
+    return n_captures.value
+
+def readout_rapidblock(status, handle, number_segments, n_samples, sample_interval_ns, **kwargs):
+    '''
+    Method to transfer all segments of a finished rapidBlock capture into the registered
+    buffers and to decode their trigger information. Returns the overflow flags of every
+    segment and the time axes of the raw samples of the segments. All readouts given
+    (the raw samples by default) are transferred at once.
+    '''
 
     # get data from scope
+    downsample_ratio_mode, downsample_ratio = combined_ratio_mode(kwargs.get('readouts', None))
     n_of_samples = ctypes.c_uint64(n_samples)
-    overflow = (ctypes.c_int16 * number_segments)() # voltage overflow flags for each segment
+    overflow = np.zeros(number_segments, dtype=np.int16) # voltage overflow flags for each segment
     status['getValues'] = ps.ps6000aGetValuesBulk(handle, 
                                                   0,  # startIndex
                                                   ctypes.byref(n_of_samples),
                                                   0,  # fromSegmentIndex
                                                   number_segments - 1,  # toSegmentIndex
-                                                  1,   # downSampleRatio
+                                                  downsample_ratio,
                                                   downsample_ratio_mode,
-                                                  ctypes.byref(overflow)
+                                                  overflow.ctypes.data_as(ctypes.POINTER(ctypes.c_int16))
     )
     assert_pico_ok(status['getValues'])
 
@@ -483,24 +1218,19 @@ def read_channel_rapidblock(status, handle, resolution, sources, source_ranges,
     )
     assert_pico_ok(status['triggerInfo'])
     
-    trigger_time_offsets_ns = []
-    for cur_segment in range(number_segments):
+    trigger_info = decode_trigger_infos(trigger_infos, PICO_STATUS['PICO_DEVICE_TIME_STAMP_RESET'])
+    trigger_time_offsets_ns = sample_interval_ns * trigger_info.offsets
 
-        cur_trigger = trigger_infos[cur_segment]
-        first_trigger = trigger_infos[0]
+    return overflow, SegmentedTimeAxis(trigger_time_offsets_ns, sample_interval_ns, n_samples, trigger_info)
 
-        cur_timestamp = cur_trigger.timeStampCounter
-        if cur_trigger.status == PICO_STATUS["PICO_DEVICE_TIME_STAMP_RESET"]:
-            cur_timestamp += 2e64
-
-        first_timestamp = first_trigger.timeStampCounter
-        if first_trigger.status == PICO_STATUS["PICO_DEVICE_TIME_STAMP_RESET"]:
-            first_timestamp += 2e64
+def get_max_adc(status, handle, resolution, device_state = None):
+    '''
+    Method to get the maximum ADC count of the given resolution
+    '''
 
-        cur_offset = sample_interval_ns * (cur_timestamp - first_timestamp)
-        trigger_time_offsets_ns.append(cur_offset)
+    if device_state is not None and resolution in device_state['adc_limits']:
+        return ctypes.c_int16(device_state['adc_limits'][resolution])
 
-    # get max ADC value
     min_ADC = ctypes.c_int16()
     max_ADC = ctypes.c_int16()
     status['getAdcLimits'] = ps.ps6000aGetAdcLimits(
@@ -511,24 +1241,251 @@ def read_channel_rapidblock(status, handle, resolution, sources, source_ranges,
     )
     assert_pico_ok(status['getAdcLimits'])
 
-    # convert ADC counts data to mV
-    waveform_mV = {}
-
-    for source_name in sources.keys():
-        cur_source_range = source_ranges[source_name]
-        cur_channel_range = PICO_CONNECT_PROBE_RANGE[cur_source_range]
-        
-        channel_segments_mV = []
-        for segment_ind in range(number_segments):
-            cur_segment_mV = adc2mV(buffer_max[source_name][segment_ind], cur_channel_range, max_ADC)
-            channel_segments_mV.append(cur_segment_mV)
-            
-        waveform_mV[source_name] = channel_segments_mV
+    if device_state is not None:
+        device_state['adc_limits'][resolution] = max_ADC.value
 
-    # create time data
-    times = [np.linspace(0, (n_samples - 1) * sample_interval_ns, n_samples) + offset for offset in trigger_time_offsets_ns]
+    return max_ADC
+
+def rapidblock_to_mV(buffer, sources, source_ranges, max_ADC, **kwargs):
+    '''
+    Method to convert a (channels, segments, samples) buffer to a dict of (segments, samples) arrays in mV
+    '''
+
+    scale_factors, offsets_mV = conversion_factors(sources, source_ranges, max_ADC, kwargs.get('source_offsets'))
+    buffer_mV = adc2mV_block(buffer, scale_factors, offsets_mV, out=kwargs.get('out'), dtype=kwargs.get('dtype', np.float64))
+
+    return {source_name: buffer_mV[channel_ind] for channel_ind, source_name in enumerate(sources.keys())}
+
+def _readout_results(buffers, times, readouts, sources, source_ranges, max_ADC, **kwargs):
+    '''
+    Method to build the (data, times) of the readouts of a block capture, the registered
+    ADC count buffers if raw and dicts of mV arrays otherwise, with the aggregated min
+    values under '<channel>_min'. The downsampled data come first, followed by the raw
+    samples if both were read. A single segment is selected with segment.
+    '''
 
-    return waveform_mV, times
+    segment = kwargs.get('segment', None)
+    results = ()
+    for readout, (buffer_max, buffer_min) in zip(readouts, buffers):
+        if segment is not None:
+            buffer_max = buffer_max[:, segment]
+            buffer_min = None if buffer_min is None else buffer_min[:, segment]
+
+        if kwargs.get('raw', False):
+            data = buffer_max if buffer_min is None else (buffer_max, buffer_min)
+        else:
+            # the output array can only take a single readout
+            out = kwargs.get('out') if len(readouts) == 1 and buffer_min is None else None
+            data = rapidblock_to_mV(buffer_max, sources, source_ranges, max_ADC, source_offsets=kwargs.get('source_offsets'),
+                                    out=out, dtype=kwargs.get('dtype', np.float64))
+            if buffer_min is not None:
+                data_min = rapidblock_to_mV(buffer_min, sources, source_ranges, max_ADC, source_offsets=kwargs.get('source_offsets'),
+                                            dtype=kwargs.get('dtype', np.float64))
+                data.update({f'{source_name}_min': values for source_name, values in data_min.items()})
+
+        results = (data, downsampled_times(times, readout)) + results
+
+    return results
+
+def _capture_block(buffers, times, readouts, overflow, sources, source_ranges, max_ADC, n_pretrigger_samples, **kwargs):
+    '''
+    Method to wrap the registered buffer of a block capture into a CaptureBlock without a
+    copy, it takes a single readout without aggregated min values
+    '''
+
+    if len(readouts) != 1 or readouts[0].with_min:
+        raise NotImplementedError('A CaptureBlock holds a single readout without aggregated min values')
+
+    readout = readouts[0]
+    times = downsampled_times(times, readout)
+    scale_factors, offsets_mV = conversion_factors(sources, source_ranges, max_ADC, kwargs.get('source_offsets'))
+
+    return CaptureBlock(buffers[0][0], list(sources), scale_factors, times.dt, offsets_mV=offsets_mV,
+                        n_pretrigger_samples=n_pretrigger_samples // readout.ratio,
+                        t0s=times.t0s if isinstance(times, SegmentedTimeAxis) else [times.t0], overflow=overflow,
+                        channel_ranges=[source_ranges[source_name] for source_name in sources],
+                        max_adc=getattr(max_ADC, 'value', max_ADC), trigger_info=getattr(times, 'trigger_info', None))
+
+def read_channel_rapidblock(status, handle, resolution, sources, source_ranges, sample_interval_ns, number_segments, **kwargs):
+
+    with driver_stats.phase('setup'):
+        setup = setup_rapidblock(status, handle, resolution, sources, sample_interval_ns, number_segments, **kwargs)
+
+        # one contiguous buffer per readout for all channels and segments, the driver writes straight into them
+        readouts = block_readouts(setup.n_samples, **kwargs)
+        buffers = _block_buffers(status, handle, sources, number_segments, readouts, **kwargs)
+
+    # run block capture and wait for it to finish
+    waiter = kwargs.get('waiter', None) or BlockWaiter()
+    with driver_stats.phase('arm'):
+        run_block(status, handle, setup.n_pretrigger_samples, setup.n_posttrigger_samples, setup.timebase, waiter)
+    with driver_stats.phase('wait'):
+        waiter.wait(kwargs.get('timeout_s', None))
+
+    with driver_stats.phase('transfer'):
+        overflow, times = readout_rapidblock(status, handle, number_segments, setup.n_samples, setup.sample_interval_ns, readouts=readouts)
+    if kwargs.get('accounting', None) is not None:
+        kwargs['accounting'].update(times, waiter.armed_at, waiter.ready_at)
+
+    if kwargs.get('as_block', False):
+        return _capture_block(buffers, times, readouts, overflow, sources, source_ranges,
+                              get_max_adc(status, handle, resolution, device_state = kwargs.get('device_state', None)),
+                              setup.n_pretrigger_samples, source_offsets=kwargs.get('source_offsets'))
+
+    # (channels, segments, samples) ADC counts without copy if raw, (segments, samples) mV per channel otherwise
+    with driver_stats.phase('convert'):
+        max_ADC = None if kwargs.get('raw', False) else get_max_adc(status, handle, resolution, device_state = kwargs.get('device_state', None))
+
+        return _readout_results(buffers, times, readouts, sources, source_ranges, max_ADC, raw=kwargs.get('raw', False),
+                                source_offsets=kwargs.get('source_offsets'), out=kwargs.get('out'), dtype=kwargs.get('dtype', np.float64))
+
+def _convert_rapidblock(buffer, times, overflow, sources, source_ranges, max_ADC, **kwargs):
+
+    return rapidblock_to_mV(buffer, sources, source_ranges, max_ADC, **kwargs), times
+
+def read_channel_rapidblock_pipelined(status, handle, resolution, sources, source_ranges, sample_interval_ns, number_segments, **kwargs):
+    '''
+    Generator running back-to-back rapidBlock captures with little dead time. As soon as a
+    capture has been transferred the next one is armed; the transferred block is copied into
+    one of n_buffer_sets alternating buffer sets and processed by n_workers threads while the
+    scope is capturing. Every capture is processed by process(buffer, times, overflow), by
+    default the conversion to mV giving the same (waveform_mV, times) as read_channel_rapidblock,
+    and the results are yielded in capture order. process must not return views of the buffer
+    it gets, the set is reused n_buffer_sets captures later.
+    '''
+
+    n_captures = kwargs.get('n_captures', None)  # None: run until the generator is closed
+    n_buffer_sets = kwargs.get('n_buffer_sets', 2)
+    n_workers = kwargs.get('n_workers', 1)
+    timeout_s = kwargs.get('timeout_s', None)
+    waiter = kwargs.get('waiter', None) or BlockWaiter()
+    accounting = kwargs.get('accounting', None)
+
+    setup = setup_rapidblock(status, handle, resolution, sources, sample_interval_ns, number_segments, **kwargs)
+    if block_readouts(setup.n_samples, **kwargs) != [Readout(enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW'], 1, setup.n_samples, False)]:
+        raise NotImplementedError('Pipelined rapidBlock captures only read the raw samples')
+    max_ADC = get_max_adc(status, handle, resolution, device_state = kwargs.get('device_state', None))
+    process = kwargs.get('process', None)
+    if process is None:
+        process = functools.partial(_convert_rapidblock, sources=sources, source_ranges=source_ranges, max_ADC=max_ADC,
+                                    source_offsets=kwargs.get('source_offsets'), dtype=kwargs.get('dtype', np.float64))
+
+    # the driver always transfers into the same registered buffer, so it is registered only once
+    landing_buffer = _block_buffer(status, handle, sources, number_segments, setup.n_samples, buffer_pool=kwargs.get('buffer_pool'))
+    buffer_sets = np.empty((n_buffer_sets,) + landing_buffer.shape, dtype=np.int16)
+
+    pending = deque()  # processing of the previous captures, oldest first
+    executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix='rapidblock')
+    i_capture = 0
+    armed = True
+    run_block(status, handle, setup.n_pretrigger_samples, setup.n_posttrigger_samples, setup.timebase, waiter)
+    try:
+        while armed:
+            with driver_stats.phase('wait'):
+                waiter.wait(timeout_s)
+            with driver_stats.phase('transfer'):
+                overflow, times = readout_rapidblock(status, handle, number_segments, setup.n_samples, setup.sample_interval_ns)
+            if accounting is not None:
+                accounting.update(times, waiter.armed_at, waiter.ready_at)
+            i_capture += 1
+
+            # re-arm straight away, the next capture runs while this one is handled
+            armed = n_captures is None or i_capture < n_captures
+            if armed:
+                with driver_stats.phase('arm'):
+                    run_block(status, handle, setup.n_pretrigger_samples, setup.n_posttrigger_samples, setup.timebase, waiter)
+
+            # the buffer set used n_buffer_sets captures ago must be released before it is reused
+            if len(pending) == n_buffer_sets:
+                yield pending.popleft().result()
+            cur_set = buffer_sets[(i_capture - 1) % n_buffer_sets]
+            np.copyto(cur_set, landing_buffer)
+            pending.append(executor.submit(process, cur_set, times, overflow))
+
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if armed:
+            waiter.cancel()
+        executor.shutdown(wait=True)
+
+def read_channel_rapidblock_events(status, handle, resolution, sources, source_ranges, sample_interval_ns, n_events, **kwargs):
+    '''
+    Generator running rapidBlock captures until n_events segments are collected. Every capture
+    takes as many segments as fit into the device memory for the acquisition window, at most
+    max_segments and as many as fit into max_buffer_bytes of host buffers, and the last one
+    only the missing segments. A capture that is not complete after batch_timeout_s is stopped
+    and only its completed segments (ps6000aGetNoOfCaptures) are read, after max_empty_batches
+    captures in a row without any segment TimeoutError is raised. Yields the results of
+    every capture like read_channel_rapidblock, raw ADC counts are valid until the next one.
+    '''
+
+    batch_timeout_s = kwargs.get('batch_timeout_s', None)
+    max_empty_batches = kwargs.get('max_empty_batches', 3)
+    max_buffer_bytes = kwargs.get('max_buffer_bytes', 2**28)
+    device_state = kwargs.get('device_state', None)
+    waiter = kwargs.get('waiter', None) or BlockWaiter()
+
+    # same window as setup_rapidblock
+    _, nearest_interval_ns = nearest_timebase(status, handle, resolution, sources, sample_interval_ns, device_state=device_state)
+    n_samples = 2 * int(kwargs.get('acq_window_ns', 100) / nearest_interval_ns / 2)
+    readouts = block_readouts(n_samples, **kwargs)
+    segment_bytes = sum(len(sources) * readout.n_samples * (2 if readout.with_min else 1) for readout in readouts) * np.dtype(np.int16).itemsize
+    max_segments = min(n_events, max(1, max_buffer_bytes // segment_bytes))
+    if kwargs.get('max_segments', None) is not None:
+        max_segments = min(max_segments, kwargs['max_segments'])
+    with driver_stats.phase('setup'):
+        batch_segments = max_rapidblock_segments(status, handle, resolution, sources, sample_interval_ns, n_samples,
+                                                 max_segments=max_segments, device_state=device_state,
+                                                 buffer_pool=kwargs.get('buffer_pool', None))
+    max_ADC = None if kwargs.get('raw', False) else get_max_adc(status, handle, resolution, device_state = device_state)
+
+    n_collected = 0
+    n_empty_batches = 0
+    while n_collected < n_events:
+        number_segments = min(batch_segments, n_events - n_collected)
+        with driver_stats.phase('setup'):
+            setup = setup_rapidblock(status, handle, resolution, sources, sample_interval_ns, number_segments, **kwargs)
+            buffers = _block_buffers(status, handle, sources, number_segments, readouts, buffer_pool=kwargs.get('buffer_pool', None))
+
+        with driver_stats.phase('arm'):
+            run_block(status, handle, setup.n_pretrigger_samples, setup.n_posttrigger_samples, setup.timebase, waiter)
+        try:
+            with driver_stats.phase('wait'):
+                waiter.wait(batch_timeout_s)
+            n_completed = number_segments
+        except TimeoutError:
+            # the capture was stopped, the segments taken so far are kept
+            n_completed = get_no_of_captures(status, handle)
+        if n_completed == 0:
+            n_empty_batches += 1
+            if n_empty_batches >= max_empty_batches:
+                raise TimeoutError(f'No trigger in {n_empty_batches} captures of {batch_timeout_s} s, '
+                                   f'{n_collected} of {n_events} segments collected')
+            continue
+        n_empty_batches = 0
+
+        with driver_stats.phase('transfer'):
+            overflow, times = readout_rapidblock(status, handle, n_completed, setup.n_samples, setup.sample_interval_ns, readouts=readouts)
+        if kwargs.get('accounting', None) is not None:
+            kwargs['accounting'].update(times, waiter.armed_at, waiter.ready_at)
+        completed = [(buffer_max[:, :n_completed], None if buffer_min is None else buffer_min[:, :n_completed])
+                     for buffer_max, buffer_min in buffers]
+        n_collected += n_completed
+
+        if kwargs.get('as_block', False):
+            yield _capture_block(completed, times, readouts, overflow, sources, source_ranges,
+                                 get_max_adc(status, handle, resolution, device_state = device_state),
+                                 setup.n_pretrigger_samples, source_offsets=kwargs.get('source_offsets'))
+            continue
+
+        with driver_stats.phase('convert'):
+            results = _readout_results(completed, times, readouts, sources, source_ranges, max_ADC, raw=kwargs.get('raw', False),
+                                       source_offsets=kwargs.get('source_offsets'), dtype=kwargs.get('dtype', np.float64))
+        yield results
 
 def read_channel_runblock(status, handle, resolution, sources, source_ranges, sample_interval_ns, **kwargs):
     '''
@@ -537,125 +1494,72 @@ def read_channel_runblock(status, handle, resolution, sources, source_ranges, sa
 
     n_pretrigger_samples = kwargs.get('n_pretrigger_samples', 10000)
     n_posttrigger_samples = kwargs.get('n_posttrigger_samples', 90000)
+    device_state = kwargs.get('device_state', None)
 
-    if sample_interval_ns < 0:
-        timebase = ctypes.c_uint32(0)
-        sample_interval_s = ctypes.c_double(0)
-
-        # use the fastest available timebase
-        enabled_channel_flags = sum([enums.PICO_CHANNEL_FLAGS[f'PICO_CHANNEL_{channel_name}_FLAGS'] for channel_name in sources.keys()])
-        status['getMinimumTimebaseStateless'] = ps.ps6000aGetMinimumTimebaseStateless(
-            handle,
-            enabled_channel_flags,
-            ctypes.byref(timebase),
-            ctypes.byref(sample_interval_s),
-            resolution
-        )
-        
-        timebase = timebase.value
-        sample_interval_ns = sample_interval_s.value * 1e9
-    else:
-        # pick the timebase that's closest to the demanded value
-        timebase = sample_interval_ns2timebase(sample_interval_ns)
-        sample_interval_ns = timebase2sample_interval_ns(timebase)
-        
     # set number of samples to be collected
     n_samples = n_pretrigger_samples + n_posttrigger_samples
 
-    # Create buffers
-    buffer_min = {}
-    buffer_max = {}
+    with driver_stats.phase('setup'):
+        # a single capture in one segment, undoes a previous rapidBlock setup
+        set_memory_segments(status, handle, 1, device_state=device_state, buffer_pool=kwargs.get('buffer_pool', None))
+        timebase, sample_interval_ns, _ = solve_timebase(status, handle, resolution, sources, sample_interval_ns, n_samples, device_state=device_state,
+                                                         max_interval_deviation=kwargs.get('max_interval_deviation', None))
 
-    for ind, (source_name, source_handle) in enumerate(sources.items()):
-    
-        buffer_max[source_name] = (ctypes.c_int16 * n_samples)()
-        buffer_min[source_name] = (ctypes.c_int16 * n_samples)() # used for downsampling which isn't in the scope of this example
-
-        # set data buffers
-        data_type = enums.PICO_DATA_TYPE['PICO_INT16_T']
-        waveform = 0
-        downsample_ratio_mode = enums.PICO_RATIO_MODE['PICO_RATIO_MODE_RAW']
-        clear = enums.PICO_ACTION['PICO_CLEAR_ALL']
-        add = enums.PICO_ACTION['PICO_ADD']
-        action = clear|add if ind == 0 else add
-        status['setDataBuffers'] = ps.ps6000aSetDataBuffers(
-            handle,
-            source_handle,
-            ctypes.byref(buffer_max[source_name]),
-            ctypes.byref(buffer_min[source_name]),
-            n_samples,
-            data_type,
-            waveform,
-            downsample_ratio_mode,
-            action
-        )
-        assert_pico_ok(status['setDataBuffers'])
-    
-    # run block capture
-    time_indisposed_ms = ctypes.c_double(0)
-    status['runBlock'] = ps.ps6000aRunBlock(
-        handle,
-        n_pretrigger_samples,
-        n_posttrigger_samples,
-        timebase,
-        ctypes.byref(time_indisposed_ms),
-        0,  # segmentIndex
-        None,  # lpReady = None   Using IsReady rather than a callback
-        None  # pParameter
-    )
-    assert_pico_ok(status['runBlock'])
+        # one contiguous buffer per readout for all channels
+        readouts = block_readouts(n_samples, **kwargs)
+        buffers = _block_buffers(status, handle, sources, 1, readouts, buffer_pool=kwargs.get('buffer_pool'))
+        downsample_ratio_mode, downsample_ratio = combined_ratio_mode(readouts)
 
-    # check for data collection to finish using ps6000aIsReady
-    ready = ctypes.c_int16(0)
-    check = ctypes.c_int16(0)
-    while ready.value == check.value:
-        status['isReady'] = ps.ps6000aIsReady(handle, ctypes.byref(ready))
+    # run block capture and wait for it to finish
+    waiter = kwargs.get('waiter', None) or BlockWaiter()
+    with driver_stats.phase('arm'):
+        run_block(status, handle, n_pretrigger_samples, n_posttrigger_samples, timebase, waiter)
+    with driver_stats.phase('wait'):
+        waiter.wait(kwargs.get('timeout_s', None))
 
     # get data from scope
     n_of_samples = ctypes.c_uint64(n_samples)
     overflow = ctypes.c_int16(0)
-    status['getValues'] = ps.ps6000aGetValues(
-        handle,
-        0,  # startIndex
-        ctypes.byref(n_of_samples),
-        1,  # downSampleRatio
-        downsample_ratio_mode,
-        0,  # segmentIndex
-        ctypes.byref(overflow)
-    )
+    with driver_stats.phase('transfer'):
+        status['getValues'] = ps.ps6000aGetValues(
+            handle,
+            0,  # startIndex
+            ctypes.byref(n_of_samples),
+            downsample_ratio,
+            downsample_ratio_mode,
+            0,  # segmentIndex
+            ctypes.byref(overflow)
+        )
     assert_pico_ok(status['getValues'])
 
-    # get max ADC value
-    min_ADC = ctypes.c_int16()
-    max_ADC = ctypes.c_int16()
-    status['getAdcLimits'] = ps.ps6000aGetAdcLimits(
-        handle,
-        resolution,
-        ctypes.byref(min_ADC),
-        ctypes.byref(max_ADC)
-    )
-    assert_pico_ok(status['getAdcLimits'])
+    # create time data
+    time = TimeAxis(0, sample_interval_ns, n_samples)
 
-    # convert ADC counts data to mV
-    waveform_mV = {}
+    if kwargs.get('as_block', False):
+        return _capture_block(buffers, time, readouts, [overflow.value], sources, source_ranges,
+                              get_max_adc(status, handle, resolution, device_state = device_state),
+                              n_pretrigger_samples, source_offsets=kwargs.get('source_offsets'))
 
-    for source_name in sources.keys():
-        cur_source_range = source_ranges[source_name]
-        cur_channel_range = PICO_CONNECT_PROBE_RANGE[cur_source_range]
-        waveform_mV[source_name] = adc2mV_fast(buffer_max[source_name], cur_channel_range, max_ADC)
+    # (channels, samples) ADC counts without copy if raw, mV per channel otherwise
+    with driver_stats.phase('convert'):
+        max_ADC = None if kwargs.get('raw', False) else get_max_adc(status, handle, resolution, device_state = device_state)
 
-    # create time data
-    time = np.linspace(0, (n_samples - 1) * sample_interval_ns, n_samples)
+        return _readout_results(buffers, time, readouts, sources, source_ranges, max_ADC, segment=0, raw=kwargs.get('raw', False),
+                                source_offsets=kwargs.get('source_offsets'), out=kwargs.get('out'), dtype=kwargs.get('dtype', np.float64))
 
-    return waveform_mV, time
+def conversion_factors(sources, source_ranges, max_ADC, source_offsets = None):
+    '''
+    Method to get the per-channel mV per ADC count and analogue offsets in mV (None if
+    all offsets are zero) of the given sources, as needed by adc2mV_block
+    '''
 
-def adc2mV_fast(bufferADC, channel_range, maxADC):
+    scale_factors = adc_scale_factors([PICO_CONNECT_PROBE_RANGE[source_ranges[source_name]] for source_name in sources], max_ADC)
+    offsets_mV = None
+    if source_offsets:
+        offsets_mV = np.array([1.e+3 * source_offsets.get(source_name, 0.) for source_name in sources])
 
-    if not isinstance(bufferADC, np.ndarray):
-        bufferADC = np.array(bufferADC)
+    return scale_factors, offsets_mV
 
-    channelInputRanges = [10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000]
-    vRange = channelInputRanges[channel_range]
-    bufferV = (1.0 * bufferADC) * vRange / maxADC.value
+def adc2mV_fast(bufferADC, channel_range, maxADC):
 
-    return bufferV
+    return adc2mV_block(np.asarray(bufferADC)[np.newaxis], adc_scale_factors([channel_range], maxADC), dtype=np.float64)[0]
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+'''Vectorized synthesis of arbitrary waveforms for the AWG, one period of the output per buffer
+'''
+
+import numpy as np
+
+# AWG sample value of the positive end of the peak-to-peak range
+AWG_FULL_SCALE = 32767
+# the buffer length is passed to ps6000aSigGenWaveform as uint16
+AWG_MAX_SAMPLES = 2**16 - 1
+
+def _broadcast(*params):
+    '''
+    Method to add a sample axis to the parameters, so that arrays of parameters synthesize
+    one waveform each in a single pass
+    '''
+
+    return [np.asarray(param, dtype=np.float64)[..., np.newaxis] for param in params]
+
+def to_awg_buffer(waveform):
+    '''
+    Method to get the contiguous int16 AWG buffer of a waveform, floats in [-1, 1] (the
+    peak-to-peak range set on the AWG) are scaled to AWG_FULL_SCALE and clipped, int16
+    values are taken as they are
+    '''
+
+    waveform = np.asarray(waveform)
+    if waveform.ndim != 1 or not 1 < len(waveform) <= AWG_MAX_SAMPLES:
+        raise ValueError(f'AWG waveform must be 1D with 2 to {AWG_MAX_SAMPLES} samples, got shape {waveform.shape}')
+    if waveform.dtype == np.int16:
+        return np.ascontiguousarray(waveform)
+
+    buffer = np.multiply(waveform, AWG_FULL_SCALE, dtype=np.float64)
+    np.clip(buffer, -AWG_FULL_SCALE, AWG_FULL_SCALE, out=buffer)
+
+    return np.rint(buffer).astype(np.int16)
+
+def pulse(n_samples, start, width, rise_samples = 0., fall_samples = 0., amplitude = 1., baseline = 0.):
+    '''
+    Method to synthesize trapezoidal pulses, linear edges of rise_samples and fall_samples
+    around a flat top of width samples from start on. All but n_samples can be arrays, which
+    give an array of waveforms with the samples on the last axis.
+    '''
+
+    start, width, rise_samples, fall_samples, amplitude, baseline = _broadcast(start, width, rise_samples, fall_samples,
+                                                                               amplitude, baseline)
+    index = np.arange(n_samples, dtype=np.float64)
+
+    # 0 to 1 on the rising edge and 1 to 0 on the falling one, step edges for zero length
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rising = np.where(rise_samples > 0, (index - start + rise_samples) / rise_samples, np.where(index >= start, 1., 0.))
+        falling = np.where(fall_samples > 0, (start + width + fall_samples - index) / fall_samples,
+                           np.where(index < start + width, 1., 0.))
+    shape = np.clip(np.minimum(rising, falling), 0., 1.)
+
+    return baseline + amplitude * shape
+
+def exponential_pulse(n_samples, start, rise_samples, fall_samples, amplitude = 1., baseline = 0.):
+    '''
+    Method to synthesize detector-like pulses starting at start, the difference of two
+    exponentials with time constants rise_samples and fall_samples scaled to a peak of
+    amplitude. All but n_samples can be arrays, as for pulse.
+    '''
+
+    start, rise_samples, fall_samples, amplitude, baseline = _broadcast(start, rise_samples, fall_samples, amplitude, baseline)
+    if np.any(rise_samples <= 0) or np.any(fall_samples <= rise_samples):
+        raise ValueError('Exponential pulses need 0 < rise_samples < fall_samples')
+    time = np.maximum(np.arange(n_samples, dtype=np.float64) - start, 0.)
+
+    # peak of exp(-t / fall) - exp(-t / rise), analytic to normalise without a search
+    peak_time = np.log(fall_samples / rise_samples) * rise_samples * fall_samples / (fall_samples - rise_samples)
+    peak = np.exp(-peak_time / fall_samples) - np.exp(-peak_time / rise_samples)
+    shape = (np.exp(-time / fall_samples) - np.exp(-time / rise_samples)) / peak
+
+    return baseline + amplitude * shape
+
+def burst(n_samples, period, width, n_pulses = None, start = 0., rise_samples = 0., fall_samples = 0., amplitude = 1., baseline = 0.):
+    '''
+    Method to synthesize a burst of n_pulses trapezoidal pulses (all that fit if None) every
+    period samples from start on, the pulses are shaped as in pulse. All but n_samples and
+    n_pulses can be arrays.
+    '''
+
+    period, width, start, rise_samples, fall_samples, amplitude, baseline = _broadcast(period, width, start, rise_samples,
+                                                                                       fall_samples, amplitude, baseline)
+    # position within the period of every sample, the rising edge starts before the pulse
+    offset = np.arange(n_samples, dtype=np.float64) - start + rise_samples
+    i_pulse, phase = np.divmod(offset, period)
+    phase -= rise_samples
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rising = np.where(rise_samples > 0, (phase + rise_samples) / rise_samples, np.where(phase >= 0, 1., 0.))
+        falling = np.where(fall_samples > 0, (width + fall_samples - phase) / fall_samples, np.where(phase < width, 1., 0.))
+    shape = np.clip(np.minimum(rising, falling), 0., 1.)
+    shape[offset < 0] = 0.
+    if n_pulses is not None:
+        shape[i_pulse >= n_pulses] = 0.
+
+    return baseline + amplitude * shape
+
+def chirp(n_samples, start_cycles, stop_cycles, method = 'linear', amplitude = 1., phase = 0.):
+    '''
+    Method to synthesize sine chirps with an instantaneous frequency going from start_cycles
+    to stop_cycles per buffer, linearly or exponentially (method = 'exponential'). The AWG
+    plays the buffer at frequency_hz, so the frequencies in Hz are these times frequency_hz.
+    All but n_samples and method can be arrays.
+    '''
+
+    start_cycles, stop_cycles, amplitude, phase = _broadcast(start_cycles, stop_cycles, amplitude, phase)
+    time = np.arange(n_samples, dtype=np.float64) / n_samples
+
+    # integral of the instantaneous frequency over the buffer
+    if method == 'linear':
+        cycles = start_cycles * time + 0.5 * (stop_cycles - start_cycles) * time**2
+    elif method == 'exponential':
+        log_ratio = np.log(stop_cycles / start_cycles)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cycles = np.where(log_ratio != 0, start_cycles * np.expm1(log_ratio * time) / log_ratio, start_cycles * time)
+    else:
+        raise ValueError(f'Chirp method {method} unknown, use linear or exponential')
+
+    return amplitude * np.sin(2 * np.pi * cycles + phase)
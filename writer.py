@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+'''Chunked on-disk writer of raw ADC blocks, running on a background thread
+'''
+
+import json
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+from .capture import CaptureBlock
+
+FORMAT_VERSION = 1
+
+# queued by RawWriter.flush, the worker flushes the backend when it gets there
+_FLUSH = object()
+
+class _BinaryBackend:
+    '''
+    Raw int16 records appended to <path>.bin, the trigger time offsets of the segments as
+    float64 to <path>.t0.bin and the metadata to the JSON sidecar <path>.json
+    '''
+
+    def __init__(self, path, metadata):
+
+        self.path = path
+        self.metadata = metadata
+        self.data_file = open(f'{path}.bin', 'wb')
+        self.t0_file = open(f'{path}.t0.bin', 'wb')
+        self.write_metadata(0)
+
+    def append(self, records, t0s):
+
+        self.data_file.write(records.data)
+        self.t0_file.write(t0s.data)
+
+    def flush(self, n_segments):
+
+        self.data_file.flush()
+        self.t0_file.flush()
+        self.write_metadata(n_segments)
+
+    def write_metadata(self, n_segments):
+
+        # replace the sidecar atomically, a reader never sees a half written file
+        self.metadata['n_segments'] = n_segments
+        with open(f'{self.path}.json.tmp', 'w') as sidecar:
+            json.dump(self.metadata, sidecar, indent=2)
+        os.replace(f'{self.path}.json.tmp', f'{self.path}.json')
+
+    def close(self, n_segments):
+
+        self.data_file.close()
+        self.t0_file.close()
+        self.write_metadata(n_segments)
+
+class _HDF5Backend:
+    '''
+    Resizable datasets adc (segments, channels, samples) and t0 in <path>, chunked along the
+    segments, with the metadata in the file attributes
+    '''
+
+    def __init__(self, path, metadata, chunk_segments):
+
+        try:
+            import h5py
+        except ImportError as exc:
+            raise ImportError('Writing HDF5 files requires h5py') from exc
+
+        record_shape = tuple(metadata['record_shape'])
+        self.file = h5py.File(path, 'w')
+        self.adc = self.file.create_dataset('adc', shape=(0,) + record_shape, maxshape=(None,) + record_shape,
+                                            chunks=(chunk_segments,) + record_shape, dtype=np.int16)
+        self.t0 = self.file.create_dataset('t0', shape=(0,), maxshape=(None,), chunks=(chunk_segments,), dtype=np.float64)
+        self.file.attrs['metadata'] = json.dumps(metadata)
+        self.metadata = metadata
+
+    def append(self, records, t0s):
+
+        n_segments = self.adc.shape[0]
+        self.adc.resize(n_segments + len(records), axis=0)
+        self.adc[n_segments:] = records
+        self.t0.resize(n_segments + len(t0s), axis=0)
+        self.t0[n_segments:] = t0s
+
+    def flush(self, n_segments):
+
+        self.metadata['n_segments'] = n_segments
+        self.file.attrs['metadata'] = json.dumps(self.metadata)
+        self.file.flush()
+
+    def close(self, n_segments):
+
+        self.metadata['n_segments'] = n_segments
+        self.file.attrs['metadata'] = json.dumps(self.metadata)
+        self.file.close()
+
+class _ZarrBackend:
+    '''
+    Arrays adc (segments, channels, samples) and t0 in the Zarr group <path>, chunked along
+    the segments, with the metadata in the group attributes
+    '''
+
+    def __init__(self, path, metadata, chunk_segments):
+
+        try:
+            import zarr
+        except ImportError as exc:
+            raise ImportError('Writing Zarr stores requires zarr') from exc
+
+        record_shape = tuple(metadata['record_shape'])
+        self.group = zarr.open_group(path, mode='w')
+        self.adc = self.group.create_dataset('adc', shape=(0,) + record_shape, chunks=(chunk_segments,) + record_shape, dtype=np.int16)
+        self.t0 = self.group.create_dataset('t0', shape=(0,), chunks=(chunk_segments,), dtype=np.float64)
+        self.group.attrs['metadata'] = metadata
+        self.metadata = metadata
+
+    def append(self, records, t0s):
+
+        self.adc.append(records, axis=0)
+        self.t0.append(t0s, axis=0)
+
+    def flush(self, n_segments):
+
+        self.metadata['n_segments'] = n_segments
+        self.group.attrs['metadata'] = self.metadata
+
+    def close(self, n_segments):
+
+        self.metadata['n_segments'] = n_segments
+        self.group.attrs['metadata'] = self.metadata
+
+class RawWriter:
+    '''
+    Writer appending raw int16 ADC blocks to disk as they arrive. Blocks of shape
+    (channels, samples) or (channels, segments, samples), e.g. from raw rapidBlock reads,
+    are stored as records of shape (channels, samples) on a (segments, channels, samples)
+    array together with the trigger time offset of every segment and the metadata needed to
+    get back to mV and ns. write() copies the block and hands it to a background thread, at
+    most max_queue blocks are held in memory and write() blocks when the disk falls behind.
+    The format is 'binary' (raw file with a JSON sidecar), 'hdf5' (needs h5py) or 'zarr'
+    (needs zarr). Use as
+
+        with RawWriter('run', channels, scale_factors_mV, sample_interval_ns) as writer:
+            for buffer, times in ...:
+                writer.write(buffer, times)
+    '''
+
+    def __init__(self, path, channels, scale_factors_mV, sample_interval_ns, **kwargs):
+
+        self.path = path
+        self.file_format = kwargs.get('file_format', 'binary')
+        self.chunk_segments = kwargs.get('chunk_segments', 64)  # segments per HDF5/Zarr chunk
+        self.flush_interval_s = kwargs.get('flush_interval_s', 10.)
+
+        offsets_mV = kwargs.get('offsets_mV', None)
+        if offsets_mV is None:
+            offsets_mV = [0.] * len(channels)
+
+        self.metadata = {
+            'format_version': FORMAT_VERSION,
+            'dtype': 'int16',
+            'layout': ['segments', 'channels', 'samples'],
+            'record_shape': None,
+            'n_segments': 0,
+            'channels': list(channels),
+            'scale_factors_mV': [float(scale_factor) for scale_factor in scale_factors_mV],
+            'offsets_mV': [float(offset) for offset in offsets_mV],
+            'sample_interval_ns': float(sample_interval_ns),
+            'n_pretrigger_samples': kwargs.get('n_pretrigger_samples', None),  # None if not known
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'user': kwargs.get('metadata', {})
+        }
+
+        # the backend is opened with the first block, when the record shape is known
+        self.backend = None
+        self.queue = queue.Queue(maxsize=kwargs.get('max_queue', 8))
+        self.error = None
+        self.closed = False
+
+        # keep track of the amount of written data
+        self.n_blocks = 0
+        self.n_segments = 0
+        self.bytes_written = 0
+
+        self.thread = threading.Thread(target=self._run, name='raw-writer', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def write(self, block, times = None):
+        '''
+        Method to queue a block of ADC counts, times is the TimeAxis or SegmentedTimeAxis
+        of the block (or None) and gives the trigger time offsets of its segments. A
+        CaptureBlock brings its own times
+        '''
+
+        self._raise_error()
+        if self.closed:
+            raise ValueError('Write to a closed RawWriter')
+
+        if isinstance(block, CaptureBlock):
+            block, times = block.adc, block.times
+        block = np.asarray(block)
+        if block.dtype != np.int16:
+            raise ValueError(f'RawWriter stores int16 ADC counts, got {block.dtype}')
+        if block.ndim == 2:
+            block = block[:, np.newaxis]
+        if block.ndim != 3 or block.shape[0] != len(self.metadata['channels']):
+            raise ValueError(f'Block must have shape (channels, [segments,] samples) with {len(self.metadata["channels"])} channels')
+
+        record_shape = [block.shape[0], block.shape[2]]
+        if self.metadata['record_shape'] is None:
+            self.metadata['record_shape'] = record_shape
+        elif record_shape != self.metadata['record_shape']:
+            raise ValueError(f'Block records have shape {record_shape}, expected {self.metadata["record_shape"]}')
+
+        if times is None:
+            t0s = np.zeros(block.shape[1])
+        elif hasattr(times, 't0s'):
+            t0s = np.array(times.t0s, dtype=np.float64)
+        else:
+            t0s = np.full(block.shape[1], getattr(times, 't0', 0.), dtype=np.float64)
+
+        # the copy in the on-disk layout frees the caller's buffer straight away
+        records = np.ascontiguousarray(block.swapaxes(0, 1))
+        self.queue.put((records, t0s))
+
+    def flush(self):
+        '''
+        Method to wait until all queued blocks are on disk, with the files flushed and the
+        sidecar updated so that a RawReader opened afterwards sees them
+        '''
+
+        if self.closed:
+            return
+
+        self.queue.put(_FLUSH)
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+
+        if self.closed:
+            return
+
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _open_backend(self):
+
+        if self.file_format == 'binary':
+            return _BinaryBackend(self.path, self.metadata)
+        if self.file_format == 'hdf5':
+            return _HDF5Backend(self.path, self.metadata, self.chunk_segments)
+        if self.file_format == 'zarr':
+            return _ZarrBackend(self.path, self.metadata, self.chunk_segments)
+
+        raise NotImplementedError(f'File format {self.file_format} unknown!')
+
+    def _run(self):
+
+        last_flush = time.monotonic()
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    # nothing is written if no block arrived
+                    if self.backend is not None:
+                        self.backend.close(self.n_segments)
+                    return
+
+                # after an error the remaining blocks are dropped, the error is raised to the caller
+                if self.error is not None:
+                    continue
+
+                if item is _FLUSH:
+                    if self.backend is not None:
+                        self.backend.flush(self.n_segments)
+                        last_flush = time.monotonic()
+                    continue
+
+                records, t0s = item
+                if self.backend is None:
+                    self.backend = self._open_backend()
+                self.backend.append(records, t0s)
+                self.n_blocks += 1
+                self.n_segments += len(records)
+                self.bytes_written += records.nbytes
+
+                # keep the sidecar up to date, the file can be read during a long run
+                if time.monotonic() - last_flush > self.flush_interval_s:
+                    self.backend.flush(self.n_segments)
+                    last_flush = time.monotonic()
+            except Exception as exc:
+                self.error = exc
+            finally:
+                self.queue.task_done()